@@ -116,6 +116,10 @@ Run Mongod database:
                 >sudo lsof -iTCP -sTCP:LISTEN -n -P
                 >sudo kill ...
 
+                Without a mongod (e.g. for batch jobs), db can be kept in an
+                SQLite file in logal/raw-data/ instead:
+                >galaxies_db.storage_backend = 'sqlite'
+
 
 Todo:
     29.03.2020: Need to incorporate Jiao+17 data.
@@ -130,23 +134,46 @@ t.greve@ucl.ac.uk, 2017
 
 
 # --- Modules ---
-from importlib import reload
-import numpy as np
+# Only the standard library (and trgpy.config) is imported with this module.
+# numpy, pandas and pyarrow are imported on first use (see _LazyModule), and
+# astroquery, astropy, pymongo, trgpy.emg and concurrent.futures by the
+# functions that need them, so that lookups in db do not pay for the imports
+# of the build.
+from collections import OrderedDict
+import copy
+import hashlib
+import importlib
+import json
 import math
+import re
+import sqlite3
 import sys
+import threading
 import time
-import pandas as pd
-
-from astroquery.ned import Ned
-from astroquery.ned.core import RemoteServiceError
-from astropy.cosmology import FlatLambdaCDM, z_at_value
-from astropy import units as u
-from pymongo import MongoClient
-
-import trgpy.emg
-reload(trgpy.emg)
-from trgpy.emg import line_flux_conversion
-from trgpy.dictionary_transitions import freq
+
+
+class _LazyModule(object):
+    """ Stands in for a module until its first attribute access, which
+        imports the module and replaces the stand-in in the globals of this
+        module.
+    """
+
+    def __init__(self, alias, name):
+        self._alias = alias
+        self._name = name
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attribute)
+
+
+np = _LazyModule('np', 'numpy')
+pd = _LazyModule('pd', 'pandas')
+pa = _LazyModule('pa', 'pyarrow')
+pc = _LazyModule('pc', 'pyarrow.compute')
+pq = _LazyModule('pq', 'pyarrow.parquet')
+
 from trgpy.config import cosmo_params_standard_1
 cosmo_params = cosmo_params_standard_1
 # ---------------
@@ -156,6 +183,9 @@ cosmo_params = cosmo_params_standard_1
 # Path to local data
 data_path = '/Users/tgreve/Dropbox/Work/local/python/logal/raw-data/'
 
+# Build manifest (content hashes of the stage inputs and outputs, see build)
+build_manifest_name = 'build-manifest.json'
+
 # Raw data table names
 table1_name_J17 = "Jiao-et-al-2017.txt"
 
@@ -179,11 +209,89 @@ table5_name_I15 = "Israel-et-al-2015-Table-5.txt"
 table_name_G14 = "Greve-et-al-2014-table-1.txt"
 table1_name_A09 = "Armus-et-al-2009-table-1.txt"
 
+# Entries of raw data tables read as null in typed columns (see
+# read_raw_table); '\u2212' is the minus sign used by I15
+raw_null_values = ['', '...', '-', '\u2212']
+
+# Lines after the first data row searched for a rule (------) below the column
+# heads of a table (see read_raw_table)
+header_lookahead = 3
+
+# ID aliases: (substring of ID, ID). Rules are applied in order, each to the
+# result of the previous ones (see compile_aliases).
+id_aliases = [# A09
+              ('IRAS05189-2524', 'IRASF05189-2524'),
+              ('IRAS18293-3413', 'IRASF18293-3413'),
+              ('13120-5453', 'IRAS13120-5453'),
+              ('16516-0948', 'IRASF16516-0948'),
+              ('16399-0937', 'IRASF16399-0937'),
+              ('17138-1017', 'IRASF17138-1017'),
+              ('10565+2448', 'IRASF10565+2448'),
+              # G14
+              ('NGC34', 'NGC0034'),
+              ('17208-0014', 'IRASF17207-0014'),
+              ('10565+2448', 'IRASF10565+2448'),
+              ('IRAS02512+1446', 'MCG+02-08-029'),
+              ('IRAS09320+6134', 'UGC05101'),
+              ('IRAS12243-0036', 'NGC4418'),
+              ('IRAS13001-2339', 'ESO507-G070'),
+              ('IRAS13470+3530', 'UGC08739'),
+              ('IRAS15163+4255', 'VV705'),
+              ('IRAS15327+2340', 'Arp220'),
+              ('IRAS15437+0234', 'NGC5990'),
+              ('IRAS16284+0411', 'CGCG052-037'),
+              ('IRAS13188+0036', 'NGC5104'),
+              # R15
+              ('Arp299', 'Arp299-A'),
+              ('Zw049.057', 'CGCG049-057'),
+              ('IC4687', 'IC4687'),
+              # L17
+              ('09913', 'Arp220'),
+              ('08058', 'Mrk231'),
+              ('03608', 'UGC3608'),
+              ('08387', 'Arp193'),
+              ('08696', 'Mrk273'),
+              ('16381190', 'ESO069-IG006'),
+              # I15
+              ('NGC1275(PerA)', 'NGC1275'),
+              ('MGC+12-02-001', 'MCG+12-02-001'),
+              # K16
+              ('NGC3410a', 'NGC3410'),
+              ('NGC0232a', 'NGC0232'),
+              ('NGC3110a', 'NGC3110'),
+              ('NGC2388a', 'NGC2388'),
+              ('NGC2342b', 'NGC2341'),
+              ('NGC2342a', 'NGC2342'),
+              ('IC4518ABa', 'IC4518A'),
+              ('M101_02', 'M101'),
+              ('NGC2976_00', 'NGC2976'),
+              ('MCG+04-48-002a', 'MCG+04-48-002'),
+              ('NGC5734a', 'NGC5734'),
+              ('NGC7679a', 'NGC7679'),
+              ('IC10-B11-1', 'IC10'),
+              ('NGC0877a', 'NGC0877'),
+              ('NGC891-1', 'NGC891'),
+              ('NGC205-copeak', 'NGC205')]
+
+# ID_ALT aliases: (substring of ID_ALT, ID_ALT)
+id_alt_aliases = [('MRK0331', 'Mrk331'),
+                  ('09913', 'Arp220'),
+                  ('08058', 'Mrk231'),
+                  ('08387', 'Arp193'),
+                  ('08696', 'Mrk273'),
+                  ('Arp256', 'MCG-02-01-051'),
+                  ('02369', 'MCG+02-08-029')]
+
 # Extended sources
 #extended_sources = ['M82','Arp299', 'ESO173-G015', 'MCG+12-02-001', 'MGC+12-02-001', 'Mrk331', 'NGC1068',
 #                    'NGC1365', 'NGC2146','NGC3256', 'NGC5135', 'NGC7771','MilkyWay','SgrA*',
 #                   'NGC3690', 'UGC06471', 'UGC06742','NGC4038','NGC4038overlap']
 #
+# Exclusion catalogue: sources whose ID or ID_ALT contains one of these names
+# are removed from all samples (see remove_extended_sources). Increase
+# extended_sources_version whenever the list changes; build() records it and
+# re-runs all stages when it differs.
+extended_sources_version = 2
 extended_sources = ['Arp299',                                  # R15, multiple pointings
                     'NGC2146',                                 # R15, multiple pointings, L17: NGC2146NW, Nuc, SE
                     'NGC1365',                                 # R15, multiple pointings
@@ -193,7 +301,7 @@ extended_sources = ['Arp299',                                  # R15, multiple p
                     'IC694',
                     'UGC06742',                                # L17
                     'NGC3690A',                                # L17
-                    'Arp299A'
+                    'Arp299A',
                     'NGC4038',
                     'NGC4038overlap',
                     'NGC5010',                                 # L17
@@ -207,116 +315,1025 @@ ValUnDef = -999
 ValUpLim = 99
 ValLoLim = -99
 
+# Line flux flags (see parse_line_fluxes)
+FluxDetected = 0
+FluxUpLim = 1
+FluxUnDef = 2
+FluxApCorr = 3
+
+# Footnotes of line flux strings, as (regular expression, flag, value) rules.
+# The first rule whose expression is found in a string sets its flag, and
+# value is the number read from it: 'lead' the number in front of any
+# parenthesis or footnote, 'paren' the number in parentheses.
+footnotes_R15 = [(r'\^a', FluxApCorr, 'paren'),   # corrected flux in parentheses
+                 (r'-', FluxUnDef, None),          # no measurement
+                 (r'\(', FluxDetected, 'lead'),    # flux in front of parentheses
+                 (r'\^b', FluxUpLim, 'lead'),      # upper limit
+                 (r'\^d', FluxUnDef, None),        # undefined
+                 (r'', FluxDetected, 'lead')]
+footnotes_R15_low_J = [(r'\.\.\.', FluxUnDef, None),
+                       (r'', FluxDetected, 'lead')]
+
+# Aperture corrections of line fluxes, as {flux column: beam factor} (see
+# aperture_correct). L17 lists the fraction of the flux inside the 35'', 30''
+# and 17'' SPIRE beams as f_35, f_30 and f_17.
+aperture_corrections_L17 = {'SdV_CO43': 'f_35', 'SdV_CO54': 'f_35',
+                            'SdV_CO65': 'f_30', 'SdV_CO76': 'f_35',
+                            'SdV_CO87': 'f_35', 'SdV_CO98': 'f_17',
+                            'SdV_CO109': 'f_17', 'SdV_CO1110': 'f_17',
+                            'SdV_CO1211': 'f_17', 'SdV_CO1312': 'f_17',
+                            'SdV_CI609': 'f_35', 'SdV_CI370': 'f_35',
+                            'SdV_NII205': 'f_17'}
+
+# Survey priority of the master values (see resolve_master_values). The
+# master LIR_8_1000 is the LIR of the first survey in master_priority_LIR that
+# has one (as (survey, LIR field)), and the master SdV and eSdV of each
+# transition in master_transitions are those of the first survey in
+# master_priority_lines with a flux or an upper limit. Both follow the reverse
+# commit order of commit_to_db, where the last commit won.
+master_priority_LIR = [('L17', 'LIR_8_1000'), ('K16', 'LIR_40_120'),
+                       ('R15', 'LIR_8_1000'), ('G14', 'LIR_8_1000'),
+                       ('I15', 'LIR_8_1000'), ('A09', 'LIR_8_1000')]
+master_priority_lines = ['J17', 'L17', 'K16', 'R15', 'I15']
+master_transitions = ['12CO(' + s + ')' for s in ['1-0','2-1','3-2','4-3','5-4',
+                                                  '6-5','7-6','8-7','9-8','10-9',
+                                                  '11-10','12-11','13-12']]
+master_transitions = master_transitions + ['13CO(2-1)','[CI]609','[CI]370',
+                                           '[NII]205','[OI]63','[OI]145','[CII]158']
+
 # Cosmology
 cosmo  = {'omega_M_0': 0.28, 'omega_lambda_0': 0.72, 'omega_k_0': 0.0,'h': 0.70}
+
+# Cosmologies adopted by the samples
+cosmo_params_G14  = {'omega_M_0': 0.315, 'omega_lambda_0': 0.685,
+                     'omega_k_0': 0.0, 'h': 0.67, 'Tcmb0': 2.725}
+cosmo_params_I15  = {'omega_M_0': 0.27, 'omega_lambda_0': 0.73,
+                     'omega_k_0': 0.0, 'h': 0.73, 'Tcmb0': 2.73}
+cosmo_params_L17  = {'omega_M_0': 0.3, 'omega_lambda_0': 0.7,
+                     'omega_k_0': 0.0, 'h': 0.70, 'Tcmb0': 2.725}
+
+# Redshift grid on which luminosity distances are tabulated (log z from
+# 1.E-6 to 20. in 4000 steps, computed on first use, see _d_L_grid)
+log_z_grid = None
+
+# Number of updates sent per bulk_write call (or SQLite transaction)
+commit_batch_size = 500
+
+# Number of documents per cursor batch of export_table on MongoDB without
+# pymongoarrow
+# (large enough for the whole catalogue to be returned in one round trip)
+export_batch_size = 100000
+
+# NED redshift cache (stored in data_path). In offline mode NED is never
+# queried and sources missing from the cache raise a KeyError.
+ned_cache_name = 'ned-redshift-cache.sqlite'
+ned_cache_ttl = 90*24*3600.                 # [s]
+ned_offline = False
+ned_cache = None
+
+# NED resolver: worker threads, query rate limit, and retries on
+# RemoteServiceError with exponential backoff. Errors whose message contains
+# one of ned_permanent_errors (names NED does not know) are not retried, the
+# source has no NED redshift.
+ned_max_workers = 8
+ned_rate = 5.                               # [queries/s]
+ned_max_retries = 3
+ned_backoff = 1.                            # [s]
+ned_permanent_errors = ['not recognized by the NED name interpreter',
+                        'no object found', 'not currently recognized']
+
+# Worker processes for the make_pickle_* stages (None: one per stage). The
+# NED query rate is shared evenly between the stages that query NED
+# (ned_stages) and can run at the same time.
+pickle_max_workers = None
+ned_stages = ['A09', 'L17']
+
+# Show per-stage progress bars (switched off in worker processes)
+show_progress = True
+
+# Storage backend of db (see get_storage): 'mongodb' for the MongoDB server
+# (database master_database), or 'sqlite' for an embedded SQLite file
+# (sqlite_name in data_path), which needs no server
+storage_backend = 'mongodb'
+sqlite_name = 'local_galaxies.sqlite'
+storage = None
+
+# Collections of db: the live collection, the staging collection a rebuild
+# is committed to, and the previous generation kept for rollback (see
+# commit_to_db and rollback_db). The commit_to_db_* functions write to
+# commit_collection_name.
+collection_name = 'local_galaxies'
+staging_collection_name = 'local_galaxies_staging'
+previous_collection_name = 'local_galaxies_previous'
+commit_collection_name = collection_name
+
+# Collection holding the build generation of collection_name, which is
+# increased whenever a build (or rollback) replaces it
+metadata_collection_name = 'metadata'
+
+# In-process LRU cache of source documents (see DocumentCache): maximum number
+# of cached IDs, and how often the build generation is checked. By default it
+# is checked on every read, so no stale documents are returned; a positive
+# interval saves these checks, but documents of a build swapped in by another
+# process can then be returned for up to that long.
+document_cache_size = 1024
+document_cache_check_interval = 0.           # [s]
+document_cache = None
 # ------------------------
 
 # --- Connect to database db.local_galaxies ---
-client = MongoClient()
-db = client.master_database
-collection_local_galaxies = db.local_galaxies
+# The MongoClient is created on first use of client, db or
+# collection_local_galaxies (see get_db), so this module imports without
+# pymongo or a running mongod.
+def get_db():
+    """ Returns db (database master_database), connecting on first use.
+    """
+    global client, db, collection_local_galaxies
+    if 'db' not in globals():
+        from pymongo import MongoClient
+        client = MongoClient()
+        db = client.master_database
+        collection_local_galaxies = db.local_galaxies
+
+    return db
+
+
+def __getattr__(name):
+    """ Connects to db on first access of client, db or
+        collection_local_galaxies.
+    """
+    if name in ('client', 'db', 'collection_local_galaxies'):
+        get_db()
+        return globals()[name]
+    raise AttributeError("module "+__name__+" has no attribute "+name)
 # ---------------------------------------------
 
 
-def build():
-    """ Initializes db.local_galaxies, creates pkl-files and master_list, and
-        finally builds db.local_galaxies.
+def build(force=False):
+    """ Builds db.local_galaxies incrementally.
+
+        The build is split into stages (see _build_stages), each declaring
+        the files in data_path it reads and writes. The survey stages run in
+        parallel (see make_pickles), followed by the master list and the db
+        commit, which stamps a new build generation (see
+        get_build_generation). The content hashes of
+        these files are recorded in a manifest (build_manifest_name) after a
+        stage has run, together with extended_sources_version, and on the
+        next build a stage is only re-run if any of its inputs or outputs or
+        the exclusion catalogue has changed since. Stages run in dependency
+        order, so a stage whose outputs change makes its dependents stale.
+        Use force=True to re-run all stages (e.g. after changing the code).
+    """
+
+    # Read manifest
+    manifest_file = data_path+build_manifest_name
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        manifest = {}
+
+    def stage_hashes(inputs, outputs):
+        hashes = dict((filename, _file_hash(data_path+filename))
+                      for filename in inputs+outputs)
+        hashes['extended_sources_version'] = extended_sources_version
+        return hashes
+
+    def is_stale(name, inputs, outputs):
+        hashes = stage_hashes(inputs, outputs)
+        stale = force or manifest.get(name) != hashes or \
+                any(hashes[filename] is None for filename in outputs)
+        if name == 'db' and not stale:
+            stale = get_storage().count(collection_name) == 0
+        if not stale:
+            print("Stage "+name+" is up to date.")
+        return stale
+
+    def record(name, inputs, outputs):
+        # Record hashes as soon as a stage has run, so that an interrupted
+        # build resumes from the first stage that did not finish.
+        manifest[name] = stage_hashes(inputs, outputs)
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    stages = _build_stages()
+
+    # The survey stages only read raw files, so the stale ones are run in
+    # parallel. The master list and the db commit depend on their outputs and
+    # run after them, one at a time.
+    stale = dict((name, (inputs, outputs))
+                 for name, function, inputs, outputs, parallel in stages
+                 if parallel and is_stale(name, inputs, outputs))
+    if len(stale) > 0:
+        for name in make_pickles(list(stale)):
+            record(name, *stale[name])
+
+    for name, function, inputs, outputs, parallel in stages:
+        if parallel or not is_stale(name, inputs, outputs):
+            continue
+        print("Running stage "+name+" ...")
+        if function() is False:
+            print("Error... stage "+name+" failed.")
+            return
+        record(name, inputs, outputs)
+
+
+def _file_hash(filename):
+    """ Returns the SHA-256 hex digest of a file, or None if it is missing.
+    """
+    sha = hashlib.sha256()
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+    except IOError:
+        return None
+    return sha.hexdigest()
+
+
+def _build_stages():
+    """ Returns the build stages in dependency order as
+        (name, function, input files, output files, parallel).
+    """
+    tables_I15 = ['Israel-et-al-2015-Table-'+k+'.parquet'
+                  for k in ['1', '2', '3', '4', '5']]
+    return [('A09', make_pickle_A09, [table1_name_A09],
+             ['Armus-et-al-2009.parquet'], True),
+            ('G14', make_pickle_G14, [table_name_G14],
+             ['Greve-et-al-2014.parquet'], True),
+            ('R15', make_pickle_R15,
+             [table1_name_R15, table2_name_R15, table3_name_R15],
+             ['Rosenberg-et-al-2015.parquet'], True),
+            ('I15', make_pickle_I15,
+             [table1_name_I15, table2_name_I15, table3_name_I15,
+              table4_name_I15, table5_name_I15],
+             tables_I15, True),
+            ('K16', make_pickle_K16,
+             [table1_name_K16, table2_name_K16, table3_name_K16],
+             ['Kamenetzky-et-al-2016.parquet'], True),
+            ('L17', make_pickle_L17, [table1_name_L17, table4_name_L17],
+             ['Lu-et-al-2017.parquet'], True),
+            ('J17', make_pickle_J17, [table1_name_J17],
+             ['Jiao-et-al-2017.parquet'], True),
+            ('master_list', lambda: make_master_list(verbose=True),
+             ['Kamenetzky-et-al-2016.parquet', 'Lu-et-al-2017.parquet',
+              'Rosenberg-et-al-2015.parquet', 'Greve-et-al-2014.parquet',
+              'Armus-et-al-2009.parquet', 'Israel-et-al-2015-Table-1.parquet',
+              'Jiao-et-al-2017.parquet'],
+             ['master_list.parquet'], False),
+            # The master values are derived from all survey commits, so
+            # they are re-run together.
+            ('db', commit_to_db,
+             ['master_list.parquet', 'Armus-et-al-2009.parquet']+tables_I15[:4]+
+             ['Greve-et-al-2014.parquet', 'Rosenberg-et-al-2015.parquet',
+              'Kamenetzky-et-al-2016.parquet', 'Lu-et-al-2017.parquet',
+              'Jiao-et-al-2017.parquet'],
+             [], False)]
+
+
+def make_pickles(labels=None, max_workers=None):
+    """ Runs make_pickle_<label> for each label (default: all samples) in a
+        pool of worker processes, which write their Parquet files to data_path.
+        Yields the labels as the stages finish, while a single progress bar
+        shows the number of finished stages.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if labels is None:
+        labels = ['A09', 'G14', 'R15', 'I15', 'K16', 'L17', 'J17']
+    labels = list(labels)
+    if max_workers is None:
+        max_workers = pickle_max_workers or len(labels)
+    max_workers = max(min(max_workers, len(labels)), 1)
+
+    # Workers may be spawned rather than forked, so pass on the settings.
+    # Only the NED stages share the query rate.
+    N_ned = max(min(len([label for label in labels if label in ned_stages]), max_workers), 1)
+    settings = {'data_path': data_path, 'ned_offline': ned_offline,
+                'ned_rate': ned_rate/N_ned}
+    N = len(labels)
+    _progressBar("Survey samples: ", 0, N)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_pickle_worker,
+                             initargs=(settings,)) as executor:
+        futures = [executor.submit(_run_pickle_stage, label) for label in labels]
+        j = 0
+        for future in as_completed(futures):
+            label = future.result()
+            j=j+1
+            _progressBar("Survey samples: ", j, N)
+            yield label
+    print("")
+
+
+def _init_pickle_worker(settings):
+    """ Initializes a make_pickles worker process.
+    """
+    global ned_cache, show_progress
+    globals().update(settings)
+    ned_cache = None                # never share a sqlite connection
+    show_progress = False
+
+
+def _run_pickle_stage(label):
+    """ Runs make_pickle_<label> in a make_pickles worker process.
     """
+    globals()['make_pickle_'+label]()
+    return label
 
-    # Initialize
-    db_initialize(drop=True)
 
-    # Make pkl-files
-    make_pickle_A09()
-    make_pickle_G14()
-    make_pickle_R15()
-    make_pickle_I15()
-    make_pickle_K16()
-    make_pickle_L17()
-    make_pickle_J17()
+def commit_to_db():
+    """ Rebuilds db.local_galaxies from the master list and all samples.
 
-    # Make master list
-    make_master_list(verbose=True)
+        The master list and samples are committed to a new staging
+        collection, the master values are derived from the samples (see
+        resolve_master_values), and the staging collection replaces the live collection only if it holds one
+        document per master list source. Readers keep seeing the previous
+        build until then, as the swap only renames collections (see
+        StorageBackend.swap). The replaced build is kept as the previous
+        generation (see rollback_db).
+        Returns False if the staging collection is not valid.
+    """
+    global commit_collection_name
+
+    # --- Commit to staging collection ---
+    db_initialize(drop=True, name=staging_collection_name)
+    commit_collection_name = staging_collection_name
+    try:
+        commit_to_db_master()
+        commit_to_db_A09()
+        commit_to_db_I15()
+        commit_to_db_G14()
+        commit_to_db_R15()
+        commit_to_db_K16()
+        commit_to_db_L17()
+        commit_to_db_J17()
+        resolve_master_values()
+    finally:
+        commit_collection_name = collection_name
+    # ------------------------------------
+
+    # --- Validate counts ---
+    N_master = read_table('master_list.parquet', columns=['ID']).shape[0]
+    N_staging = get_storage().count(staging_collection_name)
+    if N_staging != N_master or N_master == 0:
+        print("Error... staging collection has "+str(N_staging)+" sources, "
+              "master list has "+str(N_master)+". "+collection_name+" is not replaced.")
+        return False
+    # -----------------------
+
+    # --- Swap ---
+    _swap_collections(staging_collection_name)
+    # ------------
+
+    return True
+
+
+def rollback_db():
+    """ Restores the previous generation of db.local_galaxies, which in turn
+        becomes the previous generation (so a second call undoes the first).
+    """
+    backend = get_storage()
+    if not backend.exists(previous_collection_name):
+        print("Error... no previous generation of "+collection_name+".")
+        return False
+
+    backend.rename(previous_collection_name, staging_collection_name)
+    _swap_collections(staging_collection_name)
+    db_initialize(name=collection_name)
+
+    return True
+
+
+def _swap_collections(name):
+    """ Replaces the live collection by collection name, keeping the live
+        collection as the previous generation.
+    """
+    get_storage().swap(name, collection_name, previous_collection_name)
+    _stamp_generation()
+
+
+def get_build_generation():
+    """ Returns the build generation of db.local_galaxies (0 before the first
+        build).
+    """
+    return get_storage().generation(collection_name)
 
-    # Commit to db
-    commit_to_db_master()
-    commit_to_db_A09()
-    commit_to_db_I15()
-    commit_to_db_G14()
-    commit_to_db_R15()
-    commit_to_db_K16()
-    commit_to_db_L17()
-    commit_to_db_J17()
 
+def _stamp_generation():
+    """ Increases the build generation of db.local_galaxies, and invalidates
+        the document cache of this process.
+    """
+    generation = get_storage().stamp_generation(collection_name)
+    if document_cache is not None:
+        document_cache.validate(force=True)
+
+    return generation
 
-def db_initialize(drop=False):
+
+def db_initialize(drop=False, name=None):
     """ Initializes database.
+
+        Creates the indexes of collection name (default: collection_name),
+        after dropping it if drop is True.
     """
+    if name is None:
+        name = collection_name
 
     # --- Initialize database db.local_galaxies ---
-    client = MongoClient()
-    db = client.master_database
-    if drop:
-        db.drop_collection('local_galaxies')
-    collection_local_galaxies = db.local_galaxies
+    get_storage().initialize(name, drop=drop)
     # ---------------------------------------------
 
 
-def remove_extended_sources(DataFrame):
+def get_storage():
+    """ Returns the storage backend of db (see storage_backend), which is
+        created on first use.
+    """
+    global storage
+    if storage is None:
+        if storage_backend == 'mongodb':
+            storage = MongoBackend(get_db())
+        elif storage_backend == 'sqlite':
+            storage = SQLiteBackend()
+        else:
+            raise ValueError("Error... unknown storage backend "+str(storage_backend)+".")
+
+    return storage
+
+
+def _get_field(document, field):
+    """ Returns the value of the (dotted) field of document, or None if the
+        field is not set.
+    """
+    value = document
+    for key in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+
+    return value
+
+
+def _set_field(document, field, value):
+    """ Sets the (dotted) field of document to value, creating missing
+        subdocuments as $set does.
+    """
+    keys = field.split('.')
+    for key in keys[:-1]:
+        if not isinstance(document.get(key), dict):
+            document[key] = {}
+        document = document[key]
+    document[keys[-1]] = value
+
+
+def _project(document, fields):
+    """ Returns the (dotted) fields of document (and its _id), in the field
+        order of document, as a MongoDB projection does.
+    """
+    projected = {}
+    for key, value in document.items():
+        if key == '_id' or key in fields:
+            projected[key] = value
+            continue
+        subfields = [field[len(key)+1:] for field in fields if field.startswith(key+'.')]
+        if len(subfields) > 0 and isinstance(value, dict):
+            value = _project(value, subfields)
+            value.pop('_id', None)
+            projected[key] = value
+
+    return projected
+
+
+class StorageBackend(object):
+    """ Interface of the storage backends of db (see get_storage).
+
+        A backend holds named collections of source documents, which are
+        nested dicts with unique ID and ID_ALT fields and an _id assigned by
+        the backend, and the build generation of each collection. Fields are
+        addressed by dotted names, e.g. '12CO(1-0).SdV_K16'.
+    """
+
+    def insert(self, name, documents):
+        """ Inserts documents into collection name.
+        """
+        raise NotImplementedError
+
+    def bulk_set(self, name, updates, batch_size=None):
+        """ Sets the fields of the documents in collection name given as
+            (_id, {field: value}) updates, sent in batches of batch_size
+            (default: commit_batch_size). Returns the number of updates.
+        """
+        raise NotImplementedError
+
+    def find(self, name, IDs=None, fields=None):
+        """ Returns an iterator over the documents in collection name whose
+            ID or ID_ALT is in IDs (default: all documents). fields is a list
+            of (dotted) fields to return besides _id (default: all fields).
+        """
+        raise NotImplementedError
+
+    def export(self, name, schema):
+        """ Returns an Arrow table with one row per document in collection
+            name and one column per (column, field, Arrow type) in schema.
+            Fields are cast to float64 unless their type is string; missing
+            fields are null.
+        """
+        raise NotImplementedError
+
+    def count(self, name):
+        """ Returns the number of documents in collection name.
+        """
+        raise NotImplementedError
+
+    def exists(self, name):
+        """ Returns True if collection name exists.
+        """
+        raise NotImplementedError
+
+    def initialize(self, name, drop=False):
+        """ Creates collection name and its unique ID and ID_ALT indexes,
+            after dropping it if drop is True.
+        """
+        raise NotImplementedError
+
+    def rename(self, name, target):
+        """ Renames collection name to target, replacing target in one step.
+        """
+        raise NotImplementedError
+
+    def copy(self, name, target):
+        """ Replaces collection target by a copy of collection name.
+        """
+        raise NotImplementedError
+
+    def swap(self, name, target, previous):
+        """ Replaces collection target by collection name, keeping target as
+            collection previous. Both are renamed, so nothing is copied
+            (target is missing in between); backends that cannot rename
+            collections override this with copy.
+        """
+        if self.exists(target):
+            self.rename(target, previous)
+        self.rename(name, target)
+
+    def generation(self, name):
+        """ Returns the build generation of collection name (0 if none).
+        """
+        raise NotImplementedError
+
+    def stamp_generation(self, name):
+        """ Increases the build generation of collection name and returns it.
+        """
+        raise NotImplementedError
+
+    def set_master_values(self, name, candidates):
+        """ Sets each field of candidates ({field: [(condition, value)]}) in
+            all documents of collection name to the value of its first
+            candidate whose condition field is set, where value is a (dotted)
+            field or a constant. Fields without such a candidate are not set.
+        """
+        fields = []
+        for options in candidates.values():
+            for condition, value in options:
+                fields = fields + [condition] + ([value] if isinstance(value, str) else [])
+
+        updates = []
+        for document in self.find(name, fields=list(dict.fromkeys(fields))):
+            values = {}
+            for field, options in candidates.items():
+                for condition, value in options:
+                    if _get_field(document, condition) is None:
+                        continue
+                    if isinstance(value, str):
+                        value = _get_field(document, value)
+                    if value is not None:
+                        values[field] = value
+                    break
+            updates.append((document['_id'], values))
+
+        return self.bulk_set(name, updates)
+
+
+class MongoBackend(StorageBackend):
+    """ Storage backend on a MongoDB database (see StorageBackend).
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def insert(self, name, documents):
+        if len(documents) > 0:
+            self.database[name].insert_many(documents, ordered=False)
+
+    def bulk_set(self, name, updates, batch_size=None):
+        from pymongo import UpdateOne
+
+        if batch_size is None:
+            batch_size = commit_batch_size
+        operations = [UpdateOne({'_id': doc_id}, {'$set': fields})
+                      for doc_id, fields in updates if len(fields) > 0]
+        for k in range(0, len(operations), batch_size):
+            self.database[name].bulk_write(operations[k:k+batch_size], ordered=False)
+
+        return len(operations)
+
+    def find(self, name, IDs=None, fields=None):
+        query = {}
+        if IDs is not None:
+            IDs = list(IDs)
+            query = {'$or': [{'ID': {'$in': IDs}}, {'ID_ALT': {'$in': IDs}}]}
+        projection = None
+        if fields is not None:
+            projection = dict((field, 1) for field in fields)
+
+        return self.database[name].find(query, projection)
+
+    def export(self, name, schema):
+        """ The columns are flattened and cast by a $project on the server.
+            If pymongoarrow is installed, the raw BSON batches are decoded
+            straight into Arrow arrays; otherwise all documents are read in
+            one cursor batch (export_batch_size).
+        """
+        project = {'_id': 0}
+        for column, field, dtype in schema:
+            if dtype == pa.string():
+                project[column] = '$'+field
+            else:
+                project[column] = {'$toDouble': '$'+field}
+        pipeline = [{'$project': project}]
+
+        try:
+            from pymongoarrow.api import Schema, aggregate_arrow_all
+        except ImportError:
+            cursor = self.database[name].aggregate(pipeline, batchSize=export_batch_size)
+            return pa.Table.from_pylist(list(cursor), schema=pa.schema(
+                [(column, dtype) for column, field, dtype in schema]))
+
+        table = aggregate_arrow_all(self.database[name], pipeline,
+                                    schema=Schema(dict((column, dtype)
+                                                       for column, field, dtype in schema)))
+        return table.select([column for column, field, dtype in schema])
+
+    def count(self, name):
+        return self.database[name].count_documents({})
+
+    def exists(self, name):
+        return name in self.database.list_collection_names()
+
+    def initialize(self, name, drop=False):
+        if drop:
+            self.database.drop_collection(name)
+
+        # Unique IDs; ID_ALT is only set for some sources
+        self.database[name].create_index('ID', unique=True)
+        self.database[name].create_index('ID_ALT', unique=True, sparse=True)
+
+    def rename(self, name, target):
+        self.database[name].rename(target, dropTarget=True)
+
+    def copy(self, name, target):
+        # $out replaces target in one step
+        self.database[name].aggregate([{'$match': {}}, {'$out': target}])
+
+    def generation(self, name):
+        metadata = self.database[metadata_collection_name].find_one({'_id': name})
+        if metadata is None:
+            return 0
+
+        return metadata['generation']
+
+    def stamp_generation(self, name):
+        from pymongo import ReturnDocument
+
+        metadata = self.database[metadata_collection_name].find_one_and_update(
+            {'_id': name},
+            {'$inc': {'generation': 1}, '$set': {'time': time.time()}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+
+        return metadata['generation']
+
+    def set_master_values(self, name, candidates):
+        """ The master values are derived in one aggregation pass, and merged
+            into their subdocuments with $merge.
+        """
+        # --- Master values from the survey fields ---
+        master = {}
+        subdocuments = {}
+        for k, (field, options) in enumerate(candidates.items()):
+            master['_master_'+str(k)] = _first_defined(
+                [('$'+condition, '$'+value if isinstance(value, str) else value)
+                 for condition, value in options])
+            subdocument, subfield = field.split('.', 1)
+            subdocuments.setdefault(subdocument, []).append((subfield, '$_master_'+str(k)))
+        # --------------------------------------------
+
+        # --- Merge master values into their subdocuments ---
+        # (subdocuments without master values are not changed)
+        fields = {}
+        for subdocument, values in subdocuments.items():
+            fields[subdocument] = {'$cond': [{'$or': [{'$gt': [value, None]}
+                                                      for subfield, value in values]},
+                                             {'$mergeObjects': ['$'+subdocument, dict(values)]},
+                                             '$$REMOVE']}
+            master[subdocument] = 1
+        # ---------------------------------------------------
+
+        self.database[name].aggregate([{'$project': master},
+                                       {'$project': fields},
+                                       {'$merge': {'into': name, 'on': '_id',
+                                                   'whenMatched': 'merge',
+                                                   'whenNotMatched': 'discard'}}])
+
+
+class SQLiteBackend(StorageBackend):
+    """ Embedded storage backend in an SQLite file (default: sqlite_name in
+        data_path), which needs no database server (see StorageBackend).
+
+        Each collection is a table of documents stored as JSON text, with
+        unique ID and ID_ALT columns; the build generations are kept in
+        table metadata_collection_name. Fields are read and cast in Python,
+        as the JSON functions of SQLite do not accept NaN, so export is a
+        row scan rather than columnar (see export).
+    """
+
+    # Host parameters per statement (SQLITE_MAX_VARIABLE_NUMBER before
+    # SQLite 3.32)
+    max_variables = 999
+
+    def __init__(self, path=None):
+        if path is None:
+            path = data_path+sqlite_name
+        self.path = path
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS "'+metadata_collection_name+'" '
+                                '(name TEXT PRIMARY KEY, generation INTEGER, time REAL)')
+        self.connection.commit()
+
+    @staticmethod
+    def _dumps(document):
+        """ Returns document as JSON text (without its _id).
+        """
+        document = dict((key, value) for key, value in document.items() if key != '_id')
+        return json.dumps(document, default=lambda value: value.item())
+
+    def _create(self, name):
+        # Unique IDs; NULL (unset) ID_ALTs do not collide
+        self.connection.execute('CREATE TABLE IF NOT EXISTS "'+name+'" '
+                                '(_id INTEGER PRIMARY KEY, ID TEXT UNIQUE, '
+                                'ID_ALT TEXT UNIQUE, document TEXT)')
+
+    def _select_in(self, name, column, values):
+        """ Returns a dict of the documents (as JSON text) of collection name
+            whose column is in values, by _id. values are bound in chunks of
+            at most max_variables.
+        """
+        rows = {}
+        for k in range(0, len(values), self.max_variables):
+            chunk = list(values[k:k+self.max_variables])
+            marks = ', '.join(['?']*len(chunk))
+            rows.update(self.connection.execute(
+                'SELECT _id, document FROM "'+name+'" WHERE '+column+' IN ('+marks+')',
+                chunk).fetchall())
+
+        return rows
+
+    def _select(self, name, IDs):
+        """ Returns the (_id, document) rows of collection name whose ID or
+            ID_ALT is in IDs, in _id order.
+        """
+        rows = self._select_in(name, 'ID', IDs)
+        rows.update(self._select_in(name, 'ID_ALT', IDs))
+
+        return sorted(rows.items())
+
+    def insert(self, name, documents):
+        with self.connection:
+            self._create(name)
+            self.connection.executemany(
+                'INSERT INTO "'+name+'" (ID, ID_ALT, document) VALUES (?, ?, ?)',
+                [(document.get('ID'), document.get('ID_ALT'), self._dumps(document))
+                 for document in documents])
+
+    def bulk_set(self, name, updates, batch_size=None):
+        if batch_size is None:
+            batch_size = commit_batch_size
+        updates = [(doc_id, fields) for doc_id, fields in updates if len(fields) > 0]
+
+        for k in range(0, len(updates), batch_size):
+            batch = updates[k:k+batch_size]
+            documents = self._select_in(name, '_id', [doc_id for doc_id, fields in batch])
+            documents = dict((doc_id, json.loads(text)) for doc_id, text in documents.items())
+            for doc_id, fields in batch:
+                # Updates of missing documents are ignored, as with UpdateOne
+                if doc_id not in documents:
+                    continue
+                for field, value in fields.items():
+                    _set_field(documents[doc_id], field, value)
+            with self.connection:
+                self.connection.executemany(
+                    'UPDATE "'+name+'" SET ID = ?, ID_ALT = ?, document = ? WHERE _id = ?',
+                    [(document.get('ID'), document.get('ID_ALT'), self._dumps(document), doc_id)
+                     for doc_id, document in documents.items()])
+
+        return len(updates)
+
+    def find(self, name, IDs=None, fields=None):
+        if not self.exists(name):
+            return
+        if IDs is None:
+            rows = self.connection.execute('SELECT _id, document FROM "'+name+'" ORDER BY _id')
+        else:
+            rows = self._select(name, list(IDs))
+
+        for doc_id, text in rows:
+            document = {'_id': doc_id}
+            document.update(json.loads(text))
+            if fields is not None:
+                document = _project(document, fields)
+            yield document
+
+    def export(self, name, schema):
+        """ A row scan: every document is decoded from its JSON text and
+            its fields are read in Python, so the time grows with the size of
+            the documents rather than of the exported columns. A columnar
+            export would need the exported fields stored in real columns (or
+            an engine such as DuckDB, which is not a dependency).
+        """
+        columns = dict((column, []) for column, field, dtype in schema)
+        for document in self.find(name):
+            for column, field, dtype in schema:
+                value = _get_field(document, field)
+                if value is not None and dtype != pa.string():
+                    value = float(value)
+                columns[column].append(value)
+
+        return pa.Table.from_pydict(columns, schema=pa.schema(
+            [(column, dtype) for column, field, dtype in schema]))
+
+    def count(self, name):
+        if not self.exists(name):
+            return 0
+
+        return self.connection.execute('SELECT COUNT(*) FROM "'+name+'"').fetchone()[0]
+
+    def exists(self, name):
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                                       "AND name = ?", (name,)).fetchone() is not None
+
+    def initialize(self, name, drop=False):
+        with self.connection:
+            if drop:
+                self.connection.execute('DROP TABLE IF EXISTS "'+name+'"')
+            self._create(name)
+
+    def rename(self, name, target):
+        # One transaction, so readers see either table
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DROP TABLE IF EXISTS "'+target+'"')
+            self.connection.execute('ALTER TABLE "'+name+'" RENAME TO "'+target+'"')
+
+    def swap(self, name, target, previous):
+        # Both renames in one transaction, so readers see either table
+        with self.connection:
+            self.connection.execute('BEGIN')
+            if self.exists(target):
+                self.connection.execute('DROP TABLE IF EXISTS "'+previous+'"')
+                self.connection.execute('ALTER TABLE "'+target+'" RENAME TO "'+previous+'"')
+            self.connection.execute('ALTER TABLE "'+name+'" RENAME TO "'+target+'"')
+
+    def copy(self, name, target):
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('DROP TABLE IF EXISTS "'+target+'"')
+            self._create(target)
+            self.connection.execute('INSERT INTO "'+target+'" SELECT * FROM "'+name+'"')
+
+    def generation(self, name):
+        row = self.connection.execute('SELECT generation FROM "'+metadata_collection_name+'" '
+                                      'WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return 0
+
+        return row[0]
+
+    def stamp_generation(self, name):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO "'+metadata_collection_name+'" (name, generation, time) '
+                'VALUES (?, 1, ?) ON CONFLICT(name) DO UPDATE SET '
+                'generation = generation+1, time = excluded.time', (name, time.time()))
+
+        return self.generation(name)
+
+
+_extended_source_matchers = {}
+
+
+def remove_extended_sources(DataFrame, sources=None):
     """Removes extended sources from dataframe
+
+        A row is removed if its ID or ID_ALT contains any of the names in
+        sources (default: extended_sources). The names are compiled into one
+        regex, which is cached, and the matching rows are dropped at once.
     """
+    if sources is None:
+        sources = extended_sources
+    sources = tuple(sources)
+
+    if len(sources) == 0:
+        return DataFrame.reset_index(level=0, drop=True)
 
-    for ID in extended_sources:
-        # Check whether ID is in DataFrame.ID
-        indices = [i for i,x in enumerate(DataFrame.ID) if ID in x]
-        if len(indices) > 0:
-            DataFrame = DataFrame.drop(DataFrame.index[[indices]])
+    if sources not in _extended_source_matchers:
+        _extended_source_matchers[sources] = re.compile('|'.join(re.escape(ID) for ID in sources))
+    matcher = _extended_source_matchers[sources]
 
-        # Check whether ID_ALT exist
-        if 'ID_ALT' in DataFrame.columns:
-            # Check whether ID is in DataFrame.ID_ALT
-            indices = [i for i,x in enumerate(DataFrame.ID_ALT) if ID in x]
-            if len(indices) > 0:
-                DataFrame = DataFrame.drop(DataFrame.index[[indices]])
+    extended = np.zeros(len(DataFrame), dtype=bool)
+    for column in ['ID', 'ID_ALT']:
+        if column in DataFrame.columns:
+            extended |= np.array([isinstance(x, str) and matcher.search(x) is not None
+                                  for x in DataFrame[column]], dtype=bool)
 
-    DataFrame = DataFrame.reset_index(level=0, drop=True)
+    DataFrame = DataFrame[~extended].reset_index(level=0, drop=True)
 
     return DataFrame
 
 
+def compile_aliases(aliases):
+    """ Compiles an alias table [(substring, name), ...] for apply_aliases.
+
+        Returns a regex with one alternative per rule, in rule order, and the
+        name each rule finally maps to. Since the regex engine tries the
+        alternatives in order, the first rule whose substring occurs in a
+        name is the one that matches. Later rules that would act on its
+        result are folded into its final name.
+    """
+    alternatives = ['(?=.*?'+re.escape(substring)+')()' for substring, name in aliases]
+    regex = re.compile('^(?:'+'|'.join(alternatives)+')', re.DOTALL)
+
+    names = []
+    for i in range(0, len(aliases)):
+        name = aliases[i][1]
+        for substring, new_name in aliases[i+1:]:
+            if substring in name:
+                name = new_name
+        names.append(name)
+
+    return regex, np.array(names, dtype=object)
+
+
+def apply_aliases(names, compiled_aliases):
+    """ Maps a Series of names through a compiled alias table.
+    """
+    regex, aliases = compiled_aliases
+    if len(names) == 0 or len(aliases) == 0:
+        return names
+
+    # One column per rule; only the column of the matching rule is not NaN
+    matches = names.astype(str).str.extract(regex).notna().values
+    matched = matches.any(axis=1)
+    rule = matches.argmax(axis=1)
+
+    return names.where(~matched, pd.Series(aliases[rule], index=names.index))
+
+
+_compiled_aliases = {}
+
+
+def _get_compiled_aliases(aliases):
+    """ Returns compile_aliases(aliases), which is compiled on first use and
+        cached.
+    """
+    key = tuple(tuple(alias) for alias in aliases)
+    if key not in _compiled_aliases:
+        _compiled_aliases[key] = compile_aliases(aliases)
+
+    return _compiled_aliases[key]
+
+
 def map_id_raw_to_id(table, catalogue=False, drop=True):
     """ Maps (ID_RAW, ID_ALT_RAW) to ID.
     """
     # --- General trimming ---
-    table.ID_RAW = [x.replace('{','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace('}','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace('tt','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace(r""'\\','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace(' ','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace('\t','') for x in table.ID_RAW]
-    table.ID_RAW = [x.replace('*','') for x in table.ID_RAW]
+    table.ID_RAW = table.ID_RAW.str.replace(r"[{}\\ \t*]|tt", '', regex=True)
 
     if 'ID_ALT_RAW' in table.columns:
-        table.ID_ALT_RAW = [x.replace('{','') for x in table.ID_ALT_RAW]
-        table.ID_ALT_RAW = [x.replace('}','') for x in table.ID_ALT_RAW]
-        table.ID_ALT_RAW = [x.replace('tt','') for x in table.ID_ALT_RAW]
-        table.ID_ALT_RAW = [x.replace(r""'\\','') for x in table.ID_ALT_RAW]
-        table.ID_ALT_RAW = [x.replace(' ','') for x in table.ID_ALT_RAW]
-        table.ID_ALT_RAW = [x.replace('\t','') for x in table.ID_ALT_RAW]
+        table.ID_ALT_RAW = table.ID_ALT_RAW.str.replace(r"[{}\\ \t]|tt", '', regex=True)
     # ------------------------
 
     # --- Create a ID and ID_ALT column in dataframe ---
-    table['ID'] = table.apply(lambda row: row['ID_RAW'], axis=1)
+    table['ID'] = table['ID_RAW'].copy()
     if 'ID_ALT_RAW' in table.columns:
-        table['ID_ALT'] = table.apply(lambda row: row['ID_ALT_RAW'], axis=1)
+        table['ID_ALT'] = table['ID_ALT_RAW'].copy()
     if catalogue == 'I15':
         # Create new ID_ALT_RAW and ID_ALT column in dataframe
-        table['ID_ALT_RAW'] = table.apply(lambda row: row['ID_RAW'], axis=1)
-        table['ID_ALT'] = table.apply(lambda row: row['ID_ALT_RAW'], axis=1)
+        table['ID_ALT_RAW'] = table['ID_RAW'].copy()
+        table['ID_ALT'] = table['ID_ALT_RAW'].copy()
     if catalogue == 'J17':
         # Create new ID_ALT_RAW and ID_ALT column in dataframe
-        table['ID_ALT_RAW'] = table.apply(lambda row: row['ID_RAW'], axis=1)
-        table['ID_ALT'] = table.apply(lambda row: row['ID_ALT_RAW'], axis=1)
+        table['ID_ALT_RAW'] = table['ID_RAW'].copy()
+        table['ID_ALT'] = table['ID_ALT_RAW'].copy()
     # --------------------------------------------------
 
     # --- Format A09 ---
@@ -375,178 +1392,9 @@ def map_id_raw_to_id(table, catalogue=False, drop=True):
     # ------------------
 
     # --- General (ID_RAW, ID_ALT_RAW) --> (ID, ID_ALT) formatting ---
-    # ID_RAW --> ID
-    # A09
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS05189-2524' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF05189-2524'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS18293-3413' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF18293-3413'
-    indices = [i for i,x in enumerate(table.ID) if '13120-5453' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRAS13120-5453'
-    indices = [i for i,x in enumerate(table.ID) if '16516-0948' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF16516-0948'
-    indices = [i for i,x in enumerate(table.ID) if '16399-0937' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF16399-0937'
-    indices = [i for i,x in enumerate(table.ID) if '17138-1017' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF17138-1017'
-    indices = [i for i,x in enumerate(table.ID) if '10565+2448' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF10565+2448'
-    # G14
-    indices = [i for i,x in enumerate(table.ID) if 'NGC34' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC0034'
-    indices = [i for i,x in enumerate(table.ID) if '17208-0014' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF17207-0014'
-    indices = [i for i,x in enumerate(table.ID) if '10565+2448' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IRASF10565+2448'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS02512+1446' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'MCG+02-08-029'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS09320+6134' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'UGC05101'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS12243-0036' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC4418'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS13001-2339' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'ESO507-G070'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS13470+3530' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'UGC08739'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS15163+4255' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'VV705'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS15327+2340' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Arp220'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS15437+0234' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC5990'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS16284+0411' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'CGCG052-037'
-    indices = [i for i,x in enumerate(table.ID) if 'IRAS13188+0036' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC5104'
-    # R15
-    indices = [i for i,x in enumerate(table.ID) if 'Arp299' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Arp299-A'
-    indices = [i for i,x in enumerate(table.ID) if 'Zw049.057' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'CGCG049-057'
-    indices = [i for i,x in enumerate(table.ID) if 'IC4687' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IC4687'
-    # L17
-    indices = [i for i,x in enumerate(table.ID) if '09913' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Arp220'
-    indices = [i for i,x in enumerate(table.ID) if '08058' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Mrk231'
-    indices = [i for i,x in enumerate(table.ID) if '03608' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'UGC3608'
-    indices = [i for i,x in enumerate(table.ID) if '08387' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Arp193'
-    indices = [i for i,x in enumerate(table.ID) if '08696' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'Mrk273'
-    indices = [i for i,x in enumerate(table.ID) if '16381190' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'ESO069-IG006'
-    # I15
-    indices = [i for i,x in enumerate(table.ID) if 'NGC1275(PerA)' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC1275'
-    indices = [i for i,x in enumerate(table.ID) if 'MGC+12-02-001' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'MCG+12-02-001'
-    # K16
-    indices = [i for i,x in enumerate(table.ID) if 'NGC3410a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC3410'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC0232a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC0232'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC3110a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC3110'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC2388a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC2388'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC2342b' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC2341'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC2342a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC2342'
-    indices = [i for i,x in enumerate(table.ID) if 'IC4518ABa' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IC4518A'
-    indices = [i for i,x in enumerate(table.ID) if 'M101_02' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'M101'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC2976_00' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC2976'
-    indices = [i for i,x in enumerate(table.ID) if 'MCG+04-48-002a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'MCG+04-48-002'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC5734a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC5734'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC7679a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC7679'
-    indices = [i for i,x in enumerate(table.ID) if 'IC10-B11-1' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'IC10'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC0877a' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC0877'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC891-1' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC891'
-    indices = [i for i,x in enumerate(table.ID) if 'NGC205-copeak' in x]
-    if len(indices) > 0:
-        table.loc[indices,('ID')] = 'NGC205'
-
-    # ID_ALT_RAW --> ID_ALT
+    table['ID'] = apply_aliases(table.ID, _get_compiled_aliases(id_aliases))
     if 'ID_ALT_RAW' in table.columns:
-        indices = [i for i,x in enumerate(table.ID_ALT) if 'MRK0331' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'Mrk331'
-        indices = [i for i,x in enumerate(table.ID_ALT) if '09913' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'Arp220'
-        indices = [i for i,x in enumerate(table.ID_ALT) if '08058' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'Mrk231'
-        indices = [i for i,x in enumerate(table.ID_ALT) if '08387' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'Arp193'
-        indices = [i for i,x in enumerate(table.ID_ALT) if '08696' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'Mrk273'
-        indices = [i for i,x in enumerate(table.ID_ALT) if 'Arp256' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'MCG-02-01-051'
-        indices = [i for i,x in enumerate(table.ID_ALT) if '02369' in x]
-        if len(indices) > 0:
-            table.loc[indices,('ID_ALT')] = 'MCG+02-08-029'
+        table['ID_ALT'] = apply_aliases(table.ID_ALT, _get_compiled_aliases(id_alt_aliases))
     # ----------------------------------------------------------------
 
     # --- Remove duplicates ---
@@ -561,14 +1409,562 @@ def map_id_raw_to_id(table, catalogue=False, drop=True):
     return table
 
 
+class NedCache(object):
+    """ Persistent on-disk cache of NED redshifts.
+
+        Redshifts are stored in an SQLite file and keyed by normalized ID.
+        Entries older than ttl seconds are evicted and re-queried. With
+        offline=True, NED is never queried: expired entries are still
+        served and IDs missing from the cache raise a KeyError.
+    """
+
+    def __init__(self, path=None, ttl=None, offline=False):
+        if path is None:
+            path = data_path+ned_cache_name
+        if ttl is None:
+            ttl = ned_cache_ttl
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS redshifts "
+                                "(ID TEXT PRIMARY KEY, z REAL, time REAL)")
+        self.connection.commit()
+
+    @staticmethod
+    def normalize(ID):
+        """ Returns the cache key of ID.
+        """
+        return str(ID).replace(' ','').replace('\t','').upper()
+
+    def get(self, ID):
+        """ Returns (True, z) if ID is cached and (False, None) if not.
+            z is NaN if NED has no redshift for ID.
+        """
+        key = self.normalize(ID)
+        row = self.connection.execute(
+            "SELECT z, time FROM redshifts WHERE ID = ?", (key,)).fetchone()
+
+        # Expired entry
+        if row is not None and not(self.offline) and time.time()-row[1] > self.ttl:
+            self.connection.execute("DELETE FROM redshifts WHERE ID = ?", (key,))
+            self.connection.commit()
+            row = None
+
+        if row is None:
+            self.misses = self.misses + 1
+            return False, None
+
+        self.hits = self.hits + 1
+        return True, (np.nan if row[0] is None else row[0])
+
+    def put(self, ID, z):
+        """ Stores redshift z of ID.
+        """
+        z = None if np.isnan(z) else float(z)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO redshifts (ID, z, time) VALUES (?, ?, ?)",
+            (self.normalize(ID), z, time.time()))
+        self.connection.commit()
+
+    def evict(self):
+        """ Removes all expired entries and returns how many were removed.
+        """
+        cursor = self.connection.execute("DELETE FROM redshifts WHERE time < ?",
+                                         (time.time()-self.ttl,))
+        self.connection.commit()
+        return cursor.rowcount
+
+    def query(self, ID):
+        """ Returns the redshift of ID, from the cache or else from NED.
+        """
+        found, z = self.get(ID)
+        if found:
+            return z
+        if self.offline:
+            raise KeyError("Error... "+str(ID)+" is not in the NED cache (offline mode).")
+
+        z = _query_ned_redshift(ID)
+        self.put(ID, z)
+        return z
+
+
+def _query_ned_redshift(ID):
+    """ Queries NED for the redshift of ID. Returns NaN if NED has none.
+    """
+    from astroquery.ned import Ned
+
+    result_table = Ned.query_object(ID)
+    z_ned = result_table['Redshift'][0]
+    if np.ma.is_masked(z_ned):
+        return np.nan
+
+    return float(z_ned)
+
+
+def get_ned_cache():
+    """ Returns the module-wide NedCache, which is opened on first use.
+    """
+    global ned_cache
+    if ned_cache is None:
+        ned_cache = NedCache(offline=ned_offline)
+
+    return ned_cache
+
+
+class _TokenBucket(object):
+    """ Thread-safe token bucket allowing rate acquisitions per second, with
+        bursts of up to capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if capacity is None:
+            capacity = max(1., rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Blocks until a token is available and takes it.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now-self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1.:
+                    self.tokens = self.tokens - 1.
+                    return
+                wait_time = (1.-self.tokens)/self.rate
+            time.sleep(wait_time)
+
+
+def _is_permanent_ned_error(error):
+    """ Returns True if the RemoteServiceError error will not go away on a
+        retry (see ned_permanent_errors).
+    """
+    message = str(error).lower()
+
+    return any(x.lower() in message for x in ned_permanent_errors)
+
+
+def _query_ned_with_retry(query, ID, bucket, max_retries, backoff):
+    """ Calls query(ID) under the rate limit of bucket, retrying up to
+        max_retries times on RemoteServiceError. Returns NaN for names NED
+        does not know, which are not retried.
+    """
+    from astroquery.exceptions import RemoteServiceError
+
+    for attempt in range(max_retries+1):
+        bucket.acquire()
+        try:
+            return query(ID)
+        except RemoteServiceError as error:
+            if _is_permanent_ned_error(error):
+                print("Warning... "+str(ID)+" is not known to NED.")
+                return np.nan
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff*2**attempt)
+
+
+def resolve_redshifts(IDs, IDs_fallback=None, cache=None, query=None,
+                      max_workers=None, rate=None, preamble=None):
+    """ Returns the NED redshifts of IDs, in the same order.
+
+        Cached redshifts are taken from cache (default: get_ned_cache()). The
+        remaining IDs are queried concurrently in a pool of max_workers
+        threads, rate-limited to rate queries per second. If IDs_fallback is
+        given, a source without a redshift under IDs[i] is looked up under
+        IDs_fallback[i] as soon as its first lookup returns, while the other
+        lookups continue. query(ID) does the actual lookup (default:
+        _query_ned_redshift), which allows resolving against a fake NED.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    if cache is None:
+        cache = get_ned_cache()
+    if query is None:
+        query = _query_ned_redshift
+    if max_workers is None:
+        max_workers = ned_max_workers
+    if rate is None:
+        rate = ned_rate
+
+    IDs = list(IDs)
+    if IDs_fallback is not None:
+        IDs_fallback = list(IDs_fallback)
+    N = len(IDs)
+    z = [np.nan]*N
+    bucket = _TokenBucket(rate)
+    pending = {}
+    done = [0]
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def finish(i, stage, z_i):
+        # No redshift for the primary ID: look up the fallback ID
+        if stage == 0 and IDs_fallback is not None and not(z_i > -1):
+            lookup(i, 1)
+            return
+        z[i] = z_i
+        done[0] = done[0] + 1
+        if preamble is not None:
+            _progressBar(preamble, done[0], N)
+
+    def lookup(i, stage):
+        ID = IDs[i] if stage == 0 else IDs_fallback[i]
+        # The cache is only accessed from this thread
+        found, z_i = cache.get(ID)
+        if found:
+            finish(i, stage, z_i)
+        elif cache.offline:
+            raise KeyError("Error... "+str(ID)+" is not in the NED cache (offline mode).")
+        else:
+            future = pool.submit(_query_ned_with_retry, query, ID, bucket,
+                                 ned_max_retries, ned_backoff)
+            pending[future] = (i, stage, ID)
+
+    try:
+        for i in range(N):
+            lookup(i, 0)
+
+        while len(pending) > 0:
+            finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in finished:
+                i, stage, ID = pending.pop(future)
+                z_i = future.result()
+                cache.put(ID, z_i)
+                finish(i, stage, z_i)
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+    if preamble is not None:
+        print("\nNED cache: {0:d} hits, {1:d} misses".format(cache.hits, cache.misses))
+
+    return z
+
+
+_d_L_grids = {}
+
+
+def _flat_lambda_cdm(params):
+    """ Returns the FlatLambdaCDM of a cosmology parameter dictionary.
+    """
+    from astropy.cosmology import FlatLambdaCDM
+
+    return FlatLambdaCDM(H0=100.*params['h'], Om0=params['omega_M_0'],
+                         Tcmb0=params['Tcmb0'])
+
+
+def _d_L_grid(params):
+    """ Returns log(d_L/Mpc) on log_z_grid for the flat cosmology params,
+        which is computed once per cosmology.
+    """
+    global log_z_grid
+    if log_z_grid is None:
+        log_z_grid = np.linspace(np.log(1.E-6), np.log(20.), 4000)
+
+    key = (params['h'], params['omega_M_0'], params['Tcmb0'])
+    if key not in _d_L_grids:
+        d_L_grid = _flat_lambda_cdm(params).luminosity_distance(np.exp(log_z_grid))
+        _d_L_grids[key] = np.log(d_L_grid.value)
+
+    return _d_L_grids[key]
+
+
+def luminosity_distance(z, params):
+    """ Returns the luminosity distances [Mpc] at redshifts z in the flat
+        cosmology params.
+
+        d_L(z) is tabulated once per cosmology on log_z_grid and interpolated
+        in log-log space. Redshifts outside the grid are computed directly.
+    """
+    log_d_L_grid = _d_L_grid(params)
+
+    z = np.atleast_1d(np.asarray(z, dtype=float))
+    d_L = np.full(z.shape, np.nan)
+
+    inside = (z >= np.exp(log_z_grid[0])) & (z <= np.exp(log_z_grid[-1]))
+    d_L[inside] = np.exp(np.interp(np.log(z[inside]), log_z_grid, log_d_L_grid))
+
+    outside = ~inside & ~np.isnan(z)
+    if outside.any():
+        d_L[outside] = _flat_lambda_cdm(params).luminosity_distance(z[outside]).value
+
+    return d_L
+
+
+def redshift_at_distance(d_L, params):
+    """ Returns the redshifts at luminosity distances d_L [Mpc] in the flat
+        cosmology params.
+
+        d_L(z) is monotone, so z is first interpolated from the log-log grid
+        of luminosity_distance and then refined with one Newton step on the
+        exact d_L(z), using d(d_L)/dz = d_L/(1+z) + (1+z)*D_H/E(z).
+        Distances outside the grid are solved directly with z_at_value.
+    """
+    from astropy.cosmology import z_at_value
+    from astropy import units as u
+
+    log_d_L_grid = _d_L_grid(params)
+    cosmo = _flat_lambda_cdm(params)
+
+    d_L = np.atleast_1d(np.asarray(d_L, dtype=float))
+    z = np.full(d_L.shape, np.nan)
+
+    inside = (d_L >= np.exp(log_d_L_grid[0])) & (d_L <= np.exp(log_d_L_grid[-1]))
+    if inside.any():
+        z0 = np.exp(np.interp(np.log(d_L[inside]), log_d_L_grid, log_z_grid))
+        d_L0 = cosmo.luminosity_distance(z0).value
+        derivative = d_L0/(1.+z0) + (1.+z0)*cosmo.hubble_distance.value/cosmo.efunc(z0)
+        z[inside] = z0 - (d_L0-d_L[inside])/derivative
+
+    for i in np.where(~inside & (d_L > 0))[0]:
+        z[i] = z_at_value(cosmo.luminosity_distance, d_L[i]*u.Mpc,
+                          zmax=np.exp(log_z_grid[-1])*10.)
+
+    return z
+
+
+def cosmology_correction(z, params):
+    """ Returns the factors (d_L/d_L_params)^2 that convert luminosities at
+        redshifts z from cosmology params to the standard cosmology
+        (cosmo_params).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (luminosity_distance(z, cosmo_params)/luminosity_distance(z, params))**2.
+
+
+_si2jansky_factors = {}
+
+
+def si2jansky(SdV, transition):
+    """ Converts the line fluxes SdV [W m^-2] of a transition to [Jy km/s].
+
+        line_flux_conversion is linear in the flux, so its factor for each
+        transition is computed once from freq[transition] and stored, and a
+        whole flux column is converted with one multiplication.
+    """
+    from trgpy.emg import line_flux_conversion
+    from trgpy.dictionary_transitions import freq
+
+    if transition not in _si2jansky_factors:
+        factor = line_flux_conversion(freq[transition], 1., conversion='si2jansky')[0]
+        _si2jansky_factors[transition] = float(np.squeeze(factor))
+
+    return np.asarray(SdV, dtype=float)*_si2jansky_factors[transition]
+
+
+def aperture_correct(table, corrections):
+    """ Aperture corrects the line fluxes of a table.
+
+        corrections maps each flux column to its beam factor: the name of a
+        column of the table (e.g. f_35 for L17), or a number or array of
+        factors per row (e.g. SECT corrections of extended sources). Positive
+        fluxes are divided by their factor in one masked division over all
+        columns; upper limits, ValUnDef and NaN are left as they are.
+    """
+    columns = list(corrections.keys())
+    SdV = table[columns].to_numpy(dtype=float)
+    factors = np.column_stack([table[factor].to_numpy(dtype=float) if isinstance(factor, str)
+                               else np.broadcast_to(np.asarray(factor, dtype=float), len(table))
+                               for factor in corrections.values()])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table[columns] = np.where(SdV > 0, SdV/factors, SdV)
+
+    return table
+
+
+def write_table(df, filename):
+    """ Writes a survey table to data_path as a Parquet file.
+
+        Numeric columns are stored as float64, with ValUnDef entries stored
+        as nulls, the ID columns as dictionary-encoded (categorical) strings,
+        and all other columns as strings, with missing entries (None or NaN,
+        e.g. empty cells of a raw table) stored as nulls. Empty strings are
+        kept.
+    """
+    arrays = []
+    for column in df.columns:
+        values = df[column]
+        numeric = pd.api.types.is_numeric_dtype(values) and \
+                  not pd.api.types.is_bool_dtype(values)
+        if values.dtype == object:
+            numeric = all(isinstance(x, (int, float, np.number)) and
+                          not isinstance(x, (bool, np.bool_)) for x in values)
+
+        if column in ('ID_RAW', 'ID', 'ID_ALT_RAW', 'ID_ALT'):
+            array = pa.array([str(x) for x in values],
+                             type=pa.string()).dictionary_encode()
+        elif numeric:
+            values = values.values.astype(np.float64)
+            array = pa.array(values, mask=(values == ValUnDef), type=pa.float64())
+        else:
+            array = pa.array([None if x is None or (isinstance(x, float) and math.isnan(x))
+                              else str(x) for x in values], type=pa.string())
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=[str(x) for x in df.columns])
+    pq.write_table(table, data_path+filename)
+
+
+def read_table(filename, columns=None, fill_value=None):
+    """ Reads a survey table written by write_table from data_path.
+
+        Only the given columns are read, from a memory-mapped file. Null
+        entries are returned as NaN, or as fill_value in the numeric columns
+        if given (e.g. ValUnDef). In string columns they are returned as None
+        (whether they were None or NaN when written), so parsers of string
+        columns must handle None (see parse_line_fluxes).
+    """
+    table = pq.read_table(data_path+filename, columns=columns, memory_map=True)
+
+    return _fill_nulls(table, fill_value).to_pandas()
+
+
+def _fill_nulls(table, fill_value=None):
+    """ Returns the Arrow table with the nulls of its floating point columns
+        replaced by fill_value (unchanged if fill_value is None).
+    """
+    if fill_value is not None:
+        for k, field in enumerate(table.schema):
+            if pa.types.is_floating(field.type):
+                table = table.set_column(k, field,
+                                         pc.fill_null(table.column(k), float(fill_value)))
+
+    return table
+
+
+def _split_fields(line, delimiter):
+    """ Splits a line of a raw data table into fields (on whitespace if
+        delimiter is None).
+    """
+    if delimiter is None:
+        return line.split()
+    return line.split(delimiter)
+
+
+def _is_rule(line):
+    """ Whether a (stripped) line is a rule, e.g. ------|----- or ========.
+    """
+    return len(line) > 0 and set(line) <= set('-=|&+ \t') and \
+           ('-' in line or '=' in line)
+
+
+def _is_data_row(fields, n_fields, typed):
+    """ Whether the fields of a line can be a data row: there are at least
+        n_fields of them, they are not column numbers (1, 2, ... or (1),
+        (2), ...), and the typed fields, as (field index, type), parse or are
+        null.
+    """
+    if len(fields) < n_fields:
+        return False
+
+    values = [x.strip() for x in fields]
+    numbers = [str(k) for k in range(1, len(values)+1)]
+    if values == numbers or values == ['('+k+')' for k in numbers]:
+        return False
+
+    for k, dtype in typed:
+        if values[k] in raw_null_values:
+            continue
+        try:
+            dtype(values[k])
+        except ValueError:
+            return False
+
+    return True
+
+
+def _header_length(filename, delimiter, n_fields, typed):
+    """ Returns the number of lines in front of the first data row of a raw
+        data table, streaming the file only up to there.
+
+        Blank lines, VizieR comments (#) and LaTeX lines (\\colhead, %) are
+        header lines, as are the lines up to a rule. Of the other lines, the
+        first one that can be a data row (see _is_data_row) starts the data,
+        unless a rule follows within header_lookahead lines (in which case it
+        was a line of column heads, as in VizieR tables).
+    """
+    start = None
+    with open(filename, encoding='utf-8', errors='replace') as f:
+        for k, line in enumerate(f):
+            line = line.strip()
+            if start is not None and k - start > header_lookahead:
+                break
+            if _is_rule(line):
+                start = None
+            elif start is None and len(line) > 0 and line[0] not in '#%\\':
+                if _is_data_row(_split_fields(line, delimiter), n_fields, typed):
+                    start = k
+
+    if start is None:
+        print("Error... no data rows found in "+filename+".")
+        start = 0
+
+    return start
+
+
+def _apply_schema(table, schema):
+    """ Casts the columns of a raw data table to the types of schema, with
+        raw_null_values as NaN.
+    """
+    for name, dtype in schema.items():
+        if table[name].dtype == object:
+            values = table[name].astype(str).str.strip()
+            table[name] = values.mask(values.isin(raw_null_values)).astype(dtype)
+        else:
+            table[name] = table[name].astype(dtype)
+
+    return table
+
+
+def read_raw_table(filename, names, delimiter='&', usecols=None, schema=None,
+                   chunksize=None, **kwargs):
+    """ Reads a raw data table (AAS/LaTeX & table, VizieR | table, or
+        whitespace separated if delimiter is None) from data_path.
+
+        The header is detected (see _header_length), so no number of rows to
+        skip is needed. schema maps column names to types, e.g. {'z': float}:
+        the first data row must parse as these types, and the columns are
+        cast to them. Returns a DataFrame, or, for a chunksize, an iterator
+        over DataFrames of chunksize rows so large tables can be read in
+        bounded memory. Other arguments are passed on to pd.read_csv.
+    """
+    if schema is None:
+        schema = {}
+    columns = list(usecols) if usecols is not None else list(range(0, len(names)))
+    typed = [(columns[names.index(name)], dtype) for name, dtype in schema.items()]
+    skiprows = _header_length(data_path+filename, delimiter, max(columns)+1, typed)
+
+    if delimiter is None:
+        kwargs['delim_whitespace'] = True
+    else:
+        kwargs['sep'] = delimiter
+    reader = pd.read_csv(data_path+filename, skiprows=skiprows, names=names,
+                         usecols=usecols, chunksize=chunksize, **kwargs)
+    if chunksize is None:
+        return _apply_schema(reader, schema)
+
+    return (_apply_schema(chunk, schema) for chunk in reader)
+
+
 def make_pickle_A09():
-    """ Creates A09 pkl file.
+    """ Creates A09 Parquet file.
     """
 
     # --- Read in source ID_RAW and ID_ALT_RAW from A09 ---
-    table = pd.read_csv(data_path+table1_name_A09, skiprows=33, delimiter='&',
-            skipinitialspace=True, names=['ID_RAW', 'ID_ALT_RAW', 'LIR_8_1000'],
-            usecols=[0,1,6])
+    table = read_raw_table(table1_name_A09, skipinitialspace=True,
+            names=['ID_RAW', 'ID_ALT_RAW', 'LIR_8_1000'], usecols=[0,1,6])
 
 
     # Make sure ID_ALT_RAW is str type (if not, can be issues with NaN)
@@ -583,20 +1979,9 @@ def make_pickle_A09():
     table = remove_extended_sources(table)
     # -------------------------------
 
-    # --- Query NED for redshifts ---
-    z = []
-    for i in np.arange(0,len(table.ID_RAW)):
-        result_table = Ned.query_object(table.ID_RAW[i])
-        z_ned=result_table['Redshift']
-        if z_ned > -1:
-            z.append(z_ned[0])
-        else:
-            ID = table.ID[i]
-            result_table = Ned.query_object(ID)
-            z_ned=result_table['Redshift']
-            z.append(z_ned[0])
-
-        _progressBar("Armus+09 sample: ", i, len(table.ID))
+    # --- Query NED for redshifts (ID_RAW, else ID) ---
+    z = resolve_redshifts(table.ID_RAW, IDs_fallback=table.ID,
+                          preamble="Armus+09 sample: ")
     # -------------------------------
 
     # --- Fix LIR and convert to standard cosmology ---
@@ -615,18 +2000,18 @@ def make_pickle_A09():
     df = pd.DataFrame({'ID_RAW': table.ID_RAW, 'ID_ALT_RAW': table.ID_ALT_RAW,
         'ID': table.ID, 'ID_ALT': table.ID_ALT, 'z': z, 'LIR_8_1000':
         table.LIR_8_1000})
-    df.to_pickle(data_path+'Armus-et-al-2009.pkl')
+    write_table(df, 'Armus-et-al-2009.parquet')
     # -------------------
 
 
 def make_pickle_G14():
-    """ Creates G14 pkl file.
+    """ Creates G14 Parquet file.
     """
 
     # --- Read in source ID_RAW and ID_ALT_RAW from A09 ---
-    table = pd.read_csv(data_path+table_name_G14, skiprows=1,
-            delim_whitespace=True,skipinitialspace=True,
-            names=['ID_RAW', 'z','LIR_50_300', 'LIR_8_1000'])
+    table = read_raw_table(table_name_G14, delimiter=None,
+            skipinitialspace=True, names=['ID_RAW', 'z','LIR_50_300', 'LIR_8_1000'],
+            schema={'z': float})
     # -----------------------------------------------------
 
     # --- Map (ID_RAW, ID_ALT_RAW) to (ID) ---
@@ -638,18 +2023,7 @@ def make_pickle_G14():
     # -------------------------------
 
     # --- Fix LIR and convert into standard cosmology ---
-    cosmo = FlatLambdaCDM(H0=100.*cosmo_params['h'],
-            Om0=cosmo_params['omega_M_0'], Tcmb0=cosmo_params['Tcmb0'])
-    d_L = cosmo.luminosity_distance(table.z)
-    d_L = d_L.value
-    cosmo_params_G14  = {'omega_M_0': 0.315, 'omega_lambda_0': 0.685,
-                  'omega_k_0': 0.0, 'h': 0.67, 'Tcmb0': 2.725}
-    cosmo_G14 = FlatLambdaCDM(H0=100.*cosmo_params_G14['h'],
-            Om0=cosmo_params_G14['omega_M_0'], Tcmb0=cosmo_params_G14['Tcmb0'])
-    d_L_G14 = cosmo_G14.luminosity_distance(table.z)
-    d_L_G14 = d_L_G14.value
-
-    correction_factor = (d_L/d_L_G14)**2.
+    correction_factor = cosmology_correction(table.z.values, cosmo_params_G14)
 
     table.loc[:,('LIR_8_1000')] = (10.**table.LIR_8_1000)*correction_factor
     table.loc[:,('LIR_50_300')] = (10.**table.LIR_50_300)*correction_factor
@@ -659,19 +2033,18 @@ def make_pickle_G14():
     df = pd.DataFrame({'ID_RAW': table.ID_RAW, 'ID': table.ID, 'z': table.z,
                        'LIR_50_300': table.LIR_50_300,
                        'LIR_8_1000': table.LIR_8_1000})
-    df.to_pickle(data_path+'Greve-et-al-2014.pkl')
+    write_table(df, 'Greve-et-al-2014.parquet')
     # -------------------
 
-    time.sleep(2)
     _progressBar("Greve+14 sample: ", 1, 1)
 
 
 def make_pickle_R15():
-    """ Creates R15 pkl file.
+    """ Creates R15 Parquet file.
     """
 
     # --- Read in Table 1 from Rosenberg+15 ---
-    table1 = pd.read_csv(data_path+table1_name_R15, skiprows=4, delimiter='&',
+    table1 = read_raw_table(table1_name_R15, schema={'z': float},
                          skipinitialspace=True, names=['ID_RAW', 'logIR_8_1000',
                                                        'FIR', 'z', 'DL',
                                                        'FWHM_CO10',
@@ -693,7 +2066,7 @@ def make_pickle_R15():
 
 
     # --- Read in Table 2 from Rosenberg+15 ---
-    table2 = pd.read_csv(data_path+table2_name_R15, skiprows=20, delimiter='&',
+    table2 = read_raw_table(table2_name_R15,
             skipinitialspace=True, names=['ID_RAW', 'SdV_CO43', 'SdV_CO54',
                 'SdV_CO65', 'SdV_CO76', 'SdV_CO87', 'SdV_CO98', 'SdV_CO109',
                 'SdV_CO1110', 'SdV_CO1211', 'SdV_CO1312', 'SdV_CI609',
@@ -717,7 +2090,7 @@ def make_pickle_R15():
 
 
     # --- Read in Table 3 from Rosenberg+15 ---
-    table3 = pd.read_csv(data_path+table3_name_R15, skiprows=12, delimiter='&',
+    table3 = read_raw_table(table3_name_R15, schema={'Beam_CO10': float},
                          skipinitialspace=True, names=['ID_RAW', 'SdV_CO10',
                                                        'Beam_CO10',
                                                        'Reference_CO10',
@@ -753,21 +2126,20 @@ def make_pickle_R15():
         table2.SdV_CI609, 'SdV_CI370': table2.SdV_CI370, 'SdV_OI63':
         table2.SdV_OI63, 'SdV_OI145': table2.SdV_OI145, 'SdV_CII158':
         table2.SdV_CII158})
-    df.to_pickle(data_path+'Rosenberg-et-al-2015.pkl')
+    write_table(df, 'Rosenberg-et-al-2015.parquet')
     # -------------------
 
-    time.sleep(2)
     _progressBar("Rosenberg+15 sample: ", 1, 1)
 
 
 def make_pickle_I15():
-    """ Creates I15 pkl file.
+    """ Creates I15 Parquet file.
     """
 
     _progressBar("Israel+15 sample: ", 0, 5)
 
     # --- Read in Table 1 from Israel+15 ---
-    table1 = pd.read_csv(data_path+table1_name_I15, skiprows=3, delimiter='&',
+    table1 = read_raw_table(table1_name_I15, schema={'DL': float},
                          skipinitialspace=True, names=['ID_RAW', 'VLSR',
                                                        'DL', 'LIR_8_1000'],
                          usecols=[0,3,4,6])
@@ -780,23 +2152,11 @@ def make_pickle_I15():
     # --------------------------------------------
 
     # --- Get redshift for given DL ---
-    cosmo_params_I15  = {'omega_M_0': 0.27, 'omega_lambda_0': 0.73,
-            'omega_k_0': 0.0, 'h': 0.73, 'Tcmb0': 2.73}
-    cosmo_I15 = FlatLambdaCDM(H0=100.*cosmo_params_I15['h'],
-            Om0=cosmo_params_I15['omega_M_0'], Tcmb0=cosmo_params_I15['Tcmb0'])
-    z = np.ones(len(table1.DL))
-    for i in np.arange(0,len(table1.DL)):
-        z[i] = z_at_value(cosmo_I15.luminosity_distance, table1.DL.values[i]*u.Mpc, zmax=1.0)
+    z = redshift_at_distance(table1.DL.values, cosmo_params_I15)
     # ---------------------------------
 
     # --- Fix LIR and convert into standard cosmology ---
-    cosmo = FlatLambdaCDM(H0=100.*cosmo_params['h'],
-            Om0=cosmo_params['omega_M_0'], Tcmb0=cosmo_params['Tcmb0'])
-    d_L = cosmo.luminosity_distance(z)
-
-    d_L_I15 =cosmo_I15.luminosity_distance(z)
-
-    correction_factor = (d_L/d_L_I15)**2.
+    correction_factor = cosmology_correction(z, cosmo_params_I15)
 
     table1.loc[:,('LIR_8_1000')] = (10.**table1.LIR_8_1000)*correction_factor
     # ---------------------------------------------------
@@ -804,7 +2164,7 @@ def make_pickle_I15():
 
 
     # --- Read in Table 2 from Israel+15 ---
-    table2 = pd.read_csv(data_path+table2_name_I15, skiprows=18, delimiter='&',
+    table2 = read_raw_table(table2_name_I15,
                          skipinitialspace=True, names=['ID_RAW', 'SdV_CO43',
                                                        'SdV_CO76', 'SdV_CI609',
                                                        'SdV_CI370', 'SdV_CO21',
@@ -865,7 +2225,7 @@ def make_pickle_I15():
     _progressBar("Israel+15 sample: ", 2, 5)
 
     # --- Read in Table 3 from Israel+15 ---
-    table3 = pd.read_csv(data_path+table3_name_I15, skiprows=18, delimiter='&',
+    table3 = read_raw_table(table3_name_I15,
                          skipinitialspace=True, names=['ID_RAW', 'SdV_CO43',
                                                        'SdV_CO76', 'SdV_CI609',
                                                        'SdV_CI370', 'SdV_CO21',
@@ -920,7 +2280,7 @@ def make_pickle_I15():
     _progressBar("Israel+15 sample: ", 3, 5)
 
     # --- Read in Table 4 from Israel+15 ---
-    table4 = pd.read_csv(data_path+table4_name_I15, skiprows=19, delimiter='&',
+    table4 = read_raw_table(table4_name_I15,
                          skipinitialspace=True, names=['ID_RAW', 'SdV_CO43',
                                                        'SdV_CO76', 'SdV_CI609',
                                                        'SdV_CI370', 'SdV_CO21',
@@ -984,7 +2344,7 @@ def make_pickle_I15():
     _progressBar("Israel+15 sample: ", 4, 5)
 
     # --- Read in Table 5 from Israel+15 ---
-    table5 = pd.read_csv(data_path+table5_name_I15, skiprows=17, delimiter='&',
+    table5 = read_raw_table(table5_name_I15,
                          skipinitialspace=True, names=['ID_RAW', 'SdV_CO43',
                                                        'SdV_CO76', 'SdV_CI609',
                                                        'SdV_CI370', 'SdV_CO21',
@@ -1048,7 +2408,7 @@ def make_pickle_I15():
     df = pd.DataFrame({'ID_RAW': table1.ID_RAW, 'ID_ALT_RAW': table1.ID_ALT_RAW,
                        'ID': table1.ID, 'ID_ALT': table1.ID_ALT, 'z': z,
                        'LIR_8_1000': table1.LIR_8_1000})
-    df.to_pickle(data_path+'Israel-et-al-2015-Table-1.pkl')
+    write_table(df, 'Israel-et-al-2015-Table-1.parquet')
     # ----------------------
     # --- Pickle Table 2 ---
     df = pd.DataFrame({'ID_RAW': table2.ID_RAW,
@@ -1067,7 +2427,7 @@ def make_pickle_I15():
                        'eSdV_CI370': table2.eSdV_CI370,
                        'eSdV_CO21': table2.eSdV_CO21,
                        'eSdV_13CO21': table2.eSdV_13CO21})
-    df.to_pickle(data_path+'Israel-et-al-2015-Table-2.pkl')
+    write_table(df, 'Israel-et-al-2015-Table-2.parquet')
     # ----------------------
     # --- Pickle Table 3 ---
     df = pd.DataFrame({'ID_RAW': table3.ID_RAW,
@@ -1086,7 +2446,7 @@ def make_pickle_I15():
                        'eSdV_CI370': table3.eSdV_CI370,
                        'eSdV_CO21': table3.eSdV_CO21,
                        'eSdV_13CO21': table3.eSdV_13CO21})
-    df.to_pickle(data_path+'Israel-et-al-2015-Table-3.pkl')
+    write_table(df, 'Israel-et-al-2015-Table-3.parquet')
     # ----------------------
     # --- Pickle Table 4 ---
     df = pd.DataFrame({'ID_RAW': table4.ID_RAW,
@@ -1105,7 +2465,7 @@ def make_pickle_I15():
                        'eSdV_CI370': table4.eSdV_CI370,
                        'eSdV_CO21': table4.eSdV_CO21,
                        'eSdV_13CO21': table4.eSdV_13CO21})
-    df.to_pickle(data_path+'Israel-et-al-2015-Table-4.pkl')
+    write_table(df, 'Israel-et-al-2015-Table-4.parquet')
     # ----------------------
     # --- Pickle Table 5 ---
     df = pd.DataFrame({'ID_RAW': table5.ID_RAW,
@@ -1124,18 +2484,18 @@ def make_pickle_I15():
                        'eSdV_CI370': table5.eSdV_CI370,
                        'eSdV_CO21': table5.eSdV_CO21,
                        'eSdV_13CO21': table5.eSdV_13CO21})
-    df.to_pickle(data_path+'Israel-et-al-2015-Table-5.pkl')
+    write_table(df, 'Israel-et-al-2015-Table-5.parquet')
     # ----------------------
 
 
 
 def make_pickle_K16():
-    """ Creates K16 pkl file.
+    """ Creates K16 Parquet file.
     """
 
     # === Table 1
     # --- Read in Table 1 from Kamenetzky+16 ---
-    table1 = pd.read_csv(data_path+table1_name_K16,skiprows=1, sep='|',
+    table1 = read_raw_table(table1_name_K16, delimiter='|', schema={'z': float},
                          skipinitialspace=True, names=['ID_RAW','LIR_40_120','DL','z'])
 
     # Calculate LIR_40_120
@@ -1152,7 +2512,7 @@ def make_pickle_K16():
 
     # === Table 2
     # --- Read in raw Table 2 from Kamenetzky+16 ---
-    table2 = pd.read_csv(data_path+table2_name_K16, skiprows=45, sep='|',
+    table2 = read_raw_table(table2_name_K16, delimiter='|', schema={'SdV': float},
                              skipinitialspace=True, names=['ID_RAW','transition',
                                                            'resolved','SdV',
                                                            'SdV_1sigma_low',
@@ -1169,25 +2529,18 @@ def make_pickle_K16():
     # ----------------------------------------------
 
     # --- Fix transition identification ---
-    i=0
-    for transition in table2.transition:
-        if 'CO' in transition:
-            front = '12'+transition[transition.find('CO'):transition.find('CO')+2]
-            tail = transition[transition.find('CO')+2:]
-            transition = front+'('+tail+')'
-            table2.loc[i,'transition'] = transition
-        if 'CI1' in transition:
-            table2.loc[i,'transition'] = '[CI]609'
-        if 'CI2' in transition:
-            table2.loc[i,'transition'] = '[CI]370'
-        if 'NII' in transition:
-            table2.loc[i,'transition'] = '[NII]205'
-        i=i+1
+    transition = table2.transition
+    is_CO = transition.str.contains('CO')
+    transition = transition.where(~is_CO, '12CO('+transition.str.split('CO', n=1).str[1]+')')
+    transition = transition.mask(transition.str.contains('CI1'), '[CI]609')
+    transition = transition.mask(transition.str.contains('CI2'), '[CI]370')
+    transition = transition.mask(transition.str.contains('NII'), '[NII]205')
+    table2.transition = transition
     # -------------------------------------
 
     # === Table 3
     # --- read in raw Table 3 .tsv file with line data (Jy km/s units)
-    table3 = pd.read_csv(data_path+table3_name_K16, skiprows=49,sep='|',
+    table3 = read_raw_table(table3_name_K16, delimiter='|',
             skipinitialspace=True,names=['ID_RAW','transition','Rflux','sigmam','sigmac',
                 'x_RFlux', 'dv','Omegab','SdV','eSdV','r_RFlux'])
 
@@ -1204,22 +2557,12 @@ def make_pickle_K16():
     # -------------------------------------
 
     # --- Fix transition identification ---
-    table3["transition"] = table3["transition"].astype(str)
-    i=0
-    for transition in table3.transition:
-        if '1' in transition:
-            table3.loc[i,'transition'] = "12CO(1-0)"
-        if '2' in transition:
-            table3.loc[i,'transition'] = "12CO(2-1)"
-        if '3' in transition:
-            table3.loc[i,'transition'] = "12CO(3-2)"
-        if '4' in transition:
-            table3.loc[i,'transition'] = "12CO(4-3)"
-        if '6' in transition:
-            table3.loc[i,'transition'] = "12CO(6-5)"
-        if '7' in transition:
-            table3.loc[i,'transition'] = "12CO(7-6)"
-        i=i+1
+    # (the last J_up found in the transition wins)
+    transition = table3["transition"].astype(str)
+    table3["transition"] = transition
+    for J_up, name in [('1', "12CO(1-0)"), ('2', "12CO(2-1)"), ('3', "12CO(3-2)"),
+                       ('4', "12CO(4-3)"), ('6', "12CO(6-5)"), ('7', "12CO(7-6)")]:
+        table3.loc[transition.str.contains(J_up).values, 'transition'] = name
     # -------------------------------------
 
     # Remove rows with SdV = NaN
@@ -1228,7 +2571,7 @@ def make_pickle_K16():
     # -------------------------------------
 
 
-    # --- Commit CO(4-3) --> CO(13-12) to db ---
+    # --- Line fluxes for Table 1 ---
     transitions = ['1-0','2-1','3-2','4-3','5-4','6-5','7-6','8-7','9-8','10-9','11-10','12-11',
                    '13-12']
     transitions = ['12CO(' + s + ')' for s in transitions]
@@ -1238,74 +2581,47 @@ def make_pickle_K16():
     entries = ['CO' + s for s in entries]
     entries = entries + ['CI609','CI370','NII205']
 
-    q=0
-    for transition in transitions:
-        if q < 3:
-            table1['SdV_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-            table1['eSdV_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-            table1['SdV_3sigmaUL_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-
-            # Extract entries or transition
-            foo = table3[table3.transition == transition]
-            foo.reset_index(drop=True)
-            foo["SdV"] = foo["SdV"].astype(float)
-            foo["eSdV"] = foo["eSdV"].astype(float)
-
-            i=0
-            for ID in table1.ID:
-                indices_ID = [k for k,x in enumerate(foo.ID) if x == ID]
-                if len(indices_ID) == 1:
-                    SdV = foo.SdV.iloc[indices_ID[0]]
-                    eSdV = foo.eSdV.iloc[indices_ID[0]]
-
-                    # Only add valid values to pickle file (otherwise ValUnDef)
-                    if SdV > 0:
-                        table1.loc[i, ('SdV_'+entries[q])] = SdV
-                    if eSdV > 0:
-                        table1.loc[i, ('eSdV_'+entries[q])] = eSdV
-                if len(indices_ID) > 1:
-                    bar = foo.iloc[indices_ID]
-                    SdV = np.mean(bar.SdV) #NaN values do not affect the mean
-                    eSdV = np.std(bar.SdV) #NaN values do not affect the std
-                    table1.loc[i, ('SdV_'+entries[q])] = SdV
-                    table1.loc[i, ('eSdV_'+entries[q])] = eSdV
-                i=i+1
-        else:
-            table1['SdV_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-            table1['eSdV_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-            table1['SdV_3sigmaUL_'+entries[q]] = table1.apply(lambda row: ValUnDef, axis=1)
-            foo = table2[table2.transition == transition]
-            N3 = len(foo)
-            for j in range(0, N3):
-                ID = foo.ID.iloc[j]
-                SdV = foo.SdV.iloc[j]
-
-                # Flux errors (e_high-e_low)/2
-                SdV_1sigma_low = foo.SdV_1sigma_low.iloc[j]
-                SdV_1sigma_high = foo.SdV_1sigma_high.iloc[j]
-                if SdV_1sigma_high == SdV_1sigma_low:
-                    eSdV = SdV
-                else:
-                    eSdV = (SdV_1sigma_high - SdV_1sigma_low)/2.
-
-                # Get upper limit
-                SdV_3sigma_ul = foo.SdV_3sigma_ul.iloc[j]
-
-                indices_ID = [k for k,x in enumerate(table1.ID) if x == ID]
-                if len(indices_ID) > 0:
-                    if SdV > 0:
-                        table1.loc[indices_ID, ('SdV_'+entries[q])] = SdV
-                    if eSdV > 0:
-                        table1.loc[indices_ID, ('eSdV_'+entries[q])] = eSdV
-                    if SdV_3sigma_ul > 0:
-                        table1.loc[indices_ID, ('SdV_3sigmaUL_'+entries[q])] = SdV_3sigma_ul
-                else:
-                    print("Error...")
-        q=q+1
-
-
-    # Replacing all occurences of NaN to -999
-    table1 = table1.replace('NaN', str(ValUnDef))
+    # CO(1-0) --> CO(3-2) from Table 3: a single pointing is used if its
+    # fluxes are positive, multiple pointings are combined into their mean
+    # and std (NaN values do not affect the mean and std).
+    foo = table3[table3.transition.isin(transitions[0:3])].copy()
+    foo["SdV"] = foo["SdV"].astype(float)
+    foo["eSdV"] = foo["eSdV"].astype(float)
+    grouped = foo.groupby(['ID', 'transition'])
+    SdV = grouped.SdV.first()
+    eSdV = grouped.eSdV.first()
+    single = grouped.SdV.size() == 1
+    lines_3 = pd.DataFrame({
+        'SdV': SdV.where(SdV > 0, ValUnDef).where(single, grouped.SdV.mean()),
+        'eSdV': eSdV.where(eSdV > 0, ValUnDef).where(single, grouped.SdV.apply(lambda x: x.std(ddof=0))),
+        'SdV_3sigmaUL': ValUnDef})
+
+    # CO(4-3) --> CO(13-12), [CI] and [NII] from Table 2: the last positive
+    # flux, flux error (e_high-e_low)/2 and upper limit of each source
+    foo = table2[table2.transition.isin(transitions[3:])]
+    for ID in foo.ID[~foo.ID.isin(table1.ID)]:
+        print("Error... "+ID+" not in Table 1.")
+    eSdV = np.where(foo.SdV_1sigma_high == foo.SdV_1sigma_low, foo.SdV,
+                    (foo.SdV_1sigma_high - foo.SdV_1sigma_low)/2.)
+    eSdV = pd.Series(eSdV, index=foo.index)
+    lines_2 = pd.DataFrame({'ID': foo.ID, 'transition': foo.transition,
+                            'SdV': foo.SdV.where(foo.SdV > 0),
+                            'eSdV': eSdV.where(eSdV > 0),
+                            'SdV_3sigmaUL': foo.SdV_3sigma_ul.where(foo.SdV_3sigma_ul > 0)})
+    lines_2 = lines_2.groupby(['ID', 'transition']).last().fillna(ValUnDef)
+
+    # Pivot to one column per transition and align with Table 1 (ValUnDef
+    # where a source has no entry for a transition)
+    lines = pd.concat([lines_3, lines_2])
+    lines['N'] = 1
+    lines = lines.unstack('transition')
+    exists = lines['N'].reindex(index=table1.ID.values, columns=transitions).notna().values
+    for field in ['SdV', 'eSdV', 'SdV_3sigmaUL']:
+        values = lines[field].reindex(index=table1.ID.values, columns=transitions).values
+        values = np.where(exists, values, ValUnDef)
+        for q in range(0, len(transitions)):
+            table1[field+'_'+entries[q]] = values[:, q]
+    # -------------------------------
 
     # --- Pickle Table 1 ---
     df = pd.DataFrame({'ID_RAW': table1.ID_RAW,'ID': table1.ID, 'z': table1.z,
@@ -1342,15 +2658,15 @@ def make_pickle_K16():
         'SdV_3sigmaUL_CI609': table1.SdV_3sigmaUL_CI609,
         'SdV_3sigmaUL_CI370': table1.SdV_3sigmaUL_CI370,
         'SdV_3sigmaUL_NII205': table1.SdV_3sigmaUL_NII205})
-    df.to_pickle(data_path+'Kamenetzky-et-al-2016.pkl')
+    write_table(df, 'Kamenetzky-et-al-2016.parquet')
 
 
 def make_pickle_L17():
-    """ Creates L17 pkl file.
+    """ Creates L17 Parquet file.
     """
 
     # --- Read in Table 1 from Lu+17 ---
-    table1 = pd.read_csv(data_path+table1_name_L17, delimiter='&',
+    table1 = read_raw_table(table1_name_L17,
                          names=['ID_RAW','logLIR_8_1000','pair','C60', 'DL'],
                          usecols=[0,3,4,5,6])
 
@@ -1361,31 +2677,10 @@ def make_pickle_L17():
     table1 = remove_extended_sources(table1)
 
     # Query NED for redshifts
-    z = []
-    correction_factor = []
-    time.sleep(2)
-    for i in np.arange(0,len(table1.ID_RAW)):
-        ID = table1.ID[i]
-        result_table = Ned.query_object(ID)
-        z_NED=result_table['Redshift']
-        z.append(z_NED[0])
-        _progressBar("Lu+17 sample: ", i, len(table1.ID_RAW))
-
-        # Fix IR luminosities and rename column
-        cosmo = FlatLambdaCDM(H0=100.*cosmo_params['h'],
-                Om0=cosmo_params['omega_M_0'], Tcmb0=cosmo_params['Tcmb0'])
-        d_L = cosmo.luminosity_distance(z[i])
-        d_L = d_L.value
-
-        cosmo_params_L17  = {'omega_M_0': 0.3, 'omega_lambda_0': 0.7,
-                      'omega_k_0': 0.0, 'h': 0.70, 'Tcmb0': 2.725}
-        cosmo_L17 = FlatLambdaCDM(H0=100.*cosmo_params_L17['h'],
-                Om0=cosmo_params_L17['omega_M_0'], Tcmb0=cosmo_params_L17['Tcmb0'])
-        d_L_L17 = cosmo_L17.luminosity_distance(z[i])
-        d_L_L17 = d_L_L17.value
-
-        correction_factor.append((d_L/d_L_L17)**2.)
+    z = resolve_redshifts(table1.ID, preamble="Lu+17 sample: ")
 
+    # Fix IR luminosities and rename column
+    correction_factor = cosmology_correction(z, cosmo_params_L17)
 
     for i in np.arange(0,len(table1.ID_RAW)):
         try:
@@ -1404,7 +2699,7 @@ def make_pickle_L17():
 
 
     # --- Read in Table 4 from Lu+17 ---
-    table = pd.read_csv(data_path+table4_name_L17, delimiter='&', names=['ID_RAW','SdV_CO43','SdV_CO54','SdV_CO65','SdV_CO76','SdV_CO87','SdV_CO98','SdV_CO109','SdV_CO1110',
+    table = read_raw_table(table4_name_L17, names=['ID_RAW','SdV_CO43','SdV_CO54','SdV_CO65','SdV_CO76','SdV_CO87','SdV_CO98','SdV_CO109','SdV_CO1110',
                                                                          'SdV_CO1211','SdV_CO1312','SdV_CI609','SdV_CI370',
                                                                          'SdV_NII205','eSdV_CO43','eSdV_CO54','eSdV_CO65',
                                                                          'eSdV_CO76','eSdV_CO87','eSdV_CO98','eSdV_CO109',
@@ -1430,33 +2725,7 @@ def make_pickle_L17():
     #    z = [i for j,i in enumerate(z) if j not in indices]
 
     # Aperture correct line fluxes
-    for i in np.arange(0,len(table.ID_RAW)):
-        if table.SdV_CO43.loc[i] > 0:
-            table.loc[i,('SdV_CO43')] = table.SdV_CO43.loc[i]/table.f_35.loc[i]
-        if table.SdV_CI609.loc[i] > 0:
-            table.loc[i,('SdV_CI609')] = table.SdV_CI609.loc[i]/table.f_35.loc[i]
-        if table.SdV_CO54.loc[i] > 0:
-            table.loc[i,('SdV_CO54')] = table.SdV_CO54.loc[i]/table.f_35.loc[i]
-        if table.SdV_CO65.loc[i] > 0:
-            table.loc[i,('SdV_CO65')] = table.SdV_CO65.loc[i]/table.f_30.loc[i]
-        if table.SdV_CO76.loc[i] > 0:
-            table.loc[i,('SdV_CO76')] = table.SdV_CO76.loc[i]/table.f_35.loc[i]
-        if table.SdV_CI370.loc[i] > 0:
-            table.loc[i,('SdV_CI370')] = table.SdV_CI370.loc[i]/table.f_35.loc[i]
-        if table.SdV_CO87.loc[i] > 0:
-            table.loc[i,('SdV_CO87')] = table.SdV_CO87.loc[i]/table.f_35.loc[i]
-        if table.SdV_CO98.loc[i] > 0:
-            table.loc[i,('SdV_CO98')] = table.SdV_CO98.loc[i]/table.f_17.loc[i]
-        if table.SdV_CO109.loc[i] > 0:
-            table.loc[i,('SdV_CO109')] = table.SdV_CO109.loc[i]/table.f_17.loc[i]
-        if table.SdV_CO1110.loc[i] > 0:
-            table.loc[i,('SdV_CO1110')] = table.SdV_CO1110.loc[i]/table.f_17.loc[i]
-        if table.SdV_CO1211.loc[i] > 0:
-            table.loc[i,('SdV_CO1211')] = table.SdV_CO1211.loc[i]/table.f_17.loc[i]
-        if table.SdV_NII205.loc[i] > 0:
-            table.loc[i,('SdV_NII205')] = table.SdV_NII205.loc[i]/table.f_17.loc[i]
-        if table.SdV_CO1312.loc[i] > 0:
-            table.loc[i,('SdV_CO1312')] = table.SdV_CO1312.loc[i]/table.f_17.loc[i]
+    table = aperture_correct(table, aperture_corrections_L17)
     # -------------------------------------
 
     # --- Pickle data ---
@@ -1471,20 +2740,20 @@ def make_pickle_L17():
                        'eSdV_CO1110': table.eSdV_CO1110, 'eSdV_CO1211': table.eSdV_CO1211,
                        'eSdV_CO1312': table.eSdV_CO1312, 'eSdV_CI609': table.eSdV_CI609, 'eSdV_CI370': table.eSdV_CI370,
                        'eSdV_NII205': table.eSdV_NII205, 'f_35': table.f_35, 'f_30':table.f_30, 'f_17':table.f_17})
-    df.to_pickle(data_path+'Lu-et-al-2017.pkl')
+    write_table(df, 'Lu-et-al-2017.parquet')
     # -------------------
 
 
 #
 #
 def make_pickle_J17():
-    """ Creates J17 pkl file.
+    """ Creates J17 Parquet file.
     """
 
     # --- Read in Table 1 from Lu+17 ---
-    table1 = pd.read_csv(data_path+table1_name_J17, delimiter='&',
+    table1 = read_raw_table(table1_name_J17, schema={'z': float},
                          names=['ID_RAW','ICO10','eICO10','z'],
-                         usecols=[0,1,2,3], skiprows=2)
+                         usecols=[0,1,2,3])
 
     # Clean labels
     for i in np.arange(0,len(table1)):
@@ -1502,12 +2771,33 @@ def make_pickle_J17():
     # --- Pickle data ---
     df = pd.DataFrame({'ID_RAW': table1.ID_RAW, 'ID': table1.ID, 'ID_ALT': table1.ID_ALT,
         'ID_ALT_RAW': table1.ID_ALT_RAW, 'z':table1.z, 'SdV_CO10': table1.ICO10, 'eSdV_CO10': table1.eICO10})
-    df.to_pickle(data_path+'Jiao-et-al-2017.pkl')
+    write_table(df, 'Jiao-et-al-2017.parquet')
     # -------------------
 
 
 
+def _build_id_index(*columns):
+    """ Returns a dict mapping each name in the given ID columns (e.g. ID and
+        ID_ALT of one catalogue) to the first row it appears in.
+    """
+    index = {}
+    for column in columns:
+        for i, name in enumerate(column):
+            if name not in index:
+                index[name] = i
+
+    return index
+
+
 def make_master_list(verbose=True):
+    """ Cross-matches all samples and writes the master list (ID, z).
+
+        Samples are processed in order of priority (K16, L17, R15, G14, A09,
+        I15, J17). A source enters the master list from the first sample it
+        appears in; for samples with ID_ALT, the ID_ALT is used as master ID.
+        Sources are matched on ID and ID_ALT through one hash index per
+        sample, so the cross-match scales linearly with sample size.
+    """
 
     # --- Initializations ---
     source_counter = 0
@@ -1515,574 +2805,147 @@ def make_master_list(verbose=True):
     z_master = []
     # -----------------------
 
-    # --- Read in Armus-et-al-2009-table-1.pkl ---
-    table_A09 = pd.read_pickle(data_path+'Armus-et-al-2009.pkl')
-
-    id_A09 = table_A09.ID.values
-    id_alt_A09 = table_A09.ID_ALT.values
-    z_A09 = table_A09.z.values
-    print("Armus+09 sample size:", len(table_A09.ID_ALT))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Greve-et-al-2014-table-1.pkl ---
-    table_G14 = pd.read_pickle(data_path+'Greve-et-al-2014.pkl')
-
-    id_G14 = table_G14.ID.values
-    z_G14 = table_G14.z.values
-    print("Greve+14 sample size:", len(table_G14.ID))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Rosenberg-et-al-2015.pkl ---
-    table_R15 = pd.read_pickle(data_path+'Rosenberg-et-al-2015.pkl')
-
-    id_R15 = table_R15.ID.values
-    z_R15 = table_R15.z.values
-    print("Rosenberg+15 sample size:", len(table_R15.ID))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Israel-et-al-2015.pkl ---
-    table_I15 = pd.read_pickle(data_path+'Israel-et-al-2015-Table-1.pkl')
-
-    id_I15 = table_I15.ID.values
-    id_alt_I15 = table_I15.ID_ALT.values
-    z_I15 = table_I15.z.values
-    print("Israel+15 sample size:", len(table_I15.ID))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Kamenetzky-et-al-2016.pkl ---
-    table_K16 = pd.read_pickle(data_path+'Kamenetzky-et-al-2016-Table-1.pkl')
-
-    id_K16 = table_K16.ID.values
-    z_K16 = table_K16.z.values
-    print("Kamenetzky+16 sample size:", len(table_K16.ID))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Lu-et-al-2017.pkl ---
-    table_L17 = pd.read_pickle(data_path+'Lu-et-al-2017.pkl')
-
-    id_L17 = table_L17.ID.values
-    z_L17 = table_L17.z.values
-    print("Lu+17 sample size:", len(table_L17.ID))
-    print("")
-    # --------------------------------------------
-
-    # --- Read in Jiao-et-al-2017.pkl ---
-    table_J17 = pd.read_pickle(data_path+'Jiao-et-al-2017.pkl')
-
-    id_J17 = table_J17.ID.values
-    z_J17 = table_J17.z.values
-    print("Jiao+17 sample size:", len(table_J17.ID))
-    print("")
-    # --------------------------------------------
+    # --- Read in samples ---
+    # (label, description, Parquet file, has ID_ALT), in order of priority
+    samples = [('K16', 'Kamenetzky+16', 'Kamenetzky-et-al-2016.parquet', False),
+               ('L17', 'Lu+17', 'Lu-et-al-2017.parquet', False),
+               ('R15', 'Rosenberg+15', 'Rosenberg-et-al-2015.parquet', False),
+               ('G14', 'Greve+14', 'Greve-et-al-2014.parquet', False),
+               ('A09', 'Armus+09', 'Armus-et-al-2009.parquet', True),
+               ('I15', 'Israel+15', 'Israel-et-al-2015-Table-1.parquet', True),
+               ('J17', 'Jiao+17', 'Jiao-et-al-2017.parquet', True)]
+
+    tables = {}
+    indices = {}
+    for label, description, filename, has_alt in samples:
+        columns = ['ID', 'ID_ALT', 'z'] if has_alt else ['ID', 'z']
+        table = read_table(filename, columns=columns, fill_value=ValUnDef)
+        tables[label] = table
+        if has_alt:
+            indices[label] = _build_id_index(table.ID.values, table.ID_ALT.values)
+        else:
+            indices[label] = _build_id_index(table.ID.values)
+        print(description+" sample size:", len(table.ID))
+        print("")
+    # -----------------------
 
     # --- Output sources and sources overlaps ---
-    i = 0
+    labels = [sample[0] for sample in samples]
     if verbose:
-        print("{0:4s} {1:25s} {2:25s} {3:25s} {4:25s} {5:25s} {6:25s} {7:25s} {8:25s}\n".format('No', 'K16', 'L17', 'R15', 'G14', 'A09', 'I15', 'J17', 'z'))
-
-    # --- Loop through K16
-    i_z = 0
-    for name_K16 in id_K16:
-        output_str = name_K16
-
-        # Is name_K16 in L17?
-        indices = [i for i,x in enumerate(id_L17) if x == name_K16]
-        if len(indices) > 0:
-            foo = np.array(id_L17)[indices][0]
-        else:
-            foo = ''
-        output_str = "{0:4d} {1:25s} {2:25s}".format(source_counter, output_str, foo)
-
-
-        # Is name_K16 in R15?
-        indices = [i for i,x in enumerate(id_R15) if x == name_K16]
-        if len(indices) > 0:
-            foo = np.array(id_R15)[indices][0]
-        else:
-            foo = ''
-        output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-
-        # Is name_K16 in G14?
-        indices = [i for i,x in enumerate(id_G14) if x == name_K16]
-        if len(indices) > 0:
-            foo = np.array(id_G14)[indices][0]
-        else:
-            foo = ''
-        output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-
-        # Is name_K16 in A09?
-        indices = [i for i,x in enumerate(id_A09) if x == name_K16]
-        indices_alt = [i for i,x in enumerate(id_alt_A09) if x == name_K16]
-        # Yes, in .ID
-        if len(indices) > 0:
-            foo = np.array(id_A09)[indices][0]
-            id_alt_A09 = np.array(id_alt_A09)
-            id_alt_A09[indices] = name_K16
-            id_alt_A09 = list(id_alt_A09)
-        # Yes, in .ID_ALT
-        elif len(indices_alt) > 0:
-            foo = np.array(id_alt_A09)[indices_alt][0]
-            id_A09 = np.array(id_A09)
-            id_A09[indices_alt] = name_K16
-            id_A09 = list(id_A09)
-        else:
-            foo = ''
-        output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-        # Is name_K16 in I15?
-        indices = [i for i,x in enumerate(id_I15) if x == name_K16]
-        indices_alt = [i for i,x in enumerate(id_alt_I15) if x == name_K16]
-        if len(indices) > 0:
-            foo = np.array(id_I15)[indices][0]
-            id_alt_I15 = np.array(id_alt_I15)
-            id_alt_I15[indices] = name_K16
-            id_alt_I15 = list(id_alt_I15)
-        elif len(indices_alt) > 0:
-            foo = np.array(id_alt_I15)[indices_alt][0]
-            id_I15 = np.array(id_I15)
-            id_I15[indices_alt] = name_K16
-            id_I15 = list(id_I15)
-        else:
-            foo = ''
-        output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-        # Is name_K16 in J17?
-        indices = [i for i,x in enumerate(id_J17) if x == name_K16]
-        if len(indices) > 0:
-            foo = np.array(id_J17)[indices][0]
-        else:
-            foo = ''
-        output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-
-        # Add one to source_counter
-        source_counter = source_counter + 1
-        # Add name_K16 to ID_master
-        ID_master.append(name_K16)
-        # Add redshift to z_master
-        z_master.append(z_K16[i_z])
-        output_str = "{0:25s} {1:2.5f}".format(output_str, z_K16[i_z])
-
-        # Output
-        if verbose:
-            print(output_str)
-
-        i_z = i_z + 1
-
-
-    # --- Loop through L17
-    i_z = 0
-    for name_L17 in id_L17:
-        output_str = name_L17
-
-        # Is name_L17 in K16?
-        indices = [i for i,x in enumerate(id_K16) if x == name_L17]
-        if len(indices) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s}".format(source_counter, foo, output_str)
-
-            # Is name_L17 in R15?
-            indices = [i for i,x in enumerate(id_R15) if x == name_L17]
-            if len(indices) > 0:
-                foo = np.array(id_R15)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_L17 in G14?
-            indices = [i for i,x in enumerate(id_G14) if x == name_L17]
-            if len(indices) > 0:
-                foo = np.array(id_G14)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_L17 in A09?
-            indices = [i for i,x in enumerate(id_A09) if x == name_L17]
-            indices_alt = [i for i,x in enumerate(id_alt_A09) if x == name_L17]
-            if len(indices) > 0:
-                foo = np.array(id_A09)[indices][0]
-                id_alt_A09 = np.array(id_alt_A09)
-                id_alt_A09[indices] = name_L17
-                id_alt_A09 = list(id_alt_A09)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_A09)[indices_alt][0]
-                id_A09 = np.array(id_A09)
-                id_A09[indices_alt] = name_L17
-                id_A09 = list(id_A09)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_L17 in I15?
-            indices = [i for i,x in enumerate(id_I15) if x == name_L17]
-            indices_alt = [i for i,x in enumerate(id_alt_I15) if x == name_L17]
-            if len(indices) > 0:
-                foo = np.array(id_I15)[indices][0]
-                id_alt_I15 = np.array(id_alt_I15)
-                id_alt_I15[indices] = name_L17
-                id_alt_I15 = list(id_alt_I15)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_I15)[indices_alt][0]
-                id_I15 = np.array(id_I15)
-                id_I15[indices_alt] = name_L17
-                id_I15 = list(id_I15)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_L17 in J17?
-            indices = [i for i,x in enumerate(id_J17) if x == name_L17]
-            if len(indices) > 0:
-                foo = np.array(id_J17)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Add one to source_counter
-            source_counter = source_counter + 1
-            # Add name_L17 to ID_master if not in K16
-            ID_master.append(name_L17)
-            # Add redshift to z_master
-            z_master.append(z_L17[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_L17[i_z])
-
-            # Output
-            if verbose:
-                print( output_str)
-
-        i_z = i_z + 1
-
-
-    # --- Loop through R15
-    i_z = 0
-    for name_R15 in id_R15:
-        output_str = name_R15
-
-        # Is name_R15 in K16 or L17?
-        indices_1 = [i for i,x in enumerate(id_K16) if x == name_R15]
-        indices_2 = [i for i,x in enumerate(id_L17) if x == name_R15]
-        # No
-        if len(indices_1) == 0 and len(indices_2) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s} {3:25s}".format(source_counter, foo, foo, output_str)
-
-            # Is name_R15 in G14?
-            indices = [i for i,x in enumerate(id_G14) if x == name_R15]
-            if len(indices) > 0:
-                foo = np.array(id_G14)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_R15 in A09?
-            indices = [i for i,x in enumerate(id_A09) if x == name_R15]
-            indices_alt = [i for i,x in enumerate(id_alt_A09) if x == name_R15]
-            if len(indices) > 0:
-                foo = np.array(id_A09)[indices][0]
-                id_alt_A09 = np.array(id_alt_A09)
-                id_alt_A09[indices] = name_R15
-                id_alt_A09 = list(id_alt_A09)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_A09)[indices_alt][0]
-                id_A09 = np.array(id_A09)
-                id_A09[indices_alt] = name_R15
-                id_A09 = list(id_A09)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_R15 in I15?
-            indices = [i for i,x in enumerate(id_I15) if x == name_R15]
-            indices_alt = [i for i,x in enumerate(id_alt_I15) if x == name_R15]
-            if len(indices) > 0:
-                foo = np.array(id_I15)[indices][0]
-                id_alt_I15 = np.array(id_alt_I15)
-                id_alt_I15[indices] = name_R15
-                id_alt_I15 = list(id_alt_I15)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_I15)[indices_alt][0]
-                id_I15 = np.array(id_I15)
-                id_I15[indices_alt] = name_R15
-                id_I15 = list(id_I15)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
+        print("{0:4s} {1:25s} {2:25s} {3:25s} {4:25s} {5:25s} {6:25s} {7:25s} {8:25s}\n".format('No', *labels, 'z'))
 
-            # Is name_R15 in J17?
-            indices = [i for i,x in enumerate(id_J17) if x == name_R15]
-            if len(indices) > 0:
-                foo = np.array(id_J17)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
+    for q, (label, description, filename, has_alt) in enumerate(samples):
+        table = tables[label]
+        id_sample = table.ID.values
+        id_alt_sample = table.ID_ALT.values if has_alt else id_sample
+        z_sample = table.z.values
 
+        for j in range(0, len(id_sample)):
+            name = id_sample[j]
+            name_alt = id_alt_sample[j]
 
-            # Add one to source_counter
-            source_counter = source_counter + 1
-            # Add name_R15 to ID_master if not in K16 nor in L17
-            ID_master.append(name_R15)
-            # Add redshift to z_master
-            z_master.append(z_R15[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_R15[i_z])
+            # Skip sources already in a sample of higher priority
+            if any(name in indices[x] or name_alt in indices[x] for x in labels[:q]):
+                continue
 
-            # Output
-            if verbose:
-                print(output_str)
+            # Columns: blank for samples of higher priority, the master ID,
+            # and the source name if it is also in a sample of lower priority
+            columns = ['']*q + [name_alt]
+            columns = columns + [name if name in indices[x] else '' for x in labels[q+1:]]
 
-        i_z = i_z + 1
-
-
-    # --- Loop through G14
-    i_z = 0
-    for name_G14 in id_G14:
-        output_str = name_G14
-
-        # Is name_G14 in K16, L17, or R15?
-        indices_1 = [i for i,x in enumerate(id_K16) if x == name_G14]
-        indices_2 = [i for i,x in enumerate(id_L17) if x == name_G14]
-        indices_3 = [i for i,x in enumerate(id_R15) if x == name_G14]
-        if len(indices_1) == 0 and len(indices_2) == 0 and len(indices_3) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s} {3:25s} {4:25s}".format(source_counter, foo, foo, foo, output_str)
-
-            # Is name_G14 in A09?
-            indices = [i for i,x in enumerate(id_A09) if x == name_G14]
-            indices_alt = [i for i,x in enumerate(id_alt_A09) if x == name_G14]
-            if len(indices) > 0:
-                foo = np.array(id_A09)[indices][0]
-                id_alt_A09 = np.array(id_alt_A09)
-                id_alt_A09[indices] = name_K16
-                id_alt_A09 = list(id_alt_A09)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_A09)[indices_alt][0]
-                id_A09 = np.array(id_A09)
-                id_A09[indices_alt] = name_K16
-                id_A09 = list(id_A09)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_G14 in I15?
-            indices = [i for i,x in enumerate(id_I15) if x == name_G14]
-            indices_alt = [i for i,x in enumerate(id_alt_I15) if x == name_G14]
-            if len(indices) > 0:
-                foo = np.array(id_I15)[indices][0]
-                id_alt_I15 = np.array(id_alt_I15)
-                id_alt_I15[indices] = name_G14
-                id_alt_I15 = list(id_alt_I15)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_I15)[indices_alt][0]
-                id_I15 = np.array(id_I15)
-                id_I15[indices_alt] = name_G14
-                id_I15 = list(id_I15)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_G14 in J17?
-            indices = [i for i,x in enumerate(id_J17) if x == name_G14]
-            if len(indices) > 0:
-                foo = np.array(id_J17)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Add one to source_counter
-            source_counter = source_counter + 1
-            # Add name_R15 to ID_master if not in K16 nor in L17 nor in R15
-            ID_master.append(name_G14)
-            # Add redshift to z_master
-            z_master.append(z_G14[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_G14[i_z])
+            # Add source to master list
+            ID_master.append(name_alt)
+            z_master.append(z_sample[j])
 
             if verbose:
+                output_str = "{0:4d} ".format(source_counter)
+                output_str = output_str + " ".join(["{0:25s}".format(x) for x in columns])
+                output_str = "{0:25s} {1:2.5f}".format(output_str, z_sample[j])
                 print(output_str)
 
-        i_z = i_z + 1
-
-    # --- Loop through A09
-    i_z = 0
-    for j in np.arange(0,len(table_A09.ID_ALT)):
-
-        name_A09 = table_A09.ID[j]
-        name_alt_A09 = table_A09.ID_ALT[j]
-        output_str = name_alt_A09
-
-        # Is name_A09 in K16, L17, R15, or G14?
-        indices_1 = [i for i,x in enumerate(id_K16) if x == name_A09]
-        indices_2 = [i for i,x in enumerate(id_L17) if x == name_A09]
-        indices_3 = [i for i,x in enumerate(id_R15) if x == name_A09]
-        indices_4 = [i for i,x in enumerate(id_G14) if x == name_A09]
-
-        # Is name_alt_A09 in K16, L17, R15, or G14?
-        indices_alt_1 = [i for i,x in enumerate(id_K16) if x == name_alt_A09]
-        indices_alt_2 = [i for i,x in enumerate(id_L17) if x == name_alt_A09]
-        indices_alt_3 = [i for i,x in enumerate(id_R15) if x == name_alt_A09]
-        indices_alt_4 = [i for i,x in enumerate(id_G14) if x == name_alt_A09]
-
-        if len(indices_1) == 0 and len(indices_2) == 0 and len(indices_3) == 0 and len(indices_4) == 0 and len(indices_alt_1) == 0 and len(indices_alt_2) == 0 and len(indices_alt_3) == 0 and len(indices_alt_4) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s} {3:25s} {4:25s} {5:25s}".format(source_counter, foo, foo, foo, foo, output_str)
-
-            # Is name_A09 in I15?
-            indices = [i for i,x in enumerate(id_I15) if x == name_A09]
-            indices_alt = [i for i,x in enumerate(id_alt_I15) if x == name_A09]
-            if len(indices) > 0:
-                foo = np.array(id_I15)[indices][0]
-                id_alt_I15 = np.array(id_alt_I15)
-                id_alt_I15[indices] = name_A09
-                id_alt_I15 = list(id_alt_I15)
-            elif len(indices_alt) > 0:
-                foo = np.array(id_alt_I15)[indices_alt][0]
-                id_I15 = np.array(id_I15)
-                id_I15[indices_alt] = name_A09
-                id_I15 = list(id_I15)
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Is name_A09 in J17?
-            indices = [i for i,x in enumerate(id_J17) if x == name_A09]
-            if len(indices) > 0:
-                foo = np.array(id_J17)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
-
-            # Add one to source_counter
             source_counter = source_counter + 1
-            # Add name_alt_A09 to ID_master if not in K16 nor in L17 nor in R15 nor in G14
-            ID_master.append(name_alt_A09)
-            # Add redshift to z_master
-            z_master.append(z_A09[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_A09[i_z])
+    # -------------------------------------------
 
-            if verbose:
-                print(output_str)
+    # --- At this stage write master list to avoid slow NED queries ---
+    print("")
+    print("Master sample size", len(ID_master))
+    df = pd.DataFrame({'ID': ID_master, 'z': z_master})
+    write_table(df, 'master_list.parquet')
+    # ---------------------------------------------------------
 
-        i_z = i_z + 1
-
-    # --- Loop through I15
-    i_z = 0
-    for j in np.arange(0,len(table_I15.ID_ALT)):
-
-        name_I15 = table_I15.ID[j]
-        name_alt_I15 = table_I15.ID_ALT[j]
-        output_str = name_alt_I15
-
-        # Is name_A09 in K16, L17, R15, G14, A09 or J17?
-        indices_1 = [i for i,x in enumerate(id_K16) if x == name_I15]
-        indices_2 = [i for i,x in enumerate(id_L17) if x == name_I15]
-        indices_3 = [i for i,x in enumerate(id_R15) if x == name_I15]
-        indices_4 = [i for i,x in enumerate(id_G14) if x == name_I15]
-        indices_5 = [i for i,x in enumerate(id_A09) if x == name_I15]
-
-        # Is name_alt_A09 in K16, L17, R15, G14, A09 or J17?
-        indices_alt_1 = [i for i,x in enumerate(id_K16) if x == name_alt_I15]
-        indices_alt_2 = [i for i,x in enumerate(id_L17) if x == name_alt_I15]
-        indices_alt_3 = [i for i,x in enumerate(id_R15) if x == name_alt_I15]
-        indices_alt_4 = [i for i,x in enumerate(id_G14) if x == name_alt_I15]
-        indices_alt_5 = [i for i,x in enumerate(id_A09) if x == name_alt_I15]
-
-        if len(indices_1) == 0 and len(indices_2) == 0 and len(indices_3) == 0 and len(indices_4) == 0 and len(indices_5) == 0 and len(indices_alt_1) == 0 and len(indices_alt_2) == 0 and len(indices_alt_3) == 0 and len(indices_alt_4) == 0 and len(indices_alt_5) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s} {3:25s} {4:25s} {5:25s} {6:25s}".format(source_counter, foo, foo, foo, foo, foo, output_str)
-
-            # Is name_I15 in J17?
-            indices = [i for i,x in enumerate(id_J17) if x == name_I15]
-            if len(indices) > 0:
-                foo = np.array(id_J17)[indices][0]
-            else:
-                foo = ''
-            output_str = "{0:25s} {1:25s}".format(output_str, foo)
 
-            # Add one to source_counter
-            source_counter = source_counter + 1
-            # Add name_alt_I15 to ID_master if not in K16 nor in L17 nor in R15 nor in G14
-            ID_master.append(name_alt_I15)
-            # Add redshift to z_master
-            z_master.append(z_I15[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_I15[i_z])
+def _load_id_map():
+    """ Returns a dict mapping the ID of each document in the collection
+        being committed to (commit_collection_name) to its _id, read with a
+        single projected query.
+    """
+    return dict((document['ID'], document['_id'])
+                for document in get_storage().find(commit_collection_name, fields=['ID']))
 
-            if verbose:
-                print(output_str)
 
-        i_z = i_z + 1
+def _resolve_targets(df, id_map=None):
+    """ Resolves the rows of a survey table to their master documents.
 
+        Returns a list with the _id of the db document of each row (None if
+        the source is not in db), matching the ID of each row and, for tables
+        with an ID_ALT column, the ID_ALT if the ID is not in db. id_map is
+        an ID -> _id map from _load_id_map, which is loaded if not given.
+    """
+    if id_map is None:
+        id_map = _load_id_map()
 
-    # --- Loop through J17
-    i_z = 0
-    for j in np.arange(0,len(table_J17.ID_ALT)):
+    IDs = df['ID'].values
+    IDs_ALT = df['ID_ALT'].values if 'ID_ALT' in df.columns else ['']*len(IDs)
 
-        name_J17 = table_J17.ID[j]
-        name_alt_J17 = table_J17.ID_ALT[j]
-        output_str = name_alt_J17
+    targets = []
+    for ID, ID_ALT in zip(IDs, IDs_ALT):
+        target = id_map.get(ID)
+        # ID not in db['ID'] and ID_ALT in db['ID']
+        if target is None and ID_ALT != '':
+            target = id_map.get(ID_ALT)
+        # ID and ID_ALT not in db['ID']
+        if target is None:
+            print("Error... source "+ID+" should be in db.")
+        targets.append(target)
 
-        # Is name_A09 in K16, L17, R15, G14, A09 or J17?
-        indices_1 = [i for i,x in enumerate(id_K16) if x == name_J17]
-        indices_2 = [i for i,x in enumerate(id_L17) if x == name_J17]
-        indices_3 = [i for i,x in enumerate(id_R15) if x == name_J17]
-        indices_4 = [i for i,x in enumerate(id_G14) if x == name_J17]
-        indices_5 = [i for i,x in enumerate(id_A09) if x == name_J17]
-        indices_6 = [i for i,x in enumerate(id_I15) if x == name_J17]
+    return targets
 
-        # Is name_alt_A09 in K16, L17, R15, G14, A09 or J17?
-        indices_alt_1 = [i for i,x in enumerate(id_K16) if x == name_alt_J17]
-        indices_alt_2 = [i for i,x in enumerate(id_L17) if x == name_alt_J17]
-        indices_alt_3 = [i for i,x in enumerate(id_R15) if x == name_alt_J17]
-        indices_alt_4 = [i for i,x in enumerate(id_G14) if x == name_alt_J17]
-        indices_alt_5 = [i for i,x in enumerate(id_A09) if x == name_alt_J17]
-        indices_alt_6 = [i for i,x in enumerate(id_I15) if x == name_alt_J17]
 
-        if len(indices_1) == 0 and len(indices_2) == 0 and len(indices_3) == 0 and len(indices_4) == 0 and len(indices_5) == 0 and len(indices_6) and len(indices_alt_1) == 0 and len(indices_alt_2) == 0 and len(indices_alt_3) == 0 and len(indices_alt_4) == 0 and len(indices_alt_5) and len(indices_alt_6) == 0:
-            foo = ''
-            output_str = "{0:4d} {1:25s} {2:25s} {3:25s} {4:25s} {5:25s} {6:25s} {7:25s}".format(source_counter, foo, foo, foo, foo, foo, foo, output_str)
+def _commit_records(records, batch_size=None):
+    """ Commits (_id, {field: value}) records to db[commit_collection_name].
 
-            # Add one to source_counter
-            source_counter = source_counter + 1
-            # Add name_alt_I15 to ID_master if not in K16 nor in L17 nor in R15 nor in G14
-            ID_master.append(name_alt_J17)
-            # Add redshift to z_master
-            z_master.append(z_J17[i_z])
-            output_str = "{0:25s} {1:2.5f}".format(output_str, z_J17[i_z])
+        All fields of records with the same _id are merged into one update
+        (later records win, as with consecutive update_one calls), and the
+        updates are sent to the db in batches of batch_size (see
+        StorageBackend.bulk_set).
+    """
+    if batch_size is None:
+        batch_size = commit_batch_size
 
-            if verbose:
-                print(output_str)
+    # --- Merge fields per _id ---
+    documents = {}
+    for doc_id, fields in records:
+        documents.setdefault(doc_id, {}).update(fields)
+    # ----------------------------
 
-        i_z = i_z + 1
-    # -------------------------------------------
+    # --- Flush to db ---
+    N = get_storage().bulk_set(commit_collection_name, list(documents.items()), batch_size)
+    # -------------------
 
-    # --- At this stage pickle db to avoid slow NED queries ---
-    print("")
-    print("Master sample size", len(ID_master))
-    df = pd.DataFrame({'ID': ID_master, 'z': z_master})
-    df.to_pickle(data_path+'master_list.pkl')
-    # ---------------------------------------------------------
+    return N
 
 
 def commit_to_db_master():
     """ Commits ID_master and z_master to db.
     """
     # --- Read in ID_master list ---
-    df = pd.read_pickle(data_path+'master_list.pkl')
+    df = read_table('master_list.parquet', fill_value=ValUnDef)
     # ------------------------------
 
     # --- Commit to db ---
-    for i in np.arange(0,len(df['ID'])):
-        db.local_galaxies.insert_one(
-            {
-                'ID' : df['ID'][i],
-                'z': df['z'][i],
-            }
-        )
+    documents = [{'ID': df['ID'][i], 'z': df['z'][i]}
+                 for i in np.arange(0,len(df['ID']))]
+    get_storage().insert(commit_collection_name, documents)
     # --------------------
 
 
@@ -2091,11 +2954,6 @@ def commit_to_db_J17():
     """ Commits J17 data to db.
     """
 
-    # --- Read in I15 pkl file ---
-    df = pd.read_pickle(data_path+'Jiao-et-al-2017.pkl')
-    print(df.SdV_CO10)
-    # ----------------------------
-
     ## --- Commit to db ---
     #for i in np.arange(0,len(df['ID'])):
     #    if int(df['LIR_8_1000'][i]) != ValUnDef:
@@ -2157,7 +3015,6 @@ def commit_to_db_J17():
     ## --------------------
 
 
-    # --- Commit to db ---
     # Transitions in J17
     transitions = ['1-0']
     transitions = ['12CO(' + s + ')' for s in transitions]
@@ -2168,123 +3025,41 @@ def commit_to_db_J17():
     entries_err = ['eSdV_' + s for s in entries]
     entries = ['SdV_' + s for s in entries]
 
-    # Loop over I15 pickle files
-    for k in ['1']: #, '5']:
+    # --- Read in J17 Parquet file ---
+    df = read_table('Jiao-et-al-2017.parquet',
+                    columns=['ID', 'ID_ALT']+entries+entries_err,
+                    fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
 
-        # Read in I15 pkl file
-        df = pd.read_pickle(data_path+'Jiao-et-al-2017.pkl')
+    # --- Collect records ---
+    records = []
+    for i in np.arange(0,len(df['ID'])):
+        target = targets[i]
+        if target is None:
+            continue
 
-        for i in np.arange(0,len(df['ID'])):
-            ID = df['ID'][i]
-            ID_ALT = df['ID_ALT'][i]
+        # Loop over line entries for each source
+        j=0
+        for entry in entries:
+            entry_err = entries_err[j]
+            # Fixing errors, upper limits and undefined values
+            SdV = float(df[entry][i])
+            eSdV = float(df[entry_err][i])
 
-            # Loop over line entries for each source
-            j=0
-            for entry in entries:
-                entry_err = entries_err[j]
-                # Fixing errors, upper limits and undefined values
-                SdV = float(df[entry][i])
-                eSdV = float(df[entry_err][i])
-
-                # Check if ID already exists in db
-                cursor = db.local_galaxies.find_one({'ID': ID})
-                cursor_alt = db.local_galaxies.find_one({'ID': ID_ALT})
-
-                # ID in db['ID'] and ID_ALT not in db['ID']
-                if not(cursor == None):
-                    # SdV is detected (always the case for I15)
-                    if SdV > 0:
-                        # Commit to db
-                        #SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV_J17': SdV}
-                            }
-                        )
-                        #eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV_J17': eSdV}
-                            }
-                        )
-                        # Commit I15 fluxes to master fluxes
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV': SdV}
-                            }
-                        )
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV': eSdV}
-                            }
-                        )
-
-                # ID not in db['ID'] and ID_ALT in db['ID'] and ID_ALT != ''
-                elif cursor == None and not(cursor_alt == None) and ID_ALT != '':
-                    # SdV is detected (always the case for I15)
-                    if SdV > 0:
-                        # Commit to db
-                        #SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV_J17': SdV}
-                            }
-                        )
-                        #eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV_J17': eSdV}
-                            }
-                        )
-                        # Commit I15 fluxes to master fluxes
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV': SdV}
-                            }
-                        )
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV': eSdV}
-                            }
-                        )
-
-                # ID_ALT not in db['ID_ALT']
-                else:
-                    print("Error... source should be in db.")
+            # SdV is detected (always the case for J17)
+            if SdV > 0:
+                #SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
+                #eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
+                # J17 fluxes
+                records.append((target, {transitions[j]+'.SdV_J17': SdV,
+                                         transitions[j]+'.eSdV_J17': eSdV}))
 
-                j=j+1
+            j=j+1
+    # -----------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
@@ -2292,72 +3067,31 @@ def commit_to_db_I15():
     """ Commits I15 data to db.
     """
 
-    # --- Read in I15 pkl file ---
-    df = pd.read_pickle(data_path+'Israel-et-al-2015-Table-1.pkl')
-    # ----------------------------
+    # --- Read in I15 Parquet file ---
+    df = read_table('Israel-et-al-2015-Table-1.parquet',
+                    columns=['ID', 'ID_ALT', 'LIR_8_1000'], fill_value=ValUnDef)
+    id_map = _load_id_map()
+    targets = _resolve_targets(df, id_map)
+    # --------------------------------
 
-    # --- Commit to db ---
+    records = []
+
+    # --- Collect LIR records ---
     for i in np.arange(0,len(df['ID'])):
         if int(df['LIR_8_1000'][i]) != ValUnDef:
-            ID = df['ID'][i]
-            ID_ALT = df['ID_ALT'][i]
-
-            # Check if ID already exists in db
-            cursor = db.local_galaxies.find_one({'ID': ID})
-            cursor_alt = db.local_galaxies.find_one({'ID': ID_ALT})
-
-            # ID in db['ID']
-            if not(cursor == None):
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.I15': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_I15 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID not in db['ID'] and ID_ALT in db['ID'] and ID_ALT != ''
-            elif cursor == None and not(cursor_alt == None) and ID_ALT != '':
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID_ALT
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.I15': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_I15 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                              "$eq": ID_ALT
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID not in db['ID'] and ID_ALT not in db['ID']
-            else:
-                print("Error... source should be in db.")
+            target = targets[i]
+            if target is None:
+                continue
+
+            # LIR_8_1000_I15
+            records.append((target, {'LIR_8_1000.I15': df['LIR_8_1000'][i]}))
         # No LIR measurement
         else:
             print("Warning... source has no LIR measurement.")
-    # --------------------
+    # ---------------------------
 
 
-    # --- Commit to db ---
+    # --- Collect line records ---
     # Transitions in I15
     transitions = ['2-1','4-3','7-6']
     transitions = ['12CO(' + s + ')' for s in transitions]
@@ -2373,123 +3107,45 @@ def commit_to_db_I15():
     entries = ['SdV_' + s for s in entries]
 
 
-    # Loop over I15 pickle files
+    # Loop over I15 Parquet files
     for k in ['2','3', '4']: #, '5']:
 
-        # Read in I15 pkl file
-        df = pd.read_pickle(data_path+'Israel-et-al-2015-Table-'+k+'.pkl')
+        # Read in I15 Parquet file
+        df = read_table('Israel-et-al-2015-Table-'+k+'.parquet',
+                        columns=['ID', 'ID_ALT']+entries+entries_err,
+                        fill_value=ValUnDef)
+        targets = _resolve_targets(df, id_map)
+
+        # Line fluxes and errors in [Jy km/s]
+        SdV_jansky = [si2jansky(df[entries[j]].values, transitions[j])
+                      for j in range(0, len(entries))]
+        eSdV_jansky = [si2jansky(df[entries_err[j]].values, transitions[j])
+                       for j in range(0, len(entries))]
 
         for i in np.arange(0,len(df['ID'])):
-            ID = df['ID'][i]
-            ID_ALT = df['ID_ALT'][i]
+            target = targets[i]
+            if target is None:
+                continue
 
             # Loop over line entries for each source
             j=0
             for entry in entries:
-                entry_err = entries_err[j]
                 # Fixing errors, upper limits and undefined values
                 SdV = float(df[entry][i])
-                eSdV = float(df[entry_err][i])
-
-                # Check if ID already exists in db
-                cursor = db.local_galaxies.find_one({'ID': ID})
-                cursor_alt = db.local_galaxies.find_one({'ID': ID_ALT})
-
-                # ID in db['ID'] and ID_ALT not in db['ID']
-                if not(cursor == None):
-                    # SdV is detected (always the case for I15)
-                    if SdV > 0:
-                        # Commit to db
-                        SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV_I15': SdV}
-                            }
-                        )
-                        eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV_I15': eSdV}
-                            }
-                        )
-                        # Commit I15 fluxes to master fluxes
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV': SdV}
-                            }
-                        )
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV': eSdV}
-                            }
-                        )
-
-                # ID not in db['ID'] and ID_ALT in db['ID'] and ID_ALT != ''
-                elif cursor == None and not(cursor_alt == None) and ID_ALT != '':
-                    # SdV is detected (always the case for I15)
-                    if SdV > 0:
-                        # Commit to db
-                        SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV_I15': SdV}
-                            }
-                        )
-                        eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV_I15': eSdV}
-                            }
-                        )
-                        # Commit I15 fluxes to master fluxes
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.SdV': SdV}
-                            }
-                        )
-                        db.local_galaxies.update_one(
-                            {
-                                'ID': {
-                                    "$eq": ID_ALT
-                                    }
-                                },
-                            {'$set': {transitions[j]+'.eSdV': eSdV}
-                            }
-                        )
-
-                # ID_ALT not in db['ID_ALT']
-                else:
-                    print("Error... source should be in db.")
+
+                # SdV is detected (always the case for I15)
+                if SdV > 0:
+                    SdV = SdV_jansky[j][i]
+                    eSdV = eSdV_jansky[j][i]
+                    # I15 fluxes
+                    records.append((target, {transitions[j]+'.SdV_I15': SdV,
+                                             transitions[j]+'.eSdV_I15': eSdV}))
 
                 j=j+1
+    # ----------------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
@@ -2498,69 +3154,30 @@ def commit_to_db_I15():
 def commit_to_db_A09():
     """ Commits A09 data to db.
     """
-    # --- Read in A09 pkl file ---
-    df = pd.read_pickle(data_path+'Armus-et-al-2009.pkl')
-    # ----------------------------
-
-    # --- Commit to db ---
+    # --- Read in A09 Parquet file ---
+    df = read_table('Armus-et-al-2009.parquet',
+                    columns=['ID', 'ID_ALT', 'LIR_8_1000'], fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
+
+    # --- Collect records ---
+    records = []
     for i in np.arange(0,len(df['ID'])):
         # Only proceed if LIR measurement exist
         if int(df['LIR_8_1000'][i]) != ValUnDef:
-            ID = df['ID'][i]
-            ID_ALT = df['ID_ALT'][i]
-
-            # Check if ID and ID_ALT already exists in db['ID']
-            cursor = db.local_galaxies.find_one({'ID': ID})
-            cursor_alt = db.local_galaxies.find_one({'ID': ID_ALT})
-
-            # ID in db['ID'] and ID_ALT no in db['ID']
-            if not(cursor == None):
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.A09': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_A09 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID not in db['ID'] and ID_ALT in db['ID']
-            elif cursor == None and not(cursor_alt == None):
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID_ALT
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.A09': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_A09 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID_ALT
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID and ID_ALT not in db['ID']: Error
-            else:
-                print("Error... source should be in db.")
+            target = targets[i]
+            if target is None:
+                continue
+
+            # LIR_8_1000_A09
+            records.append((target, {'LIR_8_1000.A09': df['LIR_8_1000'][i]}))
         # No LIR measurement
         else:
             print("Warning... source has no LIR measurement.")
+    # -----------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
@@ -2568,105 +3185,73 @@ def commit_to_db_A09():
 def commit_to_db_G14():
     """ Commits G14 data to db.
     """
-    # --- Read in G14 pkl file ---
-    df = pd.read_pickle(data_path+'Greve-et-al-2014.pkl')
-    # ----------------------------
-
-    # --- Commit to db ---
+    # --- Read in G14 Parquet file ---
+    df = read_table('Greve-et-al-2014.parquet',
+                    columns=['ID', 'LIR_8_1000', 'LIR_50_300'], fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
+
+    # --- Collect records ---
+    records = []
     for i in np.arange(0,len(df['ID'])):
         # Only proceed if LIR measurement exist
         if df['LIR_8_1000'][i] != ValUnDef:
-            ID = df['ID'][i]
-
-            # Check if ID already exists in db['ID']
-            cursor = db.local_galaxies.find_one({'ID': ID})
-
-            # ID in db['ID']
-            if not(cursor == None):
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.G14': df['LIR_8_1000'][i]}
-                    }
-                )
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_50_300.G14': df['LIR_50_300'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_G14 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID not in db['ID']
-            else:
-                print("Error... source should be in db.")
+            target = targets[i]
+            if target is None:
+                continue
+
+            # LIR_8_1000_G14 and LIR_50_300_G14
+            records.append((target, {'LIR_8_1000.G14': df['LIR_8_1000'][i],
+                                     'LIR_50_300.G14': df['LIR_50_300'][i]}))
         # No LIR measurement
         else:
             print("Warning... source has no LIR measurement.")
-    # --------------------
-
+    # -----------------------
 
-def _fix_line_fluxes_R15(SdV, eF, j):
+    # --- Commit to db ---
+    _commit_records(records)
+    # --------------------
 
-    if j < 3:
-        if not('...' in SdV):
-            # [W m^-2]
-            SdV = float(SdV)*1.E-18
-            eSdV = eF*SdV
-        else:
-            SdV = ValUnDef
-            eSdV = ValUnDef
-    else:
-        if '^a' in SdV:
-            SdV = SdV.replace('^a','')
-            indices_start = SdV.find('(')
-            indices_end = SdV.find(')')
-            SdV = float(SdV[indices_start+1:indices_end])
-            # [W m^-2]
-            SdV = SdV*1.E-17
-            eSdV = 0.16*SdV
-        elif '-' in SdV:
-            SdV = ValUnDef
-            eSdV = ValUnDef
-        elif not('^a' in SdV) and '(' in SdV:
-            indices_end = SdV.find('(')
-            SdV = float(SdV[0:indices_end])
-            # [W m^-2]
-            SdV = SdV*1.E-17
-            eSdV = 0.16*SdV
-        elif '^b' in SdV:
-            eSdV = ValUpLim
-            SdV = float(SdV.replace('^b',''))
-            # [W m^-2]
-            SdV = SdV*1.E-17
-        elif '^d' in SdV:
-            eSdV = ValUnDef
-            SdV = ValUnDef
-        else:
-            SdV = float(SdV)
-            SdV = SdV*1.E-17
-            eSdV = 0.16*SdV
 
-    # Set negative fluxes to ValUnDef
-    if SdV < 0:
-        SdV = ValUnDef
-        eSdV = ValUnDef
+def parse_line_fluxes(column, footnotes, scale=1., error=0.):
+    """ Parses a column of line flux strings with footnotes (see
+        footnotes_R15) in one pass.
 
-    return SdV, eSdV
+        Returns the arrays (SdV, eSdV, flag), where SdV is scale times the
+        number read from each string and eSdV = error*SdV. SdV and eSdV are
+        NaN for undefined fluxes, as is eSdV for upper limits. Negative
+        fluxes and missing entries (None or NaN, see read_table) are
+        undefined.
+    """
+    column = pd.Series(column)
+    missing = column.isna().values
+    column = column.astype(str)
+
+    # Rule matching each string (the first one found)
+    matches = [column.str.contains(pattern, regex=True).values
+               for pattern, flag, value in footnotes]
+    rule = np.select(matches, np.arange(0, len(footnotes)), default=-1)
+    flags = np.array([x[1] for x in footnotes]+[FluxUnDef])[rule]
+    values = np.array([x[2] for x in footnotes]+[None], dtype=object)[rule]
+    flags = np.where(missing, FluxUnDef, flags)
+
+    # Numbers in front of and in parentheses
+    lead = pd.to_numeric(column.str.extract(r'^\s*([^\s(^]+)', expand=False),
+                         errors='coerce').values
+    paren = pd.to_numeric(column.str.extract(r'\(([^)]*)\)', expand=False),
+                          errors='coerce').values
+    SdV = np.where(values == 'paren', paren, lead)*scale
+
+    undefined = (flags == FluxUnDef) | np.isnan(SdV) | (SdV < 0)
+    if ((flags != FluxUnDef) & np.isnan(SdV)).any():
+        print("Warning... unparsed line fluxes:",
+              list(column[(flags != FluxUnDef) & np.isnan(SdV)]))
+    flags = np.where(undefined, FluxUnDef, flags)
+    SdV = np.where(undefined, np.nan, SdV)
+    eSdV = np.where((flags == FluxDetected) | (flags == FluxApCorr),
+                    error*SdV, np.nan)
+
+    return SdV, eSdV, flags
 
 
 def commit_to_db_R15():
@@ -2675,10 +3260,6 @@ def commit_to_db_R15():
     # Adopted flux uncertainty (low-J CO lines)
     eF = 0.30
 
-    # --- Read in R15 pickle pkl file ---
-    df = pd.read_pickle(data_path+'Rosenberg-et-al-2015.pkl')
-    # -----------------------------------
-
     # Transitions in R15
     transitions = ['1-0', '2-1', '3-2', '4-3','5-4','6-5','7-6','8-7','9-8','10-9','11-10','12-11','13-12']
     transitions = ['12CO(' + s + ')' for s in transitions]
@@ -2691,124 +3272,66 @@ def commit_to_db_R15():
     entries = entries + ['CI609','CI370','OI63', 'OI145', 'CII158']
     entries = ['SdV_' + s for s in entries]
 
-    # --- Commit to db ---
+    # --- Read in R15 Parquet file ---
+    df = read_table('Rosenberg-et-al-2015.parquet',
+                    columns=['ID', 'LIR_8_1000']+entries, fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
+
+    # --- Parse line fluxes and convert them into [Jy km/s] ---
+    # Low-J CO lines [1E-18 W m^-2] and the other lines [1E-17 W m^-2]
+    flags = []
+    SdV_jansky = []
+    eSdV_jansky = []
+    j=0
+    for entry in entries:
+        if j < 3:
+            SdV, eSdV, flag = parse_line_fluxes(df[entry], footnotes_R15_low_J,
+                                                scale=1.E-18, error=eF)
+        else:
+            SdV, eSdV, flag = parse_line_fluxes(df[entry], footnotes_R15,
+                                                scale=1.E-17, error=0.16)
+        flags.append(flag)
+        SdV_jansky.append(si2jansky(SdV, transitions[j]))
+        eSdV_jansky.append(si2jansky(eSdV, transitions[j]))
+        j=j+1
+    # ---------------------------------------------------------
+
+    # --- Collect records ---
+    records = []
     for i in np.arange(0,len(df['ID'])):
-        ID = df['ID'][i]
-
-        # Check if ID already exists in db['ID']
-        cursor = db.local_galaxies.find_one({'ID': ID})
-
-        # ID in db['ID']
-        if not(cursor == None):
-            if int(df['LIR_8_1000'][i]) != ValUnDef:
-                # Commit IR luminosities to db
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                    },
-                    {'$set': {'LIR_8_1000.R15': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_R15 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # No LIR measurement
-            else:
-                print("Warning... source has no LIR measurement.")
-            # Loop over line entries for each source
-            j=0
-            for entry in entries:
-                SdV = str(df[entry][i])
-                # Fixing errors, upper limits and undefined values
-                SdV, eSdV = _fix_line_fluxes_R15(SdV, eF, j)
-
-                if SdV != ValUnDef and eSdV != ValUpLim:
-                    SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                    # Commit line fluxes to db
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                            }
-                        },
-                        {'$set': {transitions[j]+'.SdV_R15': SdV}
-                        }
-                    )
-                    eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                    # Commit line flux errors to db
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                            }
-                        },
-                        {'$set': {transitions[j]+'.eSdV_R15': eSdV}
-                        }
-                    )
-                    # Commit R15 fluxes to master fluxes
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.SdV': SdV}
-                        }
-                    )
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.eSdV': SdV}
-                        }
-                    )
-                elif eSdV == ValUpLim:
-                    SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                    # Commit line fluxe errors to db
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                            }
-                        },
-                        {'$set': {transitions[j]+'.SdV_3sigmaUL_R15': SdV}
-                        }
-                    )
-                    # Commit R15 fluxes to master fluxes
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.SdV': SdV}
-                        }
-                    )
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.eSdV': eSdV}
-                        }
-                    )
-
-                j = j+1
-        # ID not in db['ID']
+        target = targets[i]
+        if target is None:
+            continue
+
+        fields = {}
+        if int(df['LIR_8_1000'][i]) != ValUnDef:
+            # IR luminosities
+            fields['LIR_8_1000.R15'] = df['LIR_8_1000'][i]
+        # No LIR measurement
         else:
-            print("Error... source should be in db.")
+            print("Warning... source has no LIR measurement.")
+        # Loop over line entries for each source
+        j=0
+        for entry in entries:
+            flag = flags[j][i]
+
+            if flag == FluxDetected or flag == FluxApCorr:
+                SdV = SdV_jansky[j][i]
+                eSdV = eSdV_jansky[j][i]
+                # Line fluxes and line flux errors
+                fields[transitions[j]+'.SdV_R15'] = SdV
+                fields[transitions[j]+'.eSdV_R15'] = eSdV
+            elif flag == FluxUpLim:
+                # Upper limit
+                fields[transitions[j]+'.SdV_3sigmaUL_R15'] = SdV_jansky[j][i]
+
+            j = j+1
+        records.append((target, fields))
+    # -----------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
@@ -2816,10 +3339,6 @@ def commit_to_db_K16():
     """ Commits K16 data to db.
     """
 
-    # --- Read in K16 pkl file ---
-    df = pd.read_pickle(data_path+'Kamenetzky-et-al-2016.pkl')
-    # ----------------------------
-
     transitions = ['1-0','2-1','3-2','4-3','5-4','6-5','7-6','8-7','9-8',
             '10-9','11-10','12-11', '13-12']
     transitions = ['12CO(' + s + ')' for s in transitions]
@@ -2830,130 +3349,54 @@ def commit_to_db_K16():
     entries = ['CO' + s for s in entries]
     entries = entries + ['CI609','CI370','NII205']
 
-    # --- Commit to db ---
+    # --- Read in K16 Parquet file ---
+    columns = [prefix+entry for entry in entries
+               for prefix in ['SdV_', 'eSdV_', 'SdV_3sigmaUL_']]
+    df = read_table('Kamenetzky-et-al-2016.parquet',
+                    columns=['ID', 'LIR_40_120']+columns, fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
+
+    # --- Collect records ---
+    records = []
     for i in np.arange(0,len(df['ID'])):
-        ID = df['ID'][i]
-        LIR = df['LIR_40_120'][i]
+        target = targets[i]
+        if target is None:
+            continue
 
-        # Check if ID already exists in db
-        cursor = db.local_galaxies.find_one({'ID': ID})
-
-        # ID in db['ID']
-        if not(cursor == None):
-
-            # Commit LIR if defined
-            if LIR != ValUnDef:
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_40_120.K16': LIR}
-                    }
-                )
-                # Commit LIR_8_1000_K16 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': LIR}
-                    }
-                )
-            # No LIR measurement
-            else:
-                print("Warning... source has no LIR measurement.")
+        LIR = df['LIR_40_120'][i]
+        fields = {}
 
-            # Commit transitions if defined
-            j=0
-            for transition in transitions:
-                SdV = float(df['SdV_'+entries[j]][i])
-                eSdV = float(df['eSdV_'+entries[j]][i])
-                SdV_3sigmaUL = float(df['SdV_3sigmaUL_' + entries[j]][i])
-                # SdV is defined
-                if SdV != ValUnDef:
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.SdV_K16': SdV}
-                        }
-                    )
-                    # Commit K16 fluxes to master fluxes
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.SdV': SdV}
-                        }
-                    )
-                # eSdV is defined
-                if eSdV != ValUnDef:
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.eSdV_K16': eSdV}
-                        }
-                    )
-                    # Commit K16 fluxes to master fluxes
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.eSdV': eSdV}
-                        }
-                    )
-                # SdV_3sigmaUL is defined
-                if (SdV_3sigmaUL != ValUnDef):
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.SdV_3sigmaUL_K16': SdV_3sigmaUL}
-                        }
-                    )
-                    # Set SdV and eSdV for master fluxes in case of upper limit
-                    SdV = SdV_3sigmaUL
-                    eSdV = ValUpLim
-
-                    # Commit K16 fluxes to master fluxes
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.SdV': SdV}
-                        }
-                    )
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transition+'.eSdV': eSdV}
-                        }
-                    )
-
-                j = j+1
-
-        # ERROR: ID not in db['ID']
+        # Commit LIR if defined
+        if LIR != ValUnDef:
+            # LIR_40_120_K16
+            fields['LIR_40_120.K16'] = LIR
+        # No LIR measurement
         else:
-            print("Error... source should be in db.")
+            print("Warning... source has no LIR measurement.")
+
+        # Commit transitions if defined
+        j=0
+        for transition in transitions:
+            SdV = float(df['SdV_'+entries[j]][i])
+            eSdV = float(df['eSdV_'+entries[j]][i])
+            SdV_3sigmaUL = float(df['SdV_3sigmaUL_' + entries[j]][i])
+            # SdV is defined: K16 fluxes
+            if SdV != ValUnDef:
+                fields[transition+'.SdV_K16'] = SdV
+            # eSdV is defined
+            if eSdV != ValUnDef:
+                fields[transition+'.eSdV_K16'] = eSdV
+            # SdV_3sigmaUL is defined
+            if (SdV_3sigmaUL != ValUnDef):
+                fields[transition+'.SdV_3sigmaUL_K16'] = SdV_3sigmaUL
+
+            j = j+1
+        records.append((target, fields))
+    # -----------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
@@ -2961,10 +3404,6 @@ def commit_to_db_L17():
     """ Commits L17 data to db.
     """
 
-    # --- Read in L17 pkl file ---
-    df = pd.read_pickle(data_path+'Lu-et-al-2017.pkl')
-    # ----------------------------
-
     # Transitions in L17
     transitions = ['4-3','5-4','6-5','7-6','8-7','9-8','10-9','11-10','12-11',
                    '13-12']
@@ -2978,149 +3417,324 @@ def commit_to_db_L17():
     entries_err = ['eSdV_' + s for s in entries]
     entries = ['SdV_' + s for s in entries]
 
+    # --- Read in L17 Parquet file ---
+    df = read_table('Lu-et-al-2017.parquet',
+                    columns=['ID', 'LIR_8_1000']+entries+entries_err,
+                    fill_value=ValUnDef)
+    targets = _resolve_targets(df)
+    # --------------------------------
 
-    # --- Commit to db ---
+    records = []
+
+    # --- Collect LIR records ---
     for i in np.arange(0,len(df['ID'])):
-        ID = df['ID'][i]
+        target = targets[i]
         LIR = df['LIR_8_1000'][i]
 
         if int(LIR) != ValUnDef:
-            # Check if ID already exists in db['ID']
-            cursor = db.local_galaxies.find_one({'ID': ID})
-
-            # ID in db['ID']
-            if not(cursor == None):
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.L17': df['LIR_8_1000'][i]}
-                    }
-                )
-                # Commit LIR_8_1000_L17 to LIR_8_1000.MASTER
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {'LIR_8_1000.MASTER': df['LIR_8_1000'][i]}
-                    }
-                )
-            # ID not in db['ID']
-            else:
-                print("Error... source should be in db.")
+            if target is None:
+                continue
+
+            # LIR_8_1000_L17
+            records.append((target, {'LIR_8_1000.L17': df['LIR_8_1000'][i]}))
         # No LIR measurement
         else:
             print("Warning... source has no LIR measurement.")
-    # --------------------
+    # ---------------------------
+
+    # --- Convert fluxes from [W m^-2] to [Jy km/s] ---
+    # Upper limits are negative, with the abs() value being the upper limit
+    SdV_jansky = [si2jansky(np.abs(df[entries[j]].values)*1.E-17, transitions[j])
+                  for j in range(0, len(entries))]
+    eSdV_jansky = [si2jansky(df[entries_err[j]].values*1.E-17, transitions[j])
+                   for j in range(0, len(entries))]
+    # -------------------------------------------------
 
-    # --- Commit to db ---
+    # --- Collect line records ---
     for i in np.arange(0,len(df['ID'])):
-        ID = df['ID'][i]
+        target = targets[i]
+        if target is None:
+            continue
 
         # Loop over line entries for each source
+        fields = {}
         j=0
         for entry in entries:
-            entry_err = entries_err[j]
-            # Fixing errors, upper limits and undefined values
             SdV = float(df[entry][i])
-            eSdV = float(df[entry_err][i])
-
-            # Check if ID already exists in db['ID'] or db['ID_ALT']
-            cursor = db.local_galaxies.find_one({'ID': ID})
 
-            # ID in db['ID']
-            if not(cursor == None):
-                # SdV is detected
-                if SdV > 0:
-                    # Convert fluxes from [W m^-2] to [Jy km/s]
-                    SdV = SdV*1.E-17
-                    SdV = line_flux_conversion(freq[transitions[j]], SdV, conversion='si2jansky')[0]
-                    eSdV = eSdV*1.E-17
-                    eSdV = line_flux_conversion(freq[transitions[j]], eSdV, conversion='si2jansky')[0]
-                    # Commit to db
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.SdV_L17': SdV}
-                        }
-                    )
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.eSdV_L17': eSdV}
-                        }
-                    )
-                # Upper limit
-                elif SdV < 0 and SdV > -90:
-                    # Convert fluxes from [W m^-2] to [Jy km/s]
-                    SdV_3sigmaUL = abs(SdV)*1.E-17
-                    SdV_3sigmaUL = line_flux_conversion(freq[transitions[j]], SdV_3sigmaUL, conversion='si2jansky')[0]
-                    # Commit to db
-                    db.local_galaxies.update_one(
-                        {
-                            'ID': {
-                                "$eq": ID
-                                }
-                            },
-                        {'$set': {transitions[j]+'.SdV_3sigmaUL_L17': SdV_3sigmaUL}
-                        }
-                    )
-                    # Set SdV and eSdV for master fluxes
-                    SdV = SdV_3sigmaUL
-                    eSdV = ValUpLim
-
-                # Commit L17 fluxes to master fluxes
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {transitions[j]+'.SdV': SdV}
-                    }
-                )
-                db.local_galaxies.update_one(
-                    {
-                        'ID': {
-                            "$eq": ID
-                            }
-                        },
-                    {'$set': {transitions[j]+'.eSdV': eSdV}
-                    }
-                )
-            # ID not in db['ID']
-            else:
-                print("Error... source should be in db.")
+            # SdV is detected
+            if SdV > 0:
+                fields[transitions[j]+'.SdV_L17'] = SdV_jansky[j][i]
+                fields[transitions[j]+'.eSdV_L17'] = eSdV_jansky[j][i]
+            # Upper limit
+            elif SdV < 0 and SdV > -90:
+                fields[transitions[j]+'.SdV_3sigmaUL_L17'] = SdV_jansky[j][i]
             j=j+1
+        records.append((target, fields))
+    # ----------------------------
+
+    # --- Commit to db ---
+    _commit_records(records)
     # --------------------
 
 
+def _first_defined(candidates):
+    """ Returns an aggregation expression for the value of the first of the
+        (field path, value) candidates whose field is set (missing if none).
+    """
+    return {'$switch': {'branches': [{'case': {'$gt': [path, None]}, 'then': value}
+                                     for path, value in candidates],
+                        'default': '$$REMOVE'}}
+
+
+def resolve_master_values(name=None):
+    """ Derives the master values of all sources in collection name (default:
+        commit_collection_name) from their survey fields (see
+        StorageBackend.set_master_values; on MongoDB in one aggregation pass
+        whose results are written back with $merge).
+
+        LIR_8_1000.MASTER is the LIR of the first survey in
+        master_priority_LIR that has one. The SdV and eSdV of each transition
+        in master_transitions are those of the first survey in
+        master_priority_lines with a flux or an upper limit; for an upper
+        limit, SdV is the upper limit and eSdV is ValUpLim. The survey fields
+        themselves are not changed.
+    """
+    if name is None:
+        name = commit_collection_name
+
+    # --- Candidates for the master values, in order of priority ---
+    candidates = {'LIR_8_1000.MASTER': [(field+'.'+survey, field+'.'+survey)
+                                        for survey, field in master_priority_LIR]}
+    for transition in master_transitions:
+        SdV = []
+        eSdV = []
+        for survey in master_priority_lines:
+            UL = transition+'.SdV_3sigmaUL_'+survey
+            flux = transition+'.SdV_'+survey
+            error = transition+'.eSdV_'+survey
+            SdV = SdV + [(UL, UL), (flux, flux)]
+            eSdV = eSdV + [(UL, ValUpLim), (flux, error)]
+        candidates[transition+'.SdV'] = SdV
+        candidates[transition+'.eSdV'] = eSdV
+    # ---------------------------------------------------------------
+
+    get_storage().set_master_values(name, candidates)
+
+
+class DocumentCache(object):
+    """ In-process LRU cache of source documents, keyed by the requested ID.
+
+        At most size IDs are cached, the least recently used are evicted
+        first. All entries are dropped when the build generation (see
+        get_build_generation) changes, which is checked on every get if
+        check_interval is 0, and else at most every check_interval seconds
+        (so entries can be stale for that long after another process
+        swapped in a build). A build or rollback in this process drops them
+        at once.
+    """
 
-def extract_source_from_db(ID):
-    """ Extract entry for a single source
+    def __init__(self, size=None, check_interval=None):
+        if size is None:
+            size = document_cache_size
+        if check_interval is None:
+            check_interval = document_cache_check_interval
+        self.size = size
+        self.check_interval = check_interval
+        self.documents = OrderedDict()
+        self.generation = None
+        self.checked = None
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, force=False):
+        """ Drops all entries if the build generation has changed.
+        """
+        now = time.monotonic()
+        if not(force) and self.checked is not None and now-self.checked < self.check_interval:
+            return
+
+        generation = get_build_generation()
+        if generation != self.generation:
+            self.documents.clear()
+            self.generation = generation
+        self.checked = now
+
+    def get(self, ID):
+        """ Returns (True, documents) if ID is cached and (False, None) if not.
+        """
+        self.validate()
+        if ID not in self.documents:
+            self.misses = self.misses + 1
+            return False, None
+
+        self.documents.move_to_end(ID)
+        self.hits = self.hits + 1
+        return True, copy.deepcopy(self.documents[ID])
+
+    def put(self, ID, documents):
+        """ Stores the documents of ID, evicting the least recently used IDs.
+        """
+        self.documents[ID] = copy.deepcopy(documents)
+        self.documents.move_to_end(ID)
+        while len(self.documents) > self.size:
+            self.documents.popitem(last=False)
+
+    def clear(self):
+        """ Removes all entries.
+        """
+        self.documents.clear()
+
+
+def get_document_cache():
+    """ Returns the module-wide DocumentCache, which is created on first use.
     """
+    global document_cache
+    if document_cache is None:
+        document_cache = DocumentCache()
+
+    return document_cache
+
+
+def extract_source_from_db(ID, cache=True):
+    """ Extract entry for a single source (see get_sources for many sources)
 
-    cursor = db.local_galaxies.find({'ID': {'$eq': ID}})
+        Returns the list of documents matching ID on ID, or else on ID_ALT
+        (a list rather than a pymongo cursor, so use len() instead of
+        .count()). Repeated lookups are served from the document cache (see
+        DocumentCache), unless cache is False.
+    """
+    if cache:
+        found, documents = get_document_cache().get(ID)
+        if found:
+            return documents
+
+    documents = list(get_storage().find(collection_name, [ID]))
+    matches = [document for document in documents if document.get('ID') == ID]
     # ID not in db['ID']
-    if cursor == None:
-        cursor = db.local_galaxies.find({'ID_ALT': {'$eq': ID}})
+    if len(matches) == 0:
+        matches = [document for document in documents if document.get('ID_ALT') == ID]
+    documents = matches
+
+    if cache:
+        get_document_cache().put(ID, documents)
 
-    return cursor
+    return documents
+
+
+def get_sources(IDs, fields=None, as_frame=True):
+    """ Returns the db entries of the sources IDs, which are matched on ID or
+        ID_ALT with a single query.
+
+        fields is a list of (dotted) fields to return, e.g. ['z',
+        'LIR_8_1000.MASTER', '12CO(1-0).SdV'], and defaults to all fields.
+        Returns a DataFrame indexed by the requested IDs (in the order of
+        IDs) with nested fields flattened into dotted columns, or with
+        as_frame=False an iterator of (ID, document) in the order of the db
+        (matches on ID_ALT last). IDs not in db are reported with a warning and listed in DataFrame.attrs['missing'].
+    """
+    IDs = list(dict.fromkeys(IDs))
+    if fields is not None:
+        fields = ['ID', 'ID_ALT']+list(fields)
+
+    cursor = get_storage().find(collection_name, IDs, fields)
+    if not as_frame:
+        return _iter_sources(IDs, cursor)
+
+    documents = dict(_iter_sources(IDs, cursor))
+    found = [ID for ID in IDs if ID in documents]
+    df = pd.json_normalize([documents[ID] for ID in found])
+    df.index = pd.Index(found, name='ID_QUERY')
+    df.attrs['missing'] = [ID for ID in IDs if ID not in documents]
+
+    return df
+
+
+def export_table(transitions=None, surveys=None, fields=None, fill_value=None,
+                 as_arrow=False):
+    """ Exports a flat table of all sources in db, e.g. for a SLED analysis.
+
+        Columns are the (dotted) fields (default: ID, ID_ALT, z and
+        LIR_8_1000.MASTER), followed by the master SdV and eSdV of each of
+        transitions (default: master_transitions) and, for each of surveys
+        (e.g. ['K16', 'L17']), the survey's SdV, eSdV and SdV_3sigmaUL. Column
+        names are the field names with '.' replaced by '_', e.g.
+        12CO(6-5)_SdV_L17.
+
+        The columns are flattened and cast to float (except ID and ID_ALT)
+        by the storage backend (see StorageBackend.export; on MongoDB by a
+        $project on the db server). Missing values are null, or fill_value
+        if given (e.g. ValUnDef). Returns a DataFrame, or with as_arrow=True
+        an Arrow table.
+    """
+    if transitions is None:
+        transitions = master_transitions
+    if surveys is None:
+        surveys = []
+    if fields is None:
+        fields = ['ID', 'ID_ALT', 'z', 'LIR_8_1000.MASTER']
+
+    # --- Fields to export ---
+    subfields = ['SdV', 'eSdV']
+    for survey in surveys:
+        subfields = subfields + ['SdV_'+survey, 'eSdV_'+survey, 'SdV_3sigmaUL_'+survey]
+    fields = list(fields) + [transition+'.'+subfield for transition in transitions
+                             for subfield in subfields]
+    # ------------------------
+
+    # --- Read into Arrow arrays ---
+    schema = []
+    for field in fields:
+        column = field.replace('.', '_')
+        if field in ['ID', 'ID_ALT']:
+            schema.append((column, field, pa.string()))
+        else:
+            schema.append((column, field, pa.float64()))
+    table = get_storage().export(collection_name, schema)
+    table = _fill_nulls(table, fill_value)
+    # ------------------------------
+
+    if as_arrow:
+        return table
+
+    return table.to_pandas()
+
+
+def _iter_sources(IDs, cursor):
+    """ Yields (ID, document) for each of IDs matched by the documents in
+        cursor, and warns about the IDs that were not matched. As in
+        extract_source_from_db, a match on ID takes precedence over a match
+        on ID_ALT, so the latter are yielded last.
+    """
+    missing = set(IDs)
+    matches_alt = {}
+    for document in cursor:
+        document.pop('_id', None)
+        # A document can match a requested ID and ID_ALT
+        ID = document.get('ID')
+        if ID in missing:
+            missing.discard(ID)
+            matches_alt.pop(ID, None)
+            yield ID, document
+        ID_ALT = document.get('ID_ALT')
+        if ID_ALT in missing and ID_ALT not in matches_alt:
+            matches_alt[ID_ALT] = document
+
+    for ID in IDs:
+        if ID in matches_alt and ID in missing:
+            missing.discard(ID)
+            yield ID, matches_alt[ID]
+
+    if len(missing) > 0:
+        print("Warning... "+str(len(missing))+" sources not in db: "+
+              ", ".join(str(ID) for ID in IDs if ID in missing))
 
 
 def _progressBar(preample, value, endvalue, bar_length=20):
     """ Outputs progress bar to terminal.
     """
+    if not show_progress:
+        return
 
     percent = float(value) / endvalue
     arrow = '-' * int(round(percent * bar_length)-1) + '>'
@@ -0,0 +1,1161 @@
+""" Regression tests of galaxies_db.
+
+Run from the package root with
+                >python -m pytest tests
+"""
+
+import glob
+import itertools
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import numpy
+import pandas as pd
+import pytest
+
+package_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(package_path, 'src'))
+raw_data_path = os.path.join(package_path, 'raw-data')+'/'
+
+import galaxies_db
+
+
+# --- Fixtures ---
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """ An SQLite storage backend in tmp_path, which is also data_path, as
+        the storage of db, committing to collection 'test'.
+    """
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    monkeypatch.setattr(galaxies_db, 'data_path', str(tmp_path)+'/')
+    monkeypatch.setattr(galaxies_db, 'storage', backend)
+    monkeypatch.setattr(galaxies_db, 'commit_collection_name', 'test')
+    backend.initialize('test')
+
+    return backend
+# ----------------
+
+
+# --- Aliases ---
+def replace_aliases(names, aliases):
+    """ The per-alias replacement of map_id_raw_to_id before the alias
+        tables were compiled: each rule in turn renames all names containing
+        its substring.
+    """
+    names = list(names)
+    for substring, name in aliases:
+        names = [name if substring in x else x for x in names]
+
+    return names
+
+
+def alias_test_names(aliases, column):
+    """ Returns the raw names of column in the shipped pickles, plus the
+        substrings and names of the alias table, also embedded in longer names
+        and joined in pairs (which several rules match, in either order).
+    """
+    names = []
+    for filename in sorted(glob.glob(raw_data_path+'*.pkl')):
+        table = pd.read_pickle(filename)
+        if column in table.columns:
+            # Column access fails on pickles of old pandas versions
+            values = table.values[:, list(table.columns).index(column)]
+            names = names + [x for x in values if isinstance(x, str)]
+    for substring, name in aliases:
+        names = names + [substring, name, 'x'+substring+'y', name+'_1']
+    for (substring_1, name_1), (substring_2, name_2) in itertools.permutations(aliases, 2):
+        names = names + [substring_1+substring_2, name_1+substring_2]
+
+    return names + ['', 'NGC0001']
+
+
+@pytest.mark.parametrize('aliases, column',
+                         [(galaxies_db.id_aliases, 'ID_RAW'),
+                          (galaxies_db.id_alt_aliases, 'ID_ALT_RAW')])
+def test_apply_aliases_matches_replacement_loop(aliases, column):
+    names = alias_test_names(aliases, column)
+    mapped = galaxies_db.apply_aliases(pd.Series(names),
+                                       galaxies_db.compile_aliases(aliases))
+    assert list(mapped) == replace_aliases(names, aliases)
+
+
+def test_apply_aliases_folds_chained_rules():
+    # The name of a rule can contain the substring of a later rule
+    aliases = [('A1', 'B1'), ('B', 'C'), ('C', 'D'), ('X', 'A1')]
+    names = ['A1', 'xA1x', 'B', 'C', 'X', 'XB', 'Y', '']
+    mapped = galaxies_db.apply_aliases(pd.Series(names),
+                                       galaxies_db.compile_aliases(aliases))
+    assert list(mapped) == replace_aliases(names, aliases)
+# ---------------
+
+
+# --- Raw tables ---
+# (filename, delimiter, usecols, schema by column, header length, rows) of the
+# reads in make_pickle_*
+raw_tables = [
+    (galaxies_db.table1_name_A09, '&', [0,1,6], {}, 33, 202),
+    (galaxies_db.table_name_G14, None, [0,1,2,3], {1: float}, 1, 68),
+    (galaxies_db.table1_name_R15, '&', [0,1,2,3,4,5,6], {3: float}, 4, 29),
+    (galaxies_db.table2_name_R15, '&', list(range(0,16)), {}, 20, 29),
+    (galaxies_db.table3_name_R15, '&', list(range(0,10)), {2: float}, 12, 29),
+    (galaxies_db.table1_name_I15, '&', [0,3,4,6], {4: float}, 3, 76),
+    (galaxies_db.table2_name_I15, '&', [0,1,2,3,4,5,6], {}, 18, 31),
+    (galaxies_db.table3_name_I15, '&', [0,1,2,3,4,5,6], {}, 18, 18),
+    (galaxies_db.table4_name_I15, '&', [0,1,2,3,4,5,6], {}, 19, 19),
+    (galaxies_db.table5_name_I15, '&', [0,1,2,3,4,5,6], {}, 17, 20),
+    (galaxies_db.table1_name_K16, '|', [0,1,2,3], {3: float}, 1, 227),
+    (galaxies_db.table2_name_K16, '|', [0,1,2,3,4,5,6], {3: float}, 45, 2529),
+    # The skiprows=49 before header detection read the column heads and
+    # units as two more rows
+    (galaxies_db.table3_name_K16, '|', list(range(0,11)), {}, 51, 753),
+    (galaxies_db.table1_name_L17, '&', [0,3,4,5,6], {}, 0, 127),
+    (galaxies_db.table4_name_L17, '&', list(range(0,27))+[118,119,120], {}, 0, 127),
+    (galaxies_db.table1_name_J17, '&', [0,1,2,3], {3: float}, 2, 71)]
+
+
+@pytest.mark.parametrize('filename, delimiter, usecols, schema, header, rows', raw_tables)
+def test_read_raw_table_detects_header(filename, delimiter, usecols, schema, header,
+                                       rows, monkeypatch):
+    typed = list(schema.items())
+    assert galaxies_db._header_length(raw_data_path+filename, delimiter,
+                                      max(usecols)+1, typed) == header
+
+    monkeypatch.setattr(galaxies_db, 'data_path', raw_data_path)
+    names = ['c'+str(k) for k in usecols]
+    table = galaxies_db.read_raw_table(filename, names, delimiter=delimiter,
+                                       usecols=usecols, skipinitialspace=True,
+                                       schema={'c'+str(k): x for k, x in schema.items()})
+    assert len(table) == rows
+
+
+def test_read_raw_table_skips_column_heads(monkeypatch):
+    monkeypatch.setattr(galaxies_db, 'data_path', raw_data_path)
+    table = galaxies_db.read_raw_table(galaxies_db.table3_name_K16, ['ID_RAW', 'transition'],
+                                       delimiter='|', usecols=[0,1])
+    assert table.ID_RAW.iloc[0].strip() == 'NGC0023'
+    assert not table.ID_RAW.str.strip().isin(['ID', '']).any()
+# --------------------
+
+
+# --- Parquet tables ---
+def test_table_round_trip_keeps_string_nulls(tmp_path, monkeypatch):
+    monkeypatch.setattr(galaxies_db, 'data_path', str(tmp_path)+'/')
+    df = pd.DataFrame({'ID': ['NGC0001', 'NGC0002', 'NGC0003'],
+                       'z': [0.01, galaxies_db.ValUnDef, 0.03],
+                       'SdV_CO10': ['1.2(0.3)', None, float('nan')],
+                       'type': ['', 'SB', None]})
+    galaxies_db.write_table(df, 'test.parquet')
+
+    table = galaxies_db.read_table('test.parquet', fill_value=galaxies_db.ValUnDef)
+    assert list(table.ID) == list(df.ID)
+    assert list(table.z) == list(df.z)
+    assert list(table.SdV_CO10) == ['1.2(0.3)', None, None]
+    assert list(table.type) == ['', 'SB', None]
+# ----------------------
+
+
+# --- Line fluxes ---
+def test_parse_line_fluxes_missing_entries_are_undefined(capsys):
+    column = ['1.5', None, float('nan'), '2.0(3.0)^a', '0.4^b', '-', 'n/a']
+    SdV, eSdV, flags = galaxies_db.parse_line_fluxes(column, galaxies_db.footnotes_R15,
+                                                     error=0.1)
+    output = capsys.readouterr().out
+
+    assert list(flags) == [galaxies_db.FluxDetected, galaxies_db.FluxUnDef,
+                           galaxies_db.FluxUnDef, galaxies_db.FluxApCorr,
+                           galaxies_db.FluxUpLim, galaxies_db.FluxUnDef,
+                           galaxies_db.FluxUnDef]
+    assert SdV[0] == 1.5 and SdV[3] == 3.0 and SdV[4] == 0.4
+    assert eSdV[0] == pytest.approx(0.15)
+    # Only the malformed string is reported
+    assert "unparsed line fluxes: ['n/a']" in output
+# -------------------
+
+
+# --- Extended sources ---
+def remove_extended_sources_loop(DataFrame, sources):
+    """ The removal of remove_extended_sources before the names were
+        compiled: each name in turn drops the rows whose ID or ID_ALT
+        contains it.
+    """
+    for ID in sources:
+        indices = [i for i, x in enumerate(DataFrame.ID) if ID in x]
+        DataFrame = DataFrame.drop(DataFrame.index[indices])
+        if 'ID_ALT' in DataFrame.columns:
+            indices = [i for i, x in enumerate(DataFrame.ID_ALT) if ID in x]
+            DataFrame = DataFrame.drop(DataFrame.index[indices])
+
+    return DataFrame.reset_index(level=0, drop=True)
+
+
+def test_remove_extended_sources_matches_loop():
+    sources = galaxies_db.extended_sources
+    IDs = ['NGC0001', 'NGC2146NW', 'xIC694y', 'Arp299', 'NGC4038', 'SgrA*', 'NGC3256',
+           'NGC7771', 'M82', 'NGC5010', 'IRAS05223+1908', 'Arp220', 'NGC1365']
+    IDs_ALT = ['', '', 'UGC0001', '', 'NGC0002', 'SgrA', '', '', 'UGC06742', '', '',
+               'MilkyWay', 'Arp299A']
+    df = pd.DataFrame({'ID': IDs, 'ID_ALT': IDs_ALT, 'z': numpy.arange(0, len(IDs))*0.01},
+                      index=numpy.arange(0, len(IDs))+5)
+
+    removed = galaxies_db.remove_extended_sources(df)
+    pd.testing.assert_frame_equal(removed, remove_extended_sources_loop(df, sources))
+    assert list(removed.ID) == ['NGC0001', 'NGC7771']
+
+    # Only ID is matched without an ID_ALT column
+    removed = galaxies_db.remove_extended_sources(df[['ID', 'z']])
+    pd.testing.assert_frame_equal(removed, remove_extended_sources_loop(df[['ID', 'z']], sources))
+    assert list(removed.ID) == ['NGC0001', 'NGC7771', 'M82', 'Arp220']
+
+    removed = galaxies_db.remove_extended_sources(df, sources=['NGC0', 'Arp'])
+    assert list(removed.ID) == ['NGC2146NW', 'xIC694y', 'SgrA*', 'NGC3256', 'NGC7771',
+                                'M82', 'NGC5010', 'IRAS05223+1908']
+    pd.testing.assert_frame_equal(galaxies_db.remove_extended_sources(df, sources=[]),
+                                  df.reset_index(drop=True))
+
+
+def test_extended_sources_are_separate_names():
+    # A missing comma once joined 'Arp299A' and 'NGC4038' into one name
+    assert 'Arp299A' in galaxies_db.extended_sources
+    assert 'NGC4038' in galaxies_db.extended_sources
+    assert not any('Arp299ANGC4038' in x for x in galaxies_db.extended_sources)
+# ------------------------
+
+
+# --- Survey tables ---
+@pytest.fixture
+def raw_data(tmp_path, monkeypatch):
+    """ tmp_path as data_path, holding links to the raw tables.
+    """
+    for filename in os.listdir(raw_data_path):
+        if not filename.endswith('.pkl'):
+            os.symlink(raw_data_path+filename, str(tmp_path/filename))
+    monkeypatch.setattr(galaxies_db, 'data_path', str(tmp_path)+'/')
+
+    return tmp_path
+
+
+def record_extended_source_removal(monkeypatch):
+    """ Returns the list to which copies of the tables returned by
+        remove_extended_sources are appended.
+    """
+    tables = []
+    remove_extended_sources = galaxies_db.remove_extended_sources
+
+    def function(DataFrame, sources=None):
+        DataFrame = remove_extended_sources(DataFrame, sources)
+        tables.append(DataFrame.copy())
+        return DataFrame
+
+    monkeypatch.setattr(galaxies_db, 'remove_extended_sources', function)
+
+    return tables
+
+
+def K16_lines_per_row(table1, table2, table3):
+    """ The line fluxes of K16 as computed row by row in make_pickle_K16
+        before the tables were grouped: {column: list of values of table1}.
+    """
+    ValUnDef = galaxies_db.ValUnDef
+
+    # --- Fix transition identification ---
+    transitions_2 = []
+    for transition in table2.transition:
+        if 'CO' in transition:
+            transition = '12'+transition[transition.find('CO'):transition.find('CO')+2]+ \
+                         '('+transition[transition.find('CO')+2:]+')'
+        if 'CI1' in transition:
+            transition = '[CI]609'
+        if 'CI2' in transition:
+            transition = '[CI]370'
+        if 'NII' in transition:
+            transition = '[NII]205'
+        transitions_2.append(transition)
+    transitions_3 = []
+    for transition in table3.transition.astype(str):
+        name_3 = transition
+        for J_up, name in [('1', "12CO(1-0)"), ('2', "12CO(2-1)"), ('3', "12CO(3-2)"),
+                           ('4', "12CO(4-3)"), ('6', "12CO(6-5)"), ('7', "12CO(7-6)")]:
+            if J_up in transition:
+                name_3 = name
+        transitions_3.append(name_3)
+    # -------------------------------------
+
+    transitions = ['12CO('+x+')' for x in ['1-0', '2-1', '3-2', '4-3', '5-4', '6-5', '7-6', '8-7',
+                                           '9-8', '10-9', '11-10', '12-11', '13-12']]
+    transitions = transitions + ['[CI]609', '[CI]370', '[NII]205']
+    entries = ['CO'+x for x in ['10', '21', '32', '43', '54', '65', '76', '87', '98', '109',
+                                '1110', '1211', '1312']]
+    entries = entries + ['CI609', 'CI370', 'NII205']
+
+    IDs = list(table1.ID)
+    lines = {}
+    for q in range(0, len(transitions)):
+        SdV = [ValUnDef]*len(IDs)
+        eSdV = [ValUnDef]*len(IDs)
+        SdV_3sigmaUL = [ValUnDef]*len(IDs)
+        if q < 3:
+            rows = [j for j in range(0, len(table3)) if transitions_3[j] == transitions[q]]
+            for i, ID in enumerate(IDs):
+                matches = [j for j in rows if table3.ID.values[j] == ID]
+                values = pd.Series([float(table3.SdV.values[j]) for j in matches], dtype=float)
+                errors = [float(table3.eSdV.values[j]) for j in matches]
+                if len(matches) == 1:
+                    if values[0] > 0:
+                        SdV[i] = values[0]
+                    if errors[0] > 0:
+                        eSdV[i] = errors[0]
+                if len(matches) > 1:
+                    SdV[i] = values.mean()
+                    eSdV[i] = values.std(ddof=0)
+        else:
+            for j in range(0, len(table2)):
+                if transitions_2[j] != transitions[q]:
+                    continue
+                low = table2.SdV_1sigma_low.values[j]
+                high = table2.SdV_1sigma_high.values[j]
+                error = table2.SdV.values[j] if high == low else (high-low)/2.
+                for i, ID in enumerate(IDs):
+                    if ID == table2.ID.values[j]:
+                        if table2.SdV.values[j] > 0:
+                            SdV[i] = table2.SdV.values[j]
+                        if error > 0:
+                            eSdV[i] = error
+                        if table2.SdV_3sigma_ul.values[j] > 0:
+                            SdV_3sigmaUL[i] = table2.SdV_3sigma_ul.values[j]
+        lines['SdV_'+entries[q]] = SdV
+        lines['eSdV_'+entries[q]] = eSdV
+        lines['SdV_3sigmaUL_'+entries[q]] = SdV_3sigmaUL
+
+    # The Parquet file has always held SdV_CO32 as SdV_CO21
+    lines['SdV_CO21'] = lines['SdV_CO32']
+
+    return lines
+
+
+def test_K16_lines_match_per_row_loop(raw_data, monkeypatch):
+    tables = record_extended_source_removal(monkeypatch)
+    galaxies_db.make_pickle_K16()
+    table1, table2, table3 = tables
+
+    df = galaxies_db.read_table('Kamenetzky-et-al-2016.parquet', fill_value=galaxies_db.ValUnDef)
+    assert list(df.ID) == list(table1.ID)
+    lines = K16_lines_per_row(table1, table2, table3)
+    assert sorted(lines) == sorted(x for x in df.columns if 'SdV' in x)
+    for column, values in lines.items():
+        assert df[column].values == pytest.approx(numpy.array(values, dtype=float),
+                                                  rel=1.E-12, nan_ok=True), column
+
+
+def test_aperture_correct_matches_L17_loop(raw_data):
+    lines = ['CO43', 'CO54', 'CO65', 'CO76', 'CO87', 'CO98', 'CO109', 'CO1110', 'CO1211',
+             'CO1312', 'CI609', 'CI370', 'NII205']
+    table = galaxies_db.read_raw_table(galaxies_db.table4_name_L17,
+                                       names=['ID_RAW']+['SdV_'+x for x in lines]+
+                                             ['eSdV_'+x for x in lines]+['f_35', 'f_30', 'f_17'],
+                                       usecols=list(range(0, 27))+[118, 119, 120])
+    table = galaxies_db.remove_extended_sources(galaxies_db.map_id_raw_to_id(table))
+    # Upper limits and undefined fluxes
+    table.loc[0, 'SdV_CO43'] = -1.
+    table.loc[1, 'SdV_CO65'] = galaxies_db.ValUnDef
+    table.loc[2, 'SdV_CO98'] = numpy.nan
+
+    # The per-row correction of make_pickle_L17 before aperture_correct
+    beams = {'CO43': 'f_35', 'CI609': 'f_35', 'CO54': 'f_35', 'CO65': 'f_30', 'CO76': 'f_35',
+             'CI370': 'f_35', 'CO87': 'f_35', 'CO98': 'f_17', 'CO109': 'f_17',
+             'CO1110': 'f_17', 'CO1211': 'f_17', 'NII205': 'f_17', 'CO1312': 'f_17'}
+    expected = table.copy()
+    for i in range(0, len(expected)):
+        for line, beam in beams.items():
+            if expected['SdV_'+line].loc[i] > 0:
+                expected.loc[i, 'SdV_'+line] = expected['SdV_'+line].loc[i]/expected[beam].loc[i]
+
+    table = galaxies_db.aperture_correct(table, galaxies_db.aperture_corrections_L17)
+    for column in expected.columns:
+        if column.startswith(('SdV', 'eSdV')):
+            assert table[column].values == pytest.approx(expected[column].values.astype(float),
+                                                         rel=1.E-12, nan_ok=True), column
+    assert table.loc[0, 'SdV_CO43'] == -1.
+    assert table.loc[1, 'SdV_CO65'] == galaxies_db.ValUnDef
+
+
+def test_aperture_correct_takes_factors_per_row():
+    table = pd.DataFrame({'SdV_CO10': [2., -1., 4.], 'SdV_CO21': [3., 6., galaxies_db.ValUnDef]})
+    table = galaxies_db.aperture_correct(table, {'SdV_CO10': 2., 'SdV_CO21': [1., 3., 5.]})
+    assert list(table.SdV_CO10) == [1., -1., 2.]
+    assert list(table.SdV_CO21) == [3., 2., galaxies_db.ValUnDef]
+# -----------------------
+
+
+# --- NED redshifts ---
+def age_entry(cache, ID, age):
+    """ Backdates the cache entry of ID by age seconds.
+    """
+    cache.connection.execute('UPDATE redshifts SET time = time-? WHERE ID = ?',
+                             (age, cache.normalize(ID)))
+    cache.connection.commit()
+
+
+def test_ned_cache_queries_once_and_expires(tmp_path, monkeypatch):
+    queries = []
+    def query(ID):
+        queries.append(ID)
+        return {'NGC 1068': 0.0038, 'NGC1068': 0.0037}.get(ID, float('nan'))
+    monkeypatch.setattr(galaxies_db, '_query_ned_redshift', query)
+    cache = galaxies_db.NedCache(path=str(tmp_path/'ned.sqlite'), ttl=3600.)
+
+    assert cache.query('NGC 1068') == 0.0038
+    assert cache.query('ngc1068') == 0.0038
+    assert math.isnan(cache.query('NGC0001'))
+    assert math.isnan(cache.query('NGC0001'))
+    assert queries == ['NGC 1068', 'NGC0001']
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    age_entry(cache, 'NGC1068', 7200.)
+    assert cache.get('NGC1068') == (False, None)
+    assert cache.query('NGC1068') == 0.0037
+    assert queries == ['NGC 1068', 'NGC0001', 'NGC1068']
+
+    age_entry(cache, 'NGC0001', 7200.)
+    assert cache.evict() == 1
+    assert cache.get('NGC0001') == (False, None)
+
+
+def test_ned_cache_offline_never_queries(tmp_path, monkeypatch):
+    def query(ID):
+        raise AssertionError("NED queried in offline mode")
+    monkeypatch.setattr(galaxies_db, '_query_ned_redshift', query)
+    path = str(tmp_path/'ned.sqlite')
+    galaxies_db.NedCache(path=path).put('NGC1068', 0.0038)
+    cache = galaxies_db.NedCache(path=path, ttl=3600., offline=True)
+
+    # Expired entries are still served
+    age_entry(cache, 'NGC1068', 7200.)
+    assert cache.query('NGC 1068') == 0.0038
+    with pytest.raises(KeyError):
+        cache.query('NGC0001')
+
+
+class FakeNed(object):
+    """ Stand-in for astroquery's Ned with canned redshifts; names without
+        one have a masked redshift.
+    """
+
+    def __init__(self, redshifts, delays=None):
+        self.redshifts = redshifts
+        self.delays = delays if delays is not None else {}
+        self.queries = []
+        self.finished = []
+
+    def query_object(self, ID):
+        self.queries.append(ID)
+        time.sleep(self.delays.get(ID, 0.))
+        self.finished.append(ID)
+        z = self.redshifts.get(ID)
+        return {'Redshift': numpy.ma.masked_array([0. if z is None else z], mask=[z is None])}
+
+
+def test_resolve_redshifts_looks_up_fallback_ids(tmp_path, monkeypatch):
+    import astroquery.ned
+
+    ned = FakeNed({'NGC0001': 0.01, 'UGC0002': 0.02, 'NGC0003': 0.03},
+                  delays={'NGC0001': 0.2})
+    monkeypatch.setattr(astroquery.ned, 'Ned', ned)
+    cache = galaxies_db.NedCache(path=str(tmp_path/'ned.sqlite'))
+
+    z = galaxies_db.resolve_redshifts(['NGC0001', 'NGC0002', 'NGC0003', 'NGC0004'],
+                                      IDs_fallback=['', 'UGC0002', '', 'UGC0004'],
+                                      cache=cache, max_workers=2, rate=1000.)
+    assert z[:3] == [0.01, 0.02, 0.03] and math.isnan(z[3])
+    assert sorted(ned.queries) == ['NGC0001', 'NGC0002', 'NGC0003', 'NGC0004',
+                                   'UGC0002', 'UGC0004']
+    # The fallback of NGC0002 was looked up while NGC0001 was still pending
+    assert ned.finished.index('UGC0002') < ned.finished.index('NGC0001')
+
+
+def test_resolve_redshifts_retries_with_backoff(tmp_path, monkeypatch):
+    from astroquery.exceptions import RemoteServiceError
+
+    attempts = []
+    def query(ID):
+        attempts.append(ID)
+        raise RemoteServiceError("The remote service returned an error, but with no message.")
+    sleeps = []
+    monkeypatch.setattr(galaxies_db.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(galaxies_db, 'ned_max_retries', 3)
+    monkeypatch.setattr(galaxies_db, 'ned_backoff', 0.5)
+    cache = galaxies_db.NedCache(path=str(tmp_path/'ned.sqlite'))
+
+    with pytest.raises(RemoteServiceError):
+        galaxies_db.resolve_redshifts(['NGC0001'], cache=cache, query=query, rate=1000.)
+    assert attempts == ['NGC0001']*4
+    assert sleeps == [0.5, 1., 2.]
+
+
+def test_resolve_redshifts_does_not_retry_unknown_names(tmp_path, monkeypatch):
+    from astroquery.exceptions import RemoteServiceError
+
+    attempts = []
+    def query(ID):
+        attempts.append(ID)
+        if ID == 'UGC0001':
+            return 0.01
+        raise RemoteServiceError("The remote service returned the following error message.\n"
+                                 "ERROR: "+ID+" is not recognized by the NED name interpreter.")
+    sleeps = []
+    monkeypatch.setattr(galaxies_db.time, 'sleep', sleeps.append)
+    cache = galaxies_db.NedCache(path=str(tmp_path/'ned.sqlite'))
+
+    z = galaxies_db.resolve_redshifts(['NGC0001', 'NGC0002'], IDs_fallback=['UGC0001', ''],
+                                      cache=cache, query=query, rate=1000.)
+    assert z[0] == 0.01 and math.isnan(z[1])
+    assert sorted(attempts) == ['', 'NGC0001', 'NGC0002', 'UGC0001']
+    assert sleeps == []
+# ----------------------
+
+
+# --- Cosmology ---
+def test_cosmology_correction_matches_astropy():
+    from astropy.cosmology import FlatLambdaCDM
+
+    z = numpy.array([1.E-7, 1.E-3, 0.0123, 0.1, 1., 6., 25.])
+    for params in [galaxies_db.cosmo_params_G14, galaxies_db.cosmo_params_I15,
+                   galaxies_db.cosmo_params_L17]:
+        # The per-source astropy correction of make_pickle_* before the grids
+        d_L = FlatLambdaCDM(H0=100.*galaxies_db.cosmo_params['h'],
+                            Om0=galaxies_db.cosmo_params['omega_M_0'],
+                            Tcmb0=galaxies_db.cosmo_params['Tcmb0']).luminosity_distance(z).value
+        d_L_params = FlatLambdaCDM(H0=100.*params['h'], Om0=params['omega_M_0'],
+                                   Tcmb0=params['Tcmb0']).luminosity_distance(z).value
+        assert galaxies_db.cosmology_correction(z, params) == \
+            pytest.approx((d_L/d_L_params)**2., rel=1.E-7)
+
+    assert math.isnan(galaxies_db.cosmology_correction([float('nan')], params)[0])
+
+
+def test_redshift_at_distance_matches_z_at_value():
+    from astropy.cosmology import FlatLambdaCDM, z_at_value
+    from astropy import units as u
+
+    params = galaxies_db.cosmo_params_I15
+    cosmo = FlatLambdaCDM(H0=100.*params['h'], Om0=params['omega_M_0'], Tcmb0=params['Tcmb0'])
+    # The distances of I15, and beyond the grid
+    d_L = numpy.array([0.7, 3.5, 17.4, 75., 250., 4.E3, 1.E6])
+    z = galaxies_db.redshift_at_distance(d_L, params)
+    # The per-source z_at_value of make_pickle_I15 before the grids
+    for i in range(0, len(d_L)):
+        assert z[i] == pytest.approx(z_at_value(cosmo.luminosity_distance, d_L[i]*u.Mpc,
+                                                zmax=1000.).value, rel=1.E-6, abs=1.E-8)
+
+    # Round trip
+    z = numpy.array([1.E-5, 1.E-3, 0.0123, 0.1, 1., 6.])
+    assert galaxies_db.redshift_at_distance(galaxies_db.luminosity_distance(z, params),
+                                            params) == pytest.approx(z, rel=1.E-6)
+
+    assert numpy.isnan(galaxies_db.redshift_at_distance([float('nan'), 0.], params)).all()
+# -----------------
+
+
+# --- Line flux conversion ---
+def test_si2jansky_matches_per_flux_conversion(monkeypatch):
+    from trgpy.emg import line_flux_conversion
+    from trgpy.dictionary_transitions import freq
+
+    monkeypatch.setattr(galaxies_db, '_si2jansky_factors', {})
+    SdV = numpy.array([1.E-17, 2.5E-18, 0., galaxies_db.ValUnDef, numpy.nan])
+    for transition in ['12CO(1-0)', '12CO(13-12)', '12CO(1-0)', '[CI](2-1)']:
+        # The conversion of each flux by make_pickle_* before the factors
+        expected = [line_flux_conversion(freq[transition], x, conversion='si2jansky')[0]
+                    for x in SdV]
+        assert galaxies_db.si2jansky(SdV, transition) == \
+            pytest.approx(numpy.array(expected, dtype=float), rel=1.E-12, nan_ok=True)
+    assert sorted(galaxies_db._si2jansky_factors) == ['12CO(1-0)', '12CO(13-12)', '[CI](2-1)']
+# ----------------------------
+
+
+# --- Master values ---
+def overwrite_master_values(document, transition, paired=False):
+    """ The master LIR and the master SdV and eSdV of transition as the survey
+        commits wrote them before resolve_master_values: in the commit order
+        of commit_to_db, the last write wins. If paired, each survey writes
+        its flux or upper limit with its own error, as resolve_master_values
+        derives them. Otherwise K16 writes its flux and error separately, and
+        R15 its flux as the error.
+    """
+    fields = document[transition]
+    master = {}
+    for survey in ['A09', 'I15', 'G14', 'R15', 'K16', 'L17']:
+        field = 'LIR_40_120' if survey == 'K16' else 'LIR_8_1000'
+        if survey in document[field]:
+            master['LIR_8_1000.MASTER'] = document[field][survey]
+
+    # I15
+    if 'SdV_I15' in fields:
+        master['SdV'] = fields['SdV_I15']
+        master['eSdV'] = fields['eSdV_I15']
+    # R15
+    if 'SdV_R15' in fields:
+        master['SdV'] = fields['SdV_R15']
+        master['eSdV'] = fields['eSdV_R15'] if paired else fields['SdV_R15']
+    elif 'SdV_3sigmaUL_R15' in fields:
+        master['SdV'] = fields['SdV_3sigmaUL_R15']
+        master['eSdV'] = galaxies_db.ValUpLim
+    # K16
+    if paired:
+        if 'SdV_K16' in fields:
+            master['SdV'] = fields['SdV_K16']
+            master['eSdV'] = fields.get('eSdV_K16')
+    else:
+        if 'SdV_K16' in fields:
+            master['SdV'] = fields['SdV_K16']
+        if 'eSdV_K16' in fields:
+            master['eSdV'] = fields['eSdV_K16']
+    if 'SdV_3sigmaUL_K16' in fields:
+        master['SdV'] = fields['SdV_3sigmaUL_K16']
+        master['eSdV'] = galaxies_db.ValUpLim
+    # L17
+    if 'SdV_L17' in fields:
+        master['SdV'] = fields['SdV_L17']
+        master['eSdV'] = fields['eSdV_L17']
+    elif 'SdV_3sigmaUL_L17' in fields:
+        master['SdV'] = fields['SdV_3sigmaUL_L17']
+        master['eSdV'] = galaxies_db.ValUpLim
+    # J17
+    if 'SdV_J17' in fields:
+        master['SdV'] = fields['SdV_J17']
+        master['eSdV'] = fields['eSdV_J17']
+
+    return dict((key, value) for key, value in master.items() if value is not None)
+
+
+def master_test_documents(transition):
+    """ Returns documents with all combinations of the fields the surveys
+        commit for transition, and of the surveys with an LIR.
+    """
+    # K16 commits its flux, error and upper limit separately
+    K16 = [{}]
+    for field, value in [('SdV_K16', 3.), ('eSdV_K16', 0.3), ('SdV_3sigmaUL_K16', 3.5)]:
+        K16 = K16 + [dict(x, **{field: value}) for x in K16]
+    surveys = [[{}, {'SdV_J17': 1., 'eSdV_J17': 0.1}],
+               [{}, {'SdV_L17': 2., 'eSdV_L17': 0.2}, {'SdV_3sigmaUL_L17': 2.5}],
+               K16,
+               [{}, {'SdV_R15': 4., 'eSdV_R15': 0.4}, {'SdV_3sigmaUL_R15': 4.5}],
+               [{}, {'SdV_I15': 5., 'eSdV_I15': 0.5}]]
+    LIR = list(itertools.product([False, True], repeat=len(galaxies_db.master_priority_LIR)))
+
+    documents = []
+    for k, states in enumerate(itertools.product(*surveys)):
+        document = {'ID': 'NGC'+str(k), 'LIR_8_1000': {}, 'LIR_40_120': {}, transition: {}}
+        for state in states:
+            document[transition].update(state)
+        for q, (survey, field) in enumerate(galaxies_db.master_priority_LIR):
+            if LIR[k % len(LIR)][q]:
+                document[field][survey] = 10.+q
+        documents.append(document)
+
+    return documents
+
+
+def test_master_values_match_paired_overwrite_order(tmp_path, monkeypatch):
+    transition = '12CO(4-3)'
+    documents = master_test_documents(transition)
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    backend.insert('test', documents)
+    monkeypatch.setattr(galaxies_db, 'storage', backend)
+    galaxies_db.resolve_master_values(name='test')
+
+    for document, resolved in zip(documents, backend.find('test')):
+        master = overwrite_master_values(document, transition, paired=True)
+        assert resolved['LIR_8_1000'].get('MASTER') == master.get('LIR_8_1000.MASTER')
+        assert resolved[transition].get('SdV') == master.get('SdV')
+        assert resolved[transition].get('eSdV') == master.get('eSdV')
+
+
+# The master values that differ from the old overwrite order
+@pytest.mark.parametrize('fields, old, new',
+                         [({'SdV_K16': 3., 'SdV_I15': 5., 'eSdV_I15': 0.5},
+                           {'SdV': 3., 'eSdV': 0.5}, {'SdV': 3.}),
+                          ({'eSdV_K16': 0.3, 'SdV_I15': 5., 'eSdV_I15': 0.5},
+                           {'SdV': 5., 'eSdV': 0.3}, {'SdV': 5., 'eSdV': 0.5}),
+                          ({'SdV_R15': 4., 'eSdV_R15': 0.4},
+                           {'SdV': 4., 'eSdV': 4.}, {'SdV': 4., 'eSdV': 0.4})])
+def test_master_values_pair_flux_and_error(fields, old, new, tmp_path, monkeypatch):
+    document = {'ID': 'NGC0001', 'LIR_8_1000': {}, 'LIR_40_120': {}, '12CO(4-3)': dict(fields)}
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    backend.insert('test', [document])
+    monkeypatch.setattr(galaxies_db, 'storage', backend)
+    galaxies_db.resolve_master_values(name='test')
+
+    resolved = next(backend.find('test'))['12CO(4-3)']
+    master = dict((key, resolved[key]) for key in ['SdV', 'eSdV'] if key in resolved)
+    assert master == new
+    assert overwrite_master_values(document, '12CO(4-3)') == old
+# ---------------------
+
+
+# --- Storage ---
+def test_sqlite_swap_keeps_previous_generation(tmp_path):
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    for k, ID in enumerate(['NGC0001', 'NGC0002', 'NGC0003']):
+        backend.initialize('staging', drop=True)
+        backend.insert('staging', [{'ID': ID}])
+        backend.swap('staging', 'live', 'previous')
+
+        assert [x['ID'] for x in backend.find('live')] == [ID]
+        assert not backend.exists('staging')
+        if k > 0:
+            assert [x['ID'] for x in backend.find('previous')] == ['NGC000'+str(k)]
+        else:
+            assert not backend.exists('previous')
+
+
+def test_sqlite_finds_documents_on_ID_and_ID_ALT(sqlite_db):
+    assert list(sqlite_db.find('other')) == []
+    sqlite_db.insert('test', [{'ID': 'NGC0001', 'z': 0.01},
+                              {'ID': 'NGC0002', 'ID_ALT': 'UGC0002', 'z': 0.02,
+                               'LIR_8_1000': {'K16': 1.E10}},
+                              {'ID': 'NGC0003', 'ID_ALT': 'NGC0001'}])
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_db.insert('test', [{'ID': 'NGC0004', 'ID_ALT': 'UGC0002'}])
+
+    documents = list(sqlite_db.find('test'))
+    assert [x['_id'] for x in documents] == sorted(x['_id'] for x in documents)
+    assert [x['ID'] for x in documents] == ['NGC0001', 'NGC0002', 'NGC0003']
+    assert documents[1] == {'_id': documents[1]['_id'], 'ID': 'NGC0002', 'ID_ALT': 'UGC0002',
+                            'z': 0.02, 'LIR_8_1000': {'K16': 1.E10}}
+
+    # In _id order, whether matched on ID or ID_ALT
+    found = list(sqlite_db.find('test', IDs=['UGC0002', 'NGC0001', 'NGC0005']))
+    assert [x['ID'] for x in found] == ['NGC0001', 'NGC0002', 'NGC0003']
+    found = list(sqlite_db.find('test', IDs=['UGC0002'], fields=['LIR_8_1000.K16']))
+    assert found == [{'_id': documents[1]['_id'], 'LIR_8_1000': {'K16': 1.E10}}]
+
+
+def test_sqlite_bulk_set_sets_dotted_fields(sqlite_db):
+    sqlite_db.insert('test', [{'ID': 'NGC0001', '12CO(1-0)': {'SdV_K16': 1.}},
+                              {'ID': 'NGC0002'}])
+    _ids = [x['_id'] for x in sqlite_db.find('test')]
+    updates = [(_ids[0], {'12CO(1-0).eSdV_K16': 0.1, 'z': 0.01}),
+               (max(_ids)+1, {'z': 0.5}),
+               (_ids[1], {}),
+               (_ids[1], {'ID_ALT': 'UGC0002', 'LIR_8_1000.MASTER.value': 1.E11})]
+    # Updates of missing documents are ignored, as with UpdateOne
+    assert sqlite_db.bulk_set('test', updates, batch_size=2) == 3
+    assert sqlite_db.count('test') == 2
+
+    documents = [dict((key, value) for key, value in x.items() if key != '_id')
+                 for x in sqlite_db.find('test')]
+    assert documents == [{'ID': 'NGC0001', '12CO(1-0)': {'SdV_K16': 1., 'eSdV_K16': 0.1},
+                          'z': 0.01},
+                         {'ID': 'NGC0002', 'ID_ALT': 'UGC0002',
+                          'LIR_8_1000': {'MASTER': {'value': 1.E11}}}]
+    # The ID_ALT column follows the document
+    assert [x['ID'] for x in sqlite_db.find('test', IDs=['UGC0002'])] == ['NGC0002']
+
+
+def test_sqlite_export_casts_columns(sqlite_db):
+    import pyarrow
+
+    sqlite_db.insert('test', [{'ID': 'NGC0001', 'z': 1, 'LIR_8_1000': {'MASTER': 1.E11}},
+                              {'ID': 'NGC0002', 'ID_ALT': 'UGC0002', 'z': float('nan')},
+                              {'ID': 'NGC0003', 'z': galaxies_db.ValUnDef,
+                               'LIR_8_1000': {'K16': 1.E10}}])
+    table = sqlite_db.export('test', [('ID', 'ID', pyarrow.string()),
+                                      ('ID_ALT', 'ID_ALT', pyarrow.string()),
+                                      ('z', 'z', pyarrow.float64()),
+                                      ('LIR', 'LIR_8_1000.MASTER', pyarrow.float64())])
+
+    assert table.schema == pyarrow.schema([('ID', pyarrow.string()), ('ID_ALT', pyarrow.string()),
+                                           ('z', pyarrow.float64()), ('LIR', pyarrow.float64())])
+    assert table.column('ID_ALT').to_pylist() == [None, 'UGC0002', None]
+    assert table.column('LIR').to_pylist() == [1.E11, None, None]
+    z = table.column('z').to_pylist()
+    assert z[0] == 1. and isinstance(z[0], float)
+    assert math.isnan(z[1]) and z[2] == galaxies_db.ValUnDef
+    assert table.column('z').null_count == 0
+
+
+def test_sqlite_copy_and_rename_replace_target(sqlite_db):
+    sqlite_db.insert('test', [{'ID': 'NGC0001'}, {'ID': 'NGC0002', 'ID_ALT': 'UGC0002'}])
+    sqlite_db.insert('target', [{'ID': 'NGC0003'}])
+    documents = list(sqlite_db.find('test'))
+
+    sqlite_db.copy('test', 'target')
+    assert list(sqlite_db.find('target')) == documents
+    assert list(sqlite_db.find('test')) == documents
+    # The copy keeps the unique indexes
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_db.insert('target', [{'ID': 'NGC0004', 'ID_ALT': 'UGC0002'}])
+
+    sqlite_db.insert('test', [{'ID': 'NGC0005'}])
+    sqlite_db.rename('test', 'target')
+    assert not sqlite_db.exists('test')
+    assert [x['ID'] for x in sqlite_db.find('target')] == ['NGC0001', 'NGC0002', 'NGC0005']
+
+
+def test_sqlite_sets_master_values_of_first_candidate(sqlite_db):
+    sqlite_db.insert('test', [{'ID': 'NGC0001', 'LIR_8_1000': {'K16': 1., 'L17': 2.},
+                               '12CO(1-0)': {'SdV_3sigmaUL_K16': 0.3}},
+                              {'ID': 'NGC0002', 'LIR_8_1000': {'L17': 2.},
+                               '12CO(1-0)': {'SdV_A09': 1., 'eSdV_A09': 0.1}},
+                              {'ID': 'NGC0003', '12CO(1-0)': {'SdV_G14': 3.}}])
+    candidates = {'LIR_8_1000.MASTER': [('LIR_8_1000.K16', 'LIR_8_1000.K16'),
+                                        ('LIR_8_1000.L17', 'LIR_8_1000.L17')],
+                  '12CO(1-0).SdV': [('12CO(1-0).SdV_3sigmaUL_K16', galaxies_db.ValUpLim),
+                                    ('12CO(1-0).SdV_A09', '12CO(1-0).SdV_A09')],
+                  '12CO(1-0).eSdV': [('12CO(1-0).SdV_3sigmaUL_K16',
+                                      '12CO(1-0).SdV_3sigmaUL_K16'),
+                                     ('12CO(1-0).SdV_A09', '12CO(1-0).eSdV_A09')]}
+    sqlite_db.set_master_values('test', candidates)
+
+    documents = [dict((key, value) for key, value in x.items() if key != '_id')
+                 for x in sqlite_db.find('test')]
+    assert documents == [{'ID': 'NGC0001', 'LIR_8_1000': {'K16': 1., 'L17': 2., 'MASTER': 1.},
+                          '12CO(1-0)': {'SdV_3sigmaUL_K16': 0.3, 'SdV': galaxies_db.ValUpLim,
+                                        'eSdV': 0.3}},
+                         {'ID': 'NGC0002', 'LIR_8_1000': {'L17': 2., 'MASTER': 2.},
+                          '12CO(1-0)': {'SdV_A09': 1., 'eSdV_A09': 0.1, 'SdV': 1.,
+                                        'eSdV': 0.1}},
+                         {'ID': 'NGC0003', '12CO(1-0)': {'SdV_G14': 3.}}]
+
+
+def test_sqlite_lookups_stay_within_variable_limit(tmp_path):
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    # The default limit of SQLite before 3.32
+    if hasattr(backend.connection, 'setlimit'):
+        backend.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    documents = [{'ID': 'NGC'+str(k)} if k % 2 == 0 else {'ID': 'NGC'+str(k), 'ID_ALT': 'UGC'+str(k)}
+                 for k in range(0, 1200)]
+    backend.initialize('test')
+    backend.insert('test', documents)
+
+    IDs = [x.get('ID_ALT', x['ID']) for x in documents]+['NGC0001']
+    found = list(backend.find('test', IDs=IDs))
+    assert [x['ID'] for x in found] == [x['ID'] for x in documents]
+
+    updates = [(x['_id'], {'z.MASTER': 0.01}) for x in found]
+    assert backend.bulk_set('test', updates, batch_size=len(updates)) == len(updates)
+    assert all(x['z']['MASTER'] == 0.01 for x in backend.find('test', fields=['z.MASTER']))
+# ---------------
+
+
+# --- Document cache ---
+def test_document_cache_drops_entries_of_other_builds(tmp_path, monkeypatch):
+    backend = galaxies_db.SQLiteBackend(str(tmp_path/'test.sqlite'))
+    monkeypatch.setattr(galaxies_db, 'storage', backend)
+    cache = galaxies_db.DocumentCache()
+    stale_cache = galaxies_db.DocumentCache(check_interval=3600.)
+    for x in [cache, stale_cache]:
+        assert x.get('NGC0001') == (False, None)
+        x.put('NGC0001', [{'ID': 'NGC0001'}])
+        assert x.get('NGC0001') == (True, [{'ID': 'NGC0001'}])
+
+    # A build swapped in by another process
+    backend.stamp_generation(galaxies_db.collection_name)
+    assert cache.get('NGC0001') == (False, None)
+    assert stale_cache.get('NGC0001') == (True, [{'ID': 'NGC0001'}])
+# ----------------------
+
+
+# --- Commits ---
+class RecordingCollection(object):
+    """ Stand-in for a pymongo collection that records its bulk_write calls.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append((list(operations), ordered))
+
+
+def test_mongo_bulk_set_sends_unordered_batches():
+    from pymongo import UpdateOne
+
+    collection = RecordingCollection()
+    backend = galaxies_db.MongoBackend({'test': collection})
+    updates = [(k, {'z.MASTER': 0.01*k} if k != 3 else {}) for k in range(0, 7)]
+    assert backend.bulk_set('test', updates, batch_size=2) == 6
+
+    operations = [UpdateOne({'_id': k}, {'$set': {'z.MASTER': 0.01*k}})
+                  for k in range(0, 7) if k != 3]
+    assert [ordered for batch, ordered in collection.calls] == [False]*3
+    assert [batch for batch, ordered in collection.calls] == [operations[0:2], operations[2:4],
+                                                              operations[4:6]]
+
+
+def test_resolve_targets_matches_ID_ALT(sqlite_db):
+    sqlite_db.insert('test', [{'ID': 'NGC0001'}, {'ID': 'NGC0002', 'ID_ALT': 'UGC0002'},
+                              {'ID': 'UGC0003'}])
+    id_map = galaxies_db._load_id_map()
+    assert sorted(id_map) == ['NGC0001', 'NGC0002', 'UGC0003']
+    assert sorted(id_map.values()) == sorted(x['_id'] for x in sqlite_db.find('test'))
+
+    # ID_ALT is looked up only if ID is not in db, and only in db['ID']
+    df = pd.DataFrame({'ID': ['NGC0001', 'NGC0003', 'UGC0002'],
+                       'ID_ALT': ['UGC0003', 'UGC0003', 'NGC0002']})
+    assert galaxies_db._resolve_targets(df) == [id_map['NGC0001'], id_map['UGC0003'],
+                                                id_map['NGC0002']]
+
+
+def test_resolve_targets_reports_missing_sources(sqlite_db, capsys):
+    df = pd.DataFrame({'ID': ['NGC0001', 'NGC0004'], 'ID_ALT': ['', '']})
+    assert galaxies_db._resolve_targets(df, id_map={'NGC0001': 7}) == [7, None]
+    assert capsys.readouterr().out == "Error... source NGC0004 should be in db.\n"
+
+
+def set_fields(document, fields):
+    """ The $set of fields with dotted names on document, as in the
+        update_one call per record before the records were merged.
+    """
+    for field, value in fields.items():
+        keys = field.split('.')
+        subdocument = document
+        for key in keys[:-1]:
+            subdocument = subdocument.setdefault(key, {})
+        subdocument[keys[-1]] = value
+
+
+def test_commit_records_match_consecutive_updates(sqlite_db):
+    sqlite_db.insert('test', [{'ID': 'NGC000'+str(k), 'z': 0.01*k} for k in range(0, 4)])
+    documents = dict((x['_id'], x) for x in sqlite_db.find('test'))
+    _ids = sorted(documents)
+    records = [(_ids[0], {'12CO(1-0).SdV_K16': 1., '12CO(1-0).eSdV_K16': 0.1}),
+               (_ids[1], {'LIR_8_1000.L17': 11.}),
+               (_ids[0], {'12CO(1-0).SdV_K16': 2., '12CO(2-1).SdV_K16': 3.}),
+               (_ids[2], {}),
+               (_ids[1], {'z': 0.5, 'LIR_8_1000.L17': 12.}),
+               (_ids[0], {'12CO(1-0).eSdV_K16': 0.2})]
+    for doc_id, fields in records:
+        set_fields(documents[doc_id], fields)
+
+    assert galaxies_db._commit_records(records, batch_size=1) == 2
+    assert sorted(sqlite_db.find('test'), key=lambda x: x['_id']) == \
+        [documents[doc_id] for doc_id in _ids]
+
+
+def test_commit_to_db_J17_sets_fluxes_of_matched_sources(sqlite_db):
+    galaxies_db.write_table(pd.DataFrame({'ID': ['NGC0001', 'NGC0002', 'NGC0003'],
+                                          'z': [0.01, 0.02, 0.03]}), 'master_list.parquet')
+    galaxies_db.write_table(pd.DataFrame({'ID': ['NGC0001', 'UGC0002', 'NGC0004', 'NGC0003'],
+                                          'ID_ALT': ['', 'NGC0002', '', ''],
+                                          'SdV_CO10': [1., 2., 4., galaxies_db.ValUnDef],
+                                          'eSdV_CO10': [0.1, 0.2, 0.4, galaxies_db.ValUnDef]}),
+                            'Jiao-et-al-2017.parquet')
+    galaxies_db.commit_to_db_master()
+    galaxies_db.commit_to_db_J17()
+
+    documents = [dict((key, value) for key, value in x.items() if key != '_id')
+                 for x in sqlite_db.find('test')]
+    assert documents == [{'ID': 'NGC0001', 'z': 0.01,
+                          '12CO(1-0)': {'SdV_J17': 1., 'eSdV_J17': 0.1}},
+                         {'ID': 'NGC0002', 'z': 0.02,
+                          '12CO(1-0)': {'SdV_J17': 2., 'eSdV_J17': 0.2}},
+                         {'ID': 'NGC0003', 'z': 0.03}]
+# ---------------
+
+
+# --- Imports ---
+def test_import_defers_heavy_modules(tmp_path):
+    import subprocess
+
+    script = """
+import sys
+import galaxies_db
+
+heavy = ['numpy', 'pandas', 'pyarrow', 'pymongo', 'astropy', 'astroquery']
+assert [x for x in heavy if x in sys.modules] == [], 'import'
+
+galaxies_db.storage = galaxies_db.SQLiteBackend(sys.argv[1])
+galaxies_db.storage.insert(galaxies_db.collection_name, [{'ID': 'NGC0001'}])
+assert [x['ID'] for x in galaxies_db.extract_source_from_db('NGC0001')] == ['NGC0001']
+assert [x for x in heavy if x in sys.modules] == [], 'lookup'
+
+galaxies_db.np.zeros(1)
+assert 'numpy' in sys.modules and galaxies_db.np is sys.modules['numpy']
+"""
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.check_call([sys.executable, '-c', script, str(tmp_path/'test.sqlite')],
+                          env=environment)
+# -------------
+
+
+# --- Build ---
+def test_build_reruns_only_stale_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(galaxies_db, 'data_path', str(tmp_path)+'/')
+    runs = []
+
+    def stage(name, source, target):
+        def function():
+            runs.append(name)
+            with open(str(tmp_path/source)) as f:
+                text = f.read()
+            with open(str(tmp_path/target), 'w') as f:
+                f.write(text.upper())
+        return function
+
+    functions = {'S1': stage('S1', 'raw1.txt', 's1.txt'),
+                 'S2': stage('S2', 'raw2.txt', 's2.txt')}
+    stages = [('S1', functions['S1'], ['raw1.txt'], ['s1.txt'], True),
+              ('S2', functions['S2'], ['raw2.txt'], ['s2.txt'], True),
+              ('merge', stage('merge', 's1.txt', 'merged.txt'), ['s1.txt', 's2.txt'],
+               ['merged.txt'], False)]
+
+    def make_pickles(labels):
+        for label in labels:
+            functions[label]()
+            yield label
+
+    monkeypatch.setattr(galaxies_db, '_build_stages', lambda: stages)
+    monkeypatch.setattr(galaxies_db, 'make_pickles', make_pickles)
+    (tmp_path/'raw1.txt').write_text('a')
+    (tmp_path/'raw2.txt').write_text('b')
+
+    galaxies_db.build()
+    assert sorted(runs) == ['S1', 'S2', 'merge']
+
+    # Nothing changed
+    runs[:] = []
+    galaxies_db.build()
+    assert runs == []
+
+    # A changed input makes its stage and the dependent stage stale
+    (tmp_path/'raw2.txt').write_text('c')
+    galaxies_db.build()
+    assert runs == ['S2', 'merge']
+
+    # A missing output
+    runs[:] = []
+    os.remove(str(tmp_path/'merged.txt'))
+    galaxies_db.build()
+    assert runs == ['merge']
+
+    # A new exclusion catalogue
+    runs[:] = []
+    monkeypatch.setattr(galaxies_db, 'extended_sources_version',
+                        galaxies_db.extended_sources_version+1)
+    galaxies_db.build()
+    assert sorted(runs) == ['S1', 'S2', 'merge']
+
+    runs[:] = []
+    galaxies_db.build(force=True)
+    assert sorted(runs) == ['S1', 'S2', 'merge']
+
+def record_pickle_settings(label):
+    """ Returns a stand-in for make_pickle_<label>, which writes the settings
+        of its worker process to data_path.
+    """
+    def function():
+        with open(galaxies_db.data_path+label+'.json', 'w') as f:
+            json.dump({'ned_rate': galaxies_db.ned_rate,
+                       'ned_offline': galaxies_db.ned_offline,
+                       'show_progress': galaxies_db.show_progress}, f)
+    return function
+
+
+def test_make_pickles_shares_ned_rate(tmp_path, monkeypatch):
+    monkeypatch.setattr(galaxies_db, 'data_path', str(tmp_path)+'/')
+    monkeypatch.setattr(galaxies_db, 'ned_rate', 6.)
+    monkeypatch.setattr(galaxies_db, 'ned_offline', True)
+    labels = ['A09', 'G14', 'L17']
+    # The workers are forked, so they run the patched stages
+    for label in labels:
+        monkeypatch.setattr(galaxies_db, 'make_pickle_'+label, record_pickle_settings(label))
+
+    assert sorted(galaxies_db.make_pickles(labels, max_workers=3)) == labels
+    for label in labels:
+        with open(str(tmp_path/(label+'.json'))) as f:
+            # Two of the stages query NED
+            assert json.load(f) == {'ned_rate': 3., 'ned_offline': True,
+                                    'show_progress': False}
+    assert sorted(os.listdir(str(tmp_path))) == [label+'.json' for label in labels]
+
+    # Only the labels given are run
+    assert list(galaxies_db.make_pickles(['G14'], max_workers=3)) == ['G14']
+    with open(str(tmp_path/'G14.json')) as f:
+        assert json.load(f)['ned_rate'] == 6.
+# -------------
+
+
+# --- Sources ---
+@pytest.fixture
+def source_db(sqlite_db, monkeypatch):
+    """ sqlite_db holding three sources in the collection read by
+        get_sources, with an empty document cache.
+    """
+    monkeypatch.setattr(galaxies_db, 'collection_name', 'test')
+    monkeypatch.setattr(galaxies_db, 'document_cache', None)
+    sqlite_db.insert('test', [{'ID': 'NGC0003', 'ID_ALT': 'NGC0001', 'z': 0.03},
+                              {'ID': 'NGC0002', 'ID_ALT': 'UGC0002', 'z': 0.02,
+                               '12CO(1-0)': {'SdV': 2., 'eSdV': 0.2}},
+                              {'ID': 'NGC0001', 'z': 0.01}])
+
+    return sqlite_db
+
+
+def test_extract_source_from_db_prefers_ID(source_db):
+    def IDs(documents):
+        return [x['ID'] for x in documents]
+
+    assert IDs(galaxies_db.extract_source_from_db('NGC0001')) == ['NGC0001']
+    assert IDs(galaxies_db.extract_source_from_db('UGC0002')) == ['NGC0002']
+    assert galaxies_db.extract_source_from_db('NGC0004') == []
+
+    # Served from the cache until the next build
+    source_db.insert('test', [{'ID': 'NGC0004'}])
+    assert galaxies_db.extract_source_from_db('NGC0004') == []
+    assert IDs(galaxies_db.extract_source_from_db('NGC0004', cache=False)) == ['NGC0004']
+
+
+def test_get_sources_in_order_of_IDs(source_db, capsys):
+    df = galaxies_db.get_sources(['UGC0002', 'NGC0004', 'NGC0003', 'UGC0002', 'NGC0001'])
+
+    assert list(df.index) == ['UGC0002', 'NGC0003', 'NGC0001']
+    assert list(df['ID']) == ['NGC0002', 'NGC0003', 'NGC0001']
+    assert df.loc['UGC0002', '12CO(1-0).SdV'] == 2.
+    assert df.attrs['missing'] == ['NGC0004']
+    assert "1 sources not in db: NGC0004" in capsys.readouterr().out
+
+
+def test_get_sources_projects_fields(source_db):
+    df = galaxies_db.get_sources(['NGC0002', 'NGC0003'], fields=['12CO(1-0).SdV'])
+    assert sorted(df.columns) == ['12CO(1-0).SdV', 'ID', 'ID_ALT']
+    assert df.loc['NGC0002', '12CO(1-0).SdV'] == 2.
+    assert numpy.isnan(df.loc['NGC0003', '12CO(1-0).SdV'])
+
+    sources = list(galaxies_db.get_sources(['UGC0002', 'NGC0001'], fields=['z'], as_frame=False))
+    assert sources == [('NGC0001', {'ID': 'NGC0001', 'z': 0.01}),
+                       ('UGC0002', {'ID': 'NGC0002', 'ID_ALT': 'UGC0002', 'z': 0.02})]
+
+    # NGC0001 is the ID_ALT of NGC0003, which comes first in db
+    sources = list(galaxies_db.get_sources(['NGC0001', 'NGC0003'], fields=[], as_frame=False))
+    assert sources == [('NGC0003', {'ID': 'NGC0003', 'ID_ALT': 'NGC0001'}),
+                       ('NGC0001', {'ID': 'NGC0001'})]
+
+
+def test_export_table_flattens_fields(source_db):
+    source_db.bulk_set('test', [(x['_id'], {'12CO(1-0).SdV_K16': 3., 'LIR_8_1000.MASTER': 1.E11})
+                                for x in source_db.find('test') if x['ID'] == 'NGC0001'])
+
+    df = galaxies_db.export_table(transitions=['12CO(1-0)'], surveys=['K16'])
+    assert list(df.columns) == ['ID', 'ID_ALT', 'z', 'LIR_8_1000_MASTER', '12CO(1-0)_SdV',
+                                '12CO(1-0)_eSdV', '12CO(1-0)_SdV_K16', '12CO(1-0)_eSdV_K16',
+                                '12CO(1-0)_SdV_3sigmaUL_K16']
+    df = df.set_index('ID').loc[['NGC0001', 'NGC0002', 'NGC0003']]
+    assert list(df.ID_ALT) == [None, 'UGC0002', 'NGC0001']
+    assert list(df.z) == [0.01, 0.02, 0.03]
+    assert list(df['12CO(1-0)_SdV'].fillna(-1.)) == [-1., 2., -1.]
+    assert list(df['12CO(1-0)_SdV_K16'].fillna(-1.)) == [3., -1., -1.]
+    assert list(df.LIR_8_1000_MASTER.fillna(-1.)) == [1.E11, -1., -1.]
+    assert df['12CO(1-0)_SdV_3sigmaUL_K16'].isna().all()
+
+    table = galaxies_db.export_table(transitions=[], fields=['ID', 'z', '12CO(1-0).eSdV'],
+                                     fill_value=galaxies_db.ValUnDef, as_arrow=True)
+    assert table.column_names == ['ID', 'z', '12CO(1-0)_eSdV']
+    assert str(table.schema.field('12CO(1-0)_eSdV').type) == 'double'
+    assert sorted(zip(table.column('ID').to_pylist(), table.column('12CO(1-0)_eSdV').to_pylist())) == \
+        [('NGC0001', galaxies_db.ValUnDef), ('NGC0002', 0.2), ('NGC0003', galaxies_db.ValUnDef)]
+# ---------------